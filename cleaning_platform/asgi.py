@@ -0,0 +1,10 @@
+"""ASGI entry point.
+
+Run under gunicorn with uvicorn workers, alongside or instead of the WSGI app:
+    gunicorn cleaning_platform.asgi -k uvicorn_worker.UvicornWorker
+"""
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cleaning_platform.settings')
+application = get_asgi_application()
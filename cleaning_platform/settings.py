@@ -34,9 +34,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "ops.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
-    "django.contrib.sessions.middleware.SessionMiddleware",
+    "django.middleware.http.ConditionalGetMiddleware",
+    "ops.metrics.TimedSessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -50,8 +52,14 @@ TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": [BASE_DIR / "ops" / "templates"],
-        "APP_DIRS": True,
         "OPTIONS": {
+            # Parse each template once per process
+            "loaders": [
+                ("django.template.loaders.cached.Loader", [
+                    "django.template.loaders.filesystem.Loader",
+                    "django.template.loaders.app_directories.Loader",
+                ]),
+            ],
             "context_processors": [
                 "django.template.context_processors.debug",
                 "django.template.context_processors.request",
@@ -66,10 +74,121 @@ WSGI_APPLICATION = "cleaning_platform.wsgi.application"
 
 # Database (uses Heroku DATABASE_URL if present; else local sqlite)
 DATABASES = {
-    "default": dj_database_url.config(
-        conn_max_age=600, ssl_require=True, default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}"
-    )
+    "default": dj_database_url.config(default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}")
 }
+_db = DATABASES["default"]
+if _db["ENGINE"] == "django.db.backends.postgresql":
+    _db.setdefault("OPTIONS", {})
+    if os.environ.get("DB_SSL_REQUIRE", "True").lower() == "true":
+        _db["OPTIONS"]["sslmode"] = "require"
+    # Verify a reused connection before the request uses it
+    _db["CONN_HEALTH_CHECKS"] = True
+    if os.environ.get("DB_POOL", "False").lower() == "true":
+        # psycopg 3 pool per worker process; connections go back to it after each
+        # request, so persistent connections are off
+        _db["CONN_MAX_AGE"] = 0
+        _db["OPTIONS"]["pool"] = {
+            "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", "2")),
+            "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", "10")),
+            "timeout": float(os.environ.get("DB_POOL_TIMEOUT", "10")),
+        }
+    else:
+        _db["CONN_MAX_AGE"] = int(os.environ.get("DB_CONN_MAX_AGE", "600"))
+elif _db["ENGINE"] == "django.db.backends.sqlite3":
+    _db["CONN_MAX_AGE"] = int(os.environ.get("DB_CONN_MAX_AGE", "600"))
+    if os.environ.get("SQLITE_PROFILE", "tuned") == "tuned":
+        # Small/local deployments: readers don't block the writer (WAL), fsync
+        # only at checkpoints, reads via mmap, and writers wait for the lock
+        # (busy_timeout) instead of failing with "database is locked"
+        _db["OPTIONS"] = {
+            "init_command": (
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                f"PRAGMA mmap_size={int(os.environ.get('SQLITE_MMAP_SIZE', str(128 << 20)))};"
+                f"PRAGMA busy_timeout={int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))};"
+            ),
+            # Take the write lock at BEGIN, so a reader can't deadlock into
+            # "database is locked" when it later writes
+            "transaction_mode": "IMMEDIATE",
+        }
+
+# Cache (shared Redis if REDIS_URL is set; else per-process memory)
+_redis_url = os.environ.get("REDIS_URL")
+if _redis_url:
+    CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": _redis_url}
+    }
+else:
+    CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+
+# Pricing snapshot / add-on catalog: seconds a worker may keep its copy before
+# re-reading it. Only matters without a shared cache, where other workers'
+# bumps aren't seen.
+PRICING_SNAPSHOT_MAX_AGE = int(os.environ.get("PRICING_SNAPSHOT_MAX_AGE", "300"))
+
+# Pricing arithmetic: "decimal" (reference) or "int" (ops.simulator's scaled integers, same results)
+PRICING_ENGINE = os.environ.get("PRICING_ENGINE", "decimal")
+
+# Quote memo: per-worker LRU size, plus an optional CACHES alias as a shared tier
+QUOTE_CACHE_SIZE = int(os.environ.get("QUOTE_CACHE_SIZE", "4096"))
+QUOTE_CACHE_ALIAS = os.environ.get("QUOTE_CACHE_ALIAS") or None
+QUOTE_CACHE_TIMEOUT = int(os.environ.get("QUOTE_CACHE_TIMEOUT", "3600"))
+
+# /api/estimates/bulk/: callers send this bearer token (or are logged-in staff,
+# with CSRF); largest JSON array per request; estimates per caller per hour; and
+# whether bulk-imported estimates also email the customer (office copies always go).
+ESTIMATE_BULK_TOKEN = os.environ.get("ESTIMATE_BULK_TOKEN", "")
+ESTIMATE_BULK_MAX = int(os.environ.get("ESTIMATE_BULK_MAX", "500"))
+ESTIMATE_BULK_HOURLY_LIMIT = int(os.environ.get("ESTIMATE_BULK_HOURLY_LIMIT", "2000"))
+ESTIMATE_BULK_CUSTOMER_EMAILS = os.environ.get("ESTIMATE_BULK_CUSTOMER_EMAILS", "False").lower() == "true"
+
+# Identical submissions (same inputs and contact) this close together are one estimate
+DUPLICATE_WINDOW_SECONDS = int(os.environ.get("DUPLICATE_WINDOW_SECONDS", "600"))
+
+# Deferred writes: /estimate/ POSTs are journaled and saved by a per-process
+# background writer (ops.writer) in batches, instead of inside the request.
+# The journal holds submissions not yet in the database, so ESTIMATE_JOURNAL_DIR
+# must be durable local storage that outlives the process. There is no default,
+# and on a Heroku dyno (DYNO set; its filesystem is discarded on every restart)
+# there is none to be had: in both cases /estimate/ saves inside the request.
+ESTIMATE_DEFERRED_WRITES = os.environ.get("ESTIMATE_DEFERRED_WRITES", "False").lower() == "true"
+ESTIMATE_WRITER_BATCH_MS = int(os.environ.get("ESTIMATE_WRITER_BATCH_MS", "200"))
+ESTIMATE_WRITER_BATCH_SIZE = int(os.environ.get("ESTIMATE_WRITER_BATCH_SIZE", "100"))
+ESTIMATE_JOURNAL_DIR = os.environ.get("ESTIMATE_JOURNAL_DIR", "")
+ESTIMATE_JOURNAL_FSYNC = os.environ.get("ESTIMATE_JOURNAL_FSYNC", "True").lower() == "true"
+
+# Crew scheduling (ops.scheduling): booking granularity and how far ahead to book
+SCHEDULE_SLOT_MINUTES = int(os.environ.get("SCHEDULE_SLOT_MINUTES", "15"))
+SCHEDULE_HORIZON_DAYS = int(os.environ.get("SCHEDULE_HORIZON_DAYS", "14"))
+# Furthest a recurring visit may be rescheduled from its rule date (ops.recurrence)
+RECURRENCE_MAX_SHIFT_DAYS = int(os.environ.get("RECURRENCE_MAX_SHIFT_DAYS", "31"))
+# Average driving speed used to turn route miles into drive time (ops.routing)
+ROUTE_AVG_MPH = float(os.environ.get("ROUTE_AVG_MPH", "30"))
+# The arrival window customers are given: stops booked within this many minutes
+# of each other may be reordered for distance; further apart, routes keep the
+# booked order (ops.routing)
+ROUTE_WINDOW_MINUTES = int(os.environ.get("ROUTE_WINDOW_MINUTES", "60"))
+
+# Cold storage (ops.archive): estimates older than this move to compressed ArchiveChunk rows
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "365"))
+
+# Fold new estimates into EstimateDailyRollup as they are submitted; when off,
+# rely on "manage.py refresh_rollups" on a schedule instead.
+ROLLUP_ON_SAVE = os.environ.get("ROLLUP_ON_SAVE", "True").lower() == "true"
+
+# Metrics: log requests slower than this (0 = off); /metrics requires this bearer
+# token, and without one it is only served with DEBUG on (404 otherwise).
+SLOW_REQUEST_MS = int(os.environ.get("SLOW_REQUEST_MS", "1000"))
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Seconds the signed estimate -> thanks page token stays valid
+ESTIMATE_TOKEN_MAX_AGE = int(os.environ.get("ESTIMATE_TOKEN_MAX_AGE", "3600"))
+
+# Page caching: full home page, and the pre-rendered (unbound) estimate form
+HOME_CACHE_SECONDS = int(os.environ.get("HOME_CACHE_SECONDS", "600"))
+ESTIMATE_FORM_CACHE_SECONDS = int(os.environ.get("ESTIMATE_FORM_CACHE_SECONDS", "3600"))
 
 # Static files (WhiteNoise)
 STATIC_URL = "/static/"
@@ -85,6 +204,15 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Email (console for now)
 EMAIL_BACKEND = os.environ.get("EMAIL_BACKEND", "django.core.mail.backends.console.EmailBackend")
 DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_FROM_EMAIL", "info@cleaningandmorecullman.com")
+# Estimate emails (ops.outbox): queued in the estimate's transaction, sent by
+# "manage.py send_notifications" (the mailer process) in batches with backoff.
+ESTIMATE_NOTIFICATIONS = os.environ.get("ESTIMATE_NOTIFICATIONS", "True").lower() == "true"
+ESTIMATE_OFFICE_EMAIL = os.environ.get("ESTIMATE_OFFICE_EMAIL", DEFAULT_FROM_EMAIL)
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_SECONDS = int(os.environ.get("OUTBOX_BACKOFF_SECONDS", "30"))
+OUTBOX_BACKOFF_MAX_SECONDS = int(os.environ.get("OUTBOX_BACKOFF_MAX_SECONDS", "3600"))
+OUTBOX_LEASE_SECONDS = int(os.environ.get("OUTBOX_LEASE_SECONDS", "300"))
 
 # Timezone
 TIME_ZONE = "America/Chicago"
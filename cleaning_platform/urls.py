@@ -1,10 +1,26 @@
+import logging
+
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
-from ops.views import home, estimate, estimate_thanks
+from ops.views import home, estimate, estimate_async, estimate_thanks, quote_api, quote_cache_stats, estimate_bulk, metrics, visits
+from ops.writer import journal_problem
+
+# Deferred writes only where the journal can be kept; otherwise save in the request
+deferred = settings.ESTIMATE_DEFERRED_WRITES and journal_problem() is None
+if settings.ESTIMATE_DEFERRED_WRITES and not deferred:
+    logging.getLogger("ops.writer").warning(
+        "ESTIMATE_DEFERRED_WRITES is on but ignored: %s. /estimate/ saves in the request.", journal_problem()
+    )
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("", home, name="home"),
-    path("estimate/", estimate, name="estimate"),
+    path("estimate/", estimate_async if deferred else estimate, name="estimate"),
     path("estimate/thanks/", estimate_thanks, name="estimate_thanks"),
+    path("api/quote/", quote_api, name="quote_api"),
+    path("api/quote/stats/", quote_cache_stats, name="quote_cache_stats"),
+    path("api/estimates/bulk/", estimate_bulk, name="estimate_bulk"),
+    path("api/visits/", visits, name="visits"),
+    path("metrics", metrics, name="metrics"),
 ]
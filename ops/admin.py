@@ -1,20 +1,394 @@
-from django.contrib import admin
-from .models import PricingSettings, AddOn, Estimate
+import re
+from datetime import timedelta
+from decimal import Decimal
+from django import forms
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.db.models import Q, Sum
+from django.utils.functional import cached_property
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from . import archive, rollup
+from .catalog import get_catalog
+from .export import FORMATS
+from .models import (
+    PricingSettings, AddOn, Estimate, EstimateDailyRollup, Crew, Job, ServicePlan, PlanException, Notification,
+)
+from .recurrence import start_plans
+from .routing import plan_day
+from .scheduling import horizon_start, schedule
+from .simulator import candidate_from, simulate
+
+# A complete address: searched by equality, the cheapest probe of the email index
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+def _dollars(cents, sign=False) -> str:
+    return f"{cents / 100:{'+' if sign else ''},.2f}"
+
+class RouteForm(forms.Form):
+    day = forms.DateField(widget=forms.DateInput(attrs={"type": "date"}))
+    regroup = forms.BooleanField(required=False, help_text="Ignore crew bookings; batch all stops by proximity.")
+    groups = forms.IntegerField(required=False, min_value=1, help_text="Batches when regrouping; blank = crews working.")
+
+class ArchiveLookupForm(forms.Form):
+    id = forms.IntegerField(required=False, min_value=1, label="Estimate id")
+    day = forms.DateField(required=False, widget=forms.DateInput(attrs={"type": "date"}), label="Created on")
+
+class SimulateForm(forms.ModelForm):
+    class Meta:
+        model = PricingSettings
+        exclude = ("service_radius_miles", "service_zip_center")
 
 @admin.register(PricingSettings)
 class PricingSettingsAdmin(admin.ModelAdmin):
     list_display = ("res_base", "one_time_res", "comm_base",
                     "weekly_discount", "biweekly_discount", "monthly_discount",
                     "service_radius_miles", "service_zip_center")
+    change_list_template = "admin/ops/pricingsettings/change_list.html"
+
+    def get_urls(self):
+        return [
+            path("simulate/", self.admin_site.admin_view(self.simulate_view), name="ops_pricingsettings_simulate"),
+        ] + super().get_urls()
+
+    def simulate_view(self, request):
+        # What-if: reprice the stored history under unsaved knob values
+        current = PricingSettings.objects.first() or PricingSettings()
+        form = SimulateForm(request.POST or None, instance=candidate_from({}, base=current))
+        rows = None
+        if request.method == "POST" and form.is_valid():
+            result = simulate([form.save(commit=False)], baseline=current)
+            base, cand = result["baseline"], result["candidates"][0]
+            rows = [
+                ("Estimates", base["count"], cand["count"], ""),
+                ("Total", _dollars(base["total_cents"]), _dollars(cand["total_cents"]), _dollars(cand["delta_total_cents"], sign=True)),
+                ("Mean", _dollars(base["mean_cents"]), _dollars(cand["mean_cents"]), _dollars(cand["delta_mean_cents"], sign=True)),
+            ] + [
+                (label, _dollars(base["by_service_cents"][st]), _dollars(cand["by_service_cents"][st]),
+                 _dollars(cand["delta_by_service_cents"][st], sign=True))
+                for st, label in Estimate.SERVICE_CHOICES if st in base["by_service_cents"]
+            ]
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Simulate pricing change",
+            "form": form,
+            "rows": rows,
+        }
+        return TemplateResponse(request, "admin/ops/pricingsettings/simulate.html", context)
 
 @admin.register(AddOn)
 class AddOnAdmin(admin.ModelAdmin):
     list_display = ("name", "price_flat", "key")
     search_fields = ("name", "key")
 
+class EstimatedCountPaginator(Paginator):
+    """Uses the planner's row estimate for unfiltered changelists on big PostgreSQL tables."""
+
+    exact_below = 100000
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        if connection.vendor == "postgresql" and not qs.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [qs.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] >= self.exact_below:
+                return row[0]
+        return super().count
+
+def _export_response(queryset, fmt):
+    stream, content_type, ext = FORMATS[fmt]
+    response = StreamingHttpResponse(stream(queryset.order_by("id")), content_type=content_type)
+    stamp = timezone.now().strftime("%Y%m%d-%H%M%S")
+    response["Content-Disposition"] = f'attachment; filename="estimates-{stamp}.{ext}"'
+    return response
+
 @admin.register(Estimate)
 class EstimateAdmin(admin.ModelAdmin):
     list_display = ("name", "service_type", "frequency", "hours", "estimated_price", "created_at")
     list_filter = ("service_type", "frequency", "created_at")
-    search_fields = ("name", "email", "phone", "zip_code")
+    date_hierarchy = "created_at"
+    search_fields = ("name",)
+    search_help_text = (
+        "Name contains or email starts with; a full email matches exactly; "
+        "digits match the start of phone or ZIP."
+    )
     filter_horizontal = ("addons",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ("export_csv", "export_ndjson", "accept", "schedule_selected", "start_service_plans")
+    change_list_template = "admin/ops/estimate/change_list.html"
+
+    def get_search_results(self, request, queryset, search_term):
+        # Route email/phone/ZIP searches to the indexed normalized columns
+        term = search_term.strip()
+        if EMAIL_RE.match(term):
+            return queryset.filter(email_normalized=term.lower()), False
+        digits = re.sub(r"\D", "", term)
+        if digits and not re.search(r"[^\d\s()+.-]", term):
+            return queryset.filter(Q(phone_digits__startswith=digits) | Q(zip_code__startswith=digits)), False
+        if "@" in term:
+            return queryset.filter(email_normalized__startswith=term.lower()), False
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if term and " " not in term:
+            # A bare word may also be the start of an email ("jane", "jane.doe")
+            results |= queryset.filter(email_normalized__startswith=term.lower())
+        return results, may_have_duplicates
+
+    def get_urls(self):
+        return [
+            path("export/<str:fmt>/", self.admin_site.admin_view(self.export_view), name="ops_estimate_export"),
+            path("archived/", self.admin_site.admin_view(self.archived_view), name="ops_estimate_archived"),
+        ] + super().get_urls()
+
+    def change_view(self, request, object_id, form_url="", extra_context=None):
+        # Links to an estimate that has since been archived open its read-only copy
+        if object_id.isdigit() and not Estimate.objects.filter(pk=object_id).exists() and archive.find(int(object_id)):
+            return redirect(f"{reverse('admin:ops_estimate_archived')}?id={object_id}")
+        return super().change_view(request, object_id, form_url, extra_context)
+
+    # Keep EstimateDailyRollup in step with edits and deletes made here
+    def save_model(self, request, obj, form, change):
+        if change:
+            rollup.retract([obj.pk])
+            obj.rolled_up = False
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        # Add-ons are saved here, so count the estimate once they are in place
+        super().save_related(request, form, formsets, change)
+        if getattr(settings, "ROLLUP_ON_SAVE", True):
+            rollup.record([form.instance.pk])
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            rollup.forget([obj.pk])
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            rollup.forget(list(queryset.values_list("pk", flat=True)))
+            super().delete_queryset(request, queryset)
+
+    def archived_view(self, request):
+        # Read-through into the cold archive (ops.archive): one estimate by id, or a day's list
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        form = ArchiveLookupForm(request.GET or None)
+        fields = record = day_records = None
+        if form.is_valid() and form.cleaned_data["id"]:
+            est, archived = archive.lookup(form.cleaned_data["id"])
+            if est is not None and not archived:
+                return redirect("admin:ops_estimate_change", est.pk)
+            if est is not None:
+                names = {e.id: e.name for e in get_catalog().entries}
+                record = est
+                fields = [
+                    (f.verbose_name, getattr(est, f.attname))
+                    for f in Estimate._meta.concrete_fields
+                ] + [("add-ons", ", ".join(names.get(a, f"#{a}") for a in est.archived_addons) or "–")]
+        elif form.is_valid() and form.cleaned_data["day"]:
+            day_records = [archive.to_estimate(r) for r in archive.on_day(form.cleaned_data["day"])]
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Archived estimates",
+            "form": form,
+            "record": record,
+            "fields": fields,
+            "day_records": day_records,
+            "searched": form.is_bound and form.is_valid(),
+        }
+        return TemplateResponse(request, "admin/ops/estimate/archived.html", context)
+
+    def export_view(self, request, fmt):
+        # Same filters and search as the changelist the link was clicked on
+        if fmt not in FORMATS:
+            raise Http404(f"Unknown export format {fmt!r}")
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        cl = self.get_changelist_instance(request)
+        return _export_response(cl.get_queryset(request), fmt)
+
+    @admin.action(description="Export selected estimates as CSV")
+    def export_csv(self, request, queryset):
+        return _export_response(queryset, "csv")
+
+    @admin.action(description="Export selected estimates as NDJSON")
+    def export_ndjson(self, request, queryset):
+        return _export_response(queryset, "ndjson")
+
+    @admin.action(description="Mark selected estimates accepted")
+    def accept(self, request, queryset):
+        n = queryset.filter(accepted_at__isnull=True).update(accepted_at=timezone.now())
+        self.message_user(request, f"{n} estimates marked accepted.")
+
+    @admin.action(description="Schedule selected accepted estimates")
+    def schedule_selected(self, request, queryset):
+        bookings, unplaced, too_long = schedule(
+            horizon_start(), getattr(settings, "SCHEDULE_HORIZON_DAYS", 14),
+            estimate_ids=queryset.values_list("pk", flat=True),
+        )
+        self.message_user(request, f"{len(bookings)} jobs booked, {len(unplaced)} did not fit in the horizon.")
+        if too_long:
+            self.message_user(
+                request,
+                "Longer than any crew's working day; book these by hand: "
+                + ", ".join(f"#{e.pk} {e.name} ({e.hours} h)" for e in too_long),
+                level=messages.WARNING,
+            )
+
+    @admin.action(description="Start service plans for selected recurring estimates")
+    def start_service_plans(self, request, queryset):
+        plans = start_plans(queryset.filter(accepted_at__isnull=False))
+        self.message_user(request, f"{len(plans)} service plans started.")
+
+
+class RollupAddOnFilter(admin.SimpleListFilter):
+    # Default view is the "all estimates" rows; picking an add-on switches to its rows
+    title = "add-on"
+    parameter_name = "addon"
+
+    def lookups(self, request, model_admin):
+        return [(str(a.pk), a.name) for a in AddOn.objects.order_by("name")]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(addon_id=self.value())
+        return queryset.filter(addon__isnull=True)
+
+    def choices(self, changelist):
+        for choice in super().choices(changelist):
+            if choice["display"] == "All":
+                choice["display"] = "All estimates"
+            yield choice
+
+@admin.register(EstimateDailyRollup)
+class EstimateDailyRollupAdmin(admin.ModelAdmin):
+    """Analytics dashboard; reads only the rollup table, never Estimate."""
+    list_display = ("day", "service_type", "frequency", "addon", "count", "avg_hours", "value_sum")
+    list_filter = (RollupAddOnFilter, "service_type", "frequency")
+    date_hierarchy = "day"
+    ordering = ("-day", "service_type", "frequency")
+    list_select_related = ("addon",)
+    change_list_template = "admin/ops/estimatedailyrollup/change_list.html"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        cl = getattr(response, "context_data", {}).get("cl")
+        if cl is None:
+            return response
+        qs = cl.queryset.order_by()
+        sums = ("count", "hours_sum", "value_sum")
+
+        def rows(group_by):
+            out = []
+            for r in qs.values(group_by).annotate(**{f"t_{k}": Sum(k) for k in sums}).order_by(group_by):
+                out.append(_summary_row(r[group_by], r["t_count"], r["t_hours_sum"], r["t_value_sum"]))
+            return out
+
+        total = qs.aggregate(**{f"t_{k}": Sum(k) for k in sums})
+        response.context_data["summary"] = {
+            "total": _summary_row("All", total["t_count"], total["t_hours_sum"], total["t_value_sum"]),
+            "by_service_type": rows("service_type"),
+            "by_frequency": rows("frequency"),
+        }
+        return response
+
+def _summary_row(label, count, hours, value):
+    count = count or 0
+    return {
+        "label": label,
+        "count": count,
+        "avg_hours": (hours / count).quantize(Decimal("0.01")) if count else None,
+        "value": Decimal(value or 0).quantize(Decimal("0.01")),
+    }
+
+
+@admin.register(Crew)
+class CrewAdmin(admin.ModelAdmin):
+    list_display = ("name", "active", "day_start", "day_end", "workdays")
+    list_filter = ("active",)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("start", "end", "crew", "estimate", "status")
+    list_filter = ("status", "crew")
+    date_hierarchy = "start"
+    list_select_related = ("crew", "estimate")
+    raw_id_fields = ("estimate",)
+    ordering = ("start",)
+    change_list_template = "admin/ops/job/change_list.html"
+
+    def get_urls(self):
+        return [
+            path("routes/", self.admin_site.admin_view(self.routes_view), name="ops_job_routes"),
+        ] + super().get_urls()
+
+    def routes_view(self, request):
+        # Read-only plan of the day's driving order per crew (or per proximity batch)
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        form = RouteForm(request.GET or {"day": timezone.localdate() + timedelta(days=1)})
+        routes = unrouted = None
+        if form.is_valid():
+            routes, unrouted = plan_day(
+                form.cleaned_data["day"], regroup=form.cleaned_data["regroup"], groups=form.cleaned_data["groups"],
+            )
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Daily routes",
+            "form": form,
+            "routes": routes,
+            "unrouted": unrouted,
+        }
+        return TemplateResponse(request, "admin/ops/job/routes.html", context)
+
+
+class PlanExceptionInline(admin.TabularInline):
+    model = PlanException
+    extra = 0
+
+
+@admin.register(ServicePlan)
+class ServicePlanAdmin(admin.ModelAdmin):
+    list_display = ("estimate", "frequency", "starts_on", "ends_on", "start_time", "hours", "crew", "active")
+    list_filter = ("active", "frequency", "crew")
+    list_select_related = ("estimate", "crew")
+    raw_id_fields = ("estimate",)
+    inlines = (PlanExceptionInline,)
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "kind", "estimate", "status", "attempts", "next_attempt_at", "sent_at")
+    list_filter = ("status", "kind")
+    date_hierarchy = "created_at"
+    list_select_related = ("estimate",)
+    raw_id_fields = ("estimate",)
+    readonly_fields = ("attempts", "last_error", "created_at", "sent_at")
+    actions = ("retry_now",)
+
+    @admin.action(description="Retry selected notifications now")
+    def retry_now(self, request, queryset):
+        n = queryset.exclude(status="sent").update(status="pending", attempts=0, next_attempt_at=timezone.now())
+        self.message_user(request, f"{n} notifications queued for the next send.")
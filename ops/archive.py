@@ -0,0 +1,184 @@
+"""Cold storage for old estimates: compressed NDJSON chunks in the ArchiveChunk table.
+
+archive_estimates moves estimates created before a cutoff out of ops_estimate
+(and its add-on through table) into ArchiveChunk rows, one per chunk and local
+calendar month, each holding its records as one gzip-compressed NDJSON blob
+with the id range and created_at range it covers. Finding an archived estimate
+by id or day reads those columns and decompresses only the chunks that can
+hold it. The archive lives in the database, so every web dyno reads what any
+archive run wrote, and it is as durable as the database and its backups.
+
+Each chunk is one transaction: its rows are re-checked against candidates()
+and locked (select_for_update) as they are read, so an estimate accepted,
+booked or edited meanwhile is skipped and two runs never take the same rows;
+the chunk rows are written and the estimates deleted in that transaction, so
+a crash leaves either both or neither.
+
+Only never-accepted estimates without jobs or service plans are archived.
+Archived rows stay counted in EstimateDailyRollup, and rollup.rebuild() folds
+the archive back in.
+
+import_dir() loads segments from the earlier on-disk layout
+(estimates-YYYY-MM.ndjson.gz beside estimates-YYYY-MM.index.ndjson).
+"""
+import gzip
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import rollup
+from .export import _json_default
+from .models import ArchiveChunk, Estimate, Job, ServicePlan
+
+ARCHIVE_FIELDS = tuple(f.attname for f in Estimate._meta.concrete_fields)
+
+
+def months() -> list:
+    """Archived months ("YYYY-MM"), oldest first."""
+    return list(ArchiveChunk.objects.order_by("month").values_list("month", flat=True).distinct())
+
+
+def _records(chunk: ArchiveChunk) -> list:
+    return [json.loads(line) for line in gzip.decompress(bytes(chunk.data)).splitlines()]
+
+
+def _load(chunks):
+    # Ids of the chunks worth opening first, then their blobs one at a time
+    for pk in list(chunks.values_list("pk", flat=True)):
+        yield _records(ArchiveChunk.objects.only("data").get(pk=pk))
+
+
+def to_estimate(record: dict) -> Estimate:
+    """Unsaved Estimate from an archived record; add-on ids in `archived_addons`."""
+    est = Estimate()
+    for f in Estimate._meta.concrete_fields:
+        if f.attname in record:
+            setattr(est, f.attname, f.to_python(record[f.attname]))
+    est.archived_addons = record.get("addons", [])
+    return est
+
+
+def find(pk: int):
+    """The archived record for an estimate id, or None."""
+    for records in _load(ArchiveChunk.objects.filter(min_id__lte=pk, max_id__gte=pk).order_by("-id")):
+        for record in records:
+            if record["id"] == pk:
+                return record
+    return None
+
+
+def on_day(day) -> list:
+    """Archived records created on a local date, oldest first."""
+    start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+    chunks = ArchiveChunk.objects.filter(first__lt=start + timedelta(days=1), last__gte=start).order_by("id")
+    found = [
+        r for records in _load(chunks) for r in records
+        if timezone.localdate(parse_datetime(r["created_at"])) == day
+    ]
+    return sorted(found, key=lambda r: (r["created_at"], r["id"]))
+
+
+def iter_records():
+    """Every archived record, month by month."""
+    for records in _load(ArchiveChunk.objects.order_by("month", "id")):
+        yield from records
+
+
+def lookup(pk: int):
+    """Read-through: (estimate, archived?) from the hot table, else the archive, else (None, False)."""
+    est = Estimate.objects.filter(pk=pk).first()
+    if est is not None:
+        return est, False
+    record = find(pk)
+    return (to_estimate(record), True) if record else (None, False)
+
+
+def candidates(cutoff):
+    """Estimates that may be archived: created before cutoff, never accepted, no jobs or plans."""
+    return (
+        Estimate.objects.filter(created_at__lt=cutoff, accepted_at__isnull=True)
+        .filter(~Exists(Job.objects.filter(estimate=OuterRef("pk"))))
+        .filter(~Exists(ServicePlan.objects.filter(estimate=OuterRef("pk"))))
+        .order_by("created_at", "id")
+    )
+
+
+def _chunk(month: str, records: list, data: bytes = None) -> ArchiveChunk:
+    if data is None:
+        body = "".join(json.dumps(r, default=_json_default, separators=(",", ":")) + "\n" for r in records)
+        data = gzip.compress(body.encode(), compresslevel=6)
+    created = [r["created_at"] if isinstance(r["created_at"], datetime) else parse_datetime(r["created_at"])
+               for r in records]
+    return ArchiveChunk(
+        month=month,
+        data=data,
+        count=len(records),
+        min_id=min(r["id"] for r in records),
+        max_id=max(r["id"] for r in records),
+        first=min(created),
+        last=max(created),
+    )
+
+
+def archive_chunk(ids, cutoff) -> int:
+    """Archive those of these estimates still archivable at cutoff and delete them, in one transaction.
+
+    Returns rows moved out of the hot tables.
+    """
+    with transaction.atomic():
+        # Re-check and lock: a row accepted, booked or edited since it was picked stays put
+        ids = list(
+            candidates(cutoff).filter(id__in=list(ids)).select_for_update(of=("self",)).values_list("id", flat=True)
+        )
+        if not ids:
+            return 0
+        # Count anything not yet rolled up while it's still in the table
+        rollup.record(ids)
+        rows = list(Estimate.objects.filter(id__in=ids).order_by("created_at", "id").values(*ARCHIVE_FIELDS))
+        addons = defaultdict(list)
+        for est_id, addon_id in (
+            Estimate.addons.through.objects.filter(estimate_id__in=ids)
+            .order_by("estimate_id", "addon_id")
+            .values_list("estimate_id", "addon_id")
+        ):
+            addons[est_id].append(addon_id)
+        by_month = defaultdict(list)
+        for row in rows:
+            row["addons"] = addons.get(row["id"], [])
+            by_month[f"{timezone.localtime(row['created_at']):%Y-%m}"].append(row)
+        ArchiveChunk.objects.bulk_create([_chunk(month, records) for month, records in by_month.items()])
+        Estimate.objects.filter(id__in=ids).delete()
+    return len(rows)
+
+
+def import_dir(directory) -> int:
+    """Load the earlier on-disk segments into ArchiveChunk; returns records added.
+
+    Members are copied as they are (they're already gzip NDJSON). Only indexed
+    members count, as before; ids already in the archive are left out, so a
+    second import adds nothing.
+    """
+    added = 0
+    for idx in sorted(Path(directory).glob("estimates-*.index.ndjson")):
+        month = idx.name[len("estimates-"):-len(".index.ndjson")]
+        segment = idx.with_name(f"estimates-{month}.ndjson.gz")
+        data = idx.read_bytes()
+        entries = [json.loads(line) for line in data[: data.rfind(b"\n") + 1].splitlines() if line.strip()]
+        with open(segment, "rb") as f, transaction.atomic():
+            for entry in entries:
+                f.seek(entry["offset"])
+                member = f.read(entry["length"])
+                records = [json.loads(line) for line in gzip.decompress(member).splitlines()]
+                overlapping = ArchiveChunk.objects.filter(min_id__lte=entry["max_id"], max_id__gte=entry["min_id"])
+                have = {r["id"] for stored in _load(overlapping) for r in stored}
+                fresh = [r for r in records if r["id"] not in have]
+                if fresh:
+                    _chunk(month, fresh, member if len(fresh) == len(records) else None).save()
+                    added += len(fresh)
+    return added
@@ -0,0 +1,93 @@
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Iterable, Mapping, Tuple
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import AddOn
+from .pricing import _digest
+
+# Shared version stamp for the add-on catalog (see ops.pricing for the pattern,
+# including the content digest in each catalog's version)
+VERSION_CACHE_KEY = "ops:addons:version"
+
+
+@dataclass(frozen=True)
+class AddOnEntry:
+    id: int
+    key: str
+    name: str
+    price_flat: Decimal
+    price_cents: int
+
+
+@dataclass(frozen=True)
+class AddOnCatalog:
+    version: str
+    entries: Tuple[AddOnEntry, ...]
+    by_id: Mapping[int, AddOnEntry]
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[tuple], version: str = "") -> "AddOnCatalog":
+        entries = tuple(
+            AddOnEntry(id=pk, key=key, name=name, price_flat=d, price_cents=int(d * 100))
+            for pk, key, name, d in ((pk, key, name, Decimal(price or 0)) for pk, key, name, price in rows)
+        )
+        return cls(
+            version=version,
+            entries=entries,
+            by_id=MappingProxyType({e.id: e for e in entries}),
+        )
+
+    def choices(self):
+        return [(e.id, e.name) for e in self.entries]
+
+    def total(self, addon_ids) -> Decimal:
+        # Unknown ids count as zero, like the old SUM over a filtered queryset
+        seen = set(addon_ids or ())
+        return sum((self.by_id[i].price_flat for i in seen if i in self.by_id), Decimal("0"))
+
+    def names(self, addon_ids):
+        return [self.by_id[i].name for i in addon_ids if i in self.by_id]
+
+
+# (catalog, stamp it was loaded under, monotonic load time) for this worker process
+_local = None
+
+
+def _load(stamp: str) -> AddOnCatalog:
+    rows = list(AddOn.objects.order_by("id").values_list("id", "key", "name", "price_flat"))
+    return AddOnCatalog.from_rows(rows, version=f"{stamp}.{_digest(rows)}")
+
+
+def current_version() -> str:
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(VERSION_CACHE_KEY, uuid4().hex, None)
+        version = cache.get(VERSION_CACHE_KEY)
+    return version
+
+
+def bump_version() -> str:
+    global _local
+    version = uuid4().hex
+    cache.set(VERSION_CACHE_KEY, version, None)
+    _local = None
+    return version
+
+
+def get_catalog() -> AddOnCatalog:
+    global _local
+    stamp = current_version()
+    now = time.monotonic()
+    if _local is not None:
+        cat, loaded_stamp, loaded_at = _local
+        if loaded_stamp == stamp and now - loaded_at < getattr(settings, "PRICING_SNAPSHOT_MAX_AGE", 300):
+            return cat
+    cat = _load(stamp)
+    _local = (cat, stamp, now)
+    return cat
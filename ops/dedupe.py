@@ -0,0 +1,129 @@
+"""Duplicate-submission detection for estimates.
+
+Two guards, both backed by unique indexes on Estimate:
+- idempotency_key: a token the estimate form (or an API client) sends with a
+  submission; replays of the same key with the same content within
+  DUPLICATE_WINDOW_SECONDS get the original. An older key (a form page kept
+  open or revalidated from cache) no longer counts and is dropped.
+- fingerprint + dedupe_slot: a hash of the normalized pricing inputs and contact
+  info, plus the DUPLICATE_WINDOW_SECONDS-wide time slot it was created in.
+  Identical content within the window gets the original estimate back.
+Stored estimates with the same fingerprint are always more than a window apart,
+so each occupies its own slot and the unique index never rejects a real one.
+"""
+import hashlib
+import re
+import uuid
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Estimate
+
+KEY_RE = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+# Columns needed to answer a duplicate with the original's result
+REPLAY_FIELDS = ("id", "idempotency_key", "fingerprint", "created_at", "hours", "estimated_price", "within_radius")
+
+
+def window_seconds() -> int:
+    return max(int(getattr(settings, "DUPLICATE_WINDOW_SECONDS", 600)), 1)
+
+
+def new_key() -> str:
+    return uuid.uuid4().hex
+
+
+def clean_key(value):
+    """A usable idempotency key, or None for missing/malformed ones."""
+    value = (value or "").strip()
+    return value if KEY_RE.match(value) else None
+
+
+def fingerprint(est: Estimate, addon_ids) -> str:
+    """sha256 of what makes two submissions "the same"; call after normalize_contact()."""
+    parts = (
+        " ".join((est.name or "").split()).casefold(),
+        est.email_normalized,
+        est.phone_digits,
+        " ".join((est.address or "").split()).casefold(),
+        (est.zip_code or "").strip()[:5],
+        est.service_type,
+        est.cleanliness_level,
+        est.frequency,
+        str(est.bedrooms or 0),
+        str(est.bathrooms or 0),
+        str(est.approx_sq_ft or 0),
+        str(est.levels or 0),
+        "1" if est.furnished else "0",
+        "1" if est.pets else "0",
+        ",".join(str(i) for i in sorted(set(addon_ids or ()))),
+    )
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+
+def slot_of(when=None) -> int:
+    return int((when or timezone.now()).timestamp()) // window_seconds()
+
+
+def stamp(est: Estimate, addon_ids, key=None, when=None):
+    """Set idempotency_key, fingerprint and dedupe_slot on an unsaved estimate."""
+    est.normalize_contact()
+    est.idempotency_key = key
+    est.fingerprint = fingerprint(est, addon_ids)
+    est.dedupe_slot = slot_of(when)
+
+
+def find_originals(estimates, when=None):
+    """For each stamped, unsaved estimate: the one it duplicates, or None.
+
+    The original is either a stored estimate or an earlier entry of the same
+    list. One query over both unique indexes. A key that arrives with different
+    content (a reused form page, a client bug), or more than a window after
+    its original, isn't a replay: the key is dropped so the estimate saves as
+    a new one.
+    """
+    now = when or timezone.now()
+    since = now.timestamp() - window_seconds()
+    keys = {e.idempotency_key for e in estimates if e.idempotency_key}
+    match = Q(
+        fingerprint__in={e.fingerprint for e in estimates},
+        dedupe_slot__in={s for e in estimates for s in (e.dedupe_slot, e.dedupe_slot - 1)},
+    )
+    if keys:
+        match |= Q(idempotency_key__in=keys)
+    by_key, by_fp = {}, {}
+    stale = set()
+    for other in Estimate.objects.filter(match).only(*REPLAY_FIELDS):
+        recent = other.created_at.timestamp() >= since
+        if other.idempotency_key in keys:
+            if recent:
+                by_key[other.idempotency_key] = other
+            else:
+                stale.add(other.idempotency_key)
+        if recent:
+            by_fp[other.fingerprint] = other
+
+    originals = []
+    for est in estimates:
+        original = None
+        if est.idempotency_key:
+            other = by_key.get(est.idempotency_key)
+            if other is not None and other.fingerprint == est.fingerprint:
+                original = other
+            elif other is not None or est.idempotency_key in stale:
+                est.idempotency_key = None
+        if original is None:
+            original = by_fp.get(est.fingerprint)
+        if original is None:
+            # First of its kind in this batch; later copies point at it
+            by_fp[est.fingerprint] = est
+            if est.idempotency_key:
+                by_key[est.idempotency_key] = est
+        originals.append(original)
+    return originals
+
+
+def find_original(est: Estimate, when=None):
+    return find_originals([est], when)[0]
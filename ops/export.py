@@ -0,0 +1,81 @@
+import csv
+import json
+
+from .catalog import get_catalog
+from .models import Estimate
+
+EXPORT_FIELDS = (
+    "id", "created_at", "name", "email", "phone", "address", "zip_code",
+    "within_radius", "service_type", "cleanliness_level", "frequency",
+    "furnished", "pets", "approx_sq_ft", "bedrooms", "bathrooms", "levels",
+    "hours", "estimated_price",
+)
+COLUMNS = EXPORT_FIELDS + ("addons",)
+# Leading characters a spreadsheet reads as the start of a formula
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def iter_rows(queryset, chunk_size: int = 2000):
+    """Yield one dict per estimate; add-on names come from one query per chunk."""
+    names = {e.id: e.name for e in get_catalog().entries}
+    Through = Estimate.addons.through
+
+    def with_addons(chunk):
+        addon_map = {}
+        for est_id, addon_id in (
+            Through.objects.filter(estimate_id__in=[r[0] for r in chunk])
+            .order_by("estimate_id", "addon_id")
+            .values_list("estimate_id", "addon_id")
+        ):
+            addon_map.setdefault(est_id, []).append(names.get(addon_id, str(addon_id)))
+        for row in chunk:
+            record = dict(zip(EXPORT_FIELDS, row))
+            record["addons"] = addon_map.get(row[0], [])
+            yield record
+
+    chunk = []
+    for row in queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield from with_addons(chunk)
+            chunk = []
+    if chunk:
+        yield from with_addons(chunk)
+
+
+def _cell(value):
+    # Text from the public form must open as text, not run as a formula (CSV injection)
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+class _Echo:
+    # csv.writer target that hands each line straight back
+    def write(self, value):
+        return value
+
+
+def iter_csv(queryset, chunk_size: int = 2000):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for r in iter_rows(queryset, chunk_size):
+        r["created_at"] = r["created_at"].isoformat() if r["created_at"] else ""
+        r["addons"] = "; ".join(r["addons"])
+        yield writer.writerow([_cell(r[c]) for c in COLUMNS])
+
+
+def _json_default(value):
+    # datetimes as ISO 8601, Decimals as exact strings
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def iter_ndjson(queryset, chunk_size: int = 2000):
+    for r in iter_rows(queryset, chunk_size):
+        yield json.dumps(r, default=_json_default) + "\n"
+
+
+FORMATS = {
+    "csv": (iter_csv, "text/csv", "csv"),
+    "ndjson": (iter_ndjson, "application/x-ndjson", "ndjson"),
+}
@@ -1,4 +1,5 @@
 from django import forms
+from .catalog import get_catalog
 from .models import Estimate
 
 class EstimateForm(forms.ModelForm):
@@ -7,6 +8,14 @@ class EstimateForm(forms.ModelForm):
         label="I am within ~30 miles of 35055",
         help_text="If you're outside, please submit and our office will contact you with options."
     )
+    # Choices come from the cached add-on catalog instead of a queryset;
+    # cleaned_data["addons"] is a list of AddOn ids.
+    addons = forms.TypedMultipleChoiceField(
+        coerce=int,
+        required=False,
+        label="Addons",
+        widget=forms.CheckboxSelectMultiple,
+    )
 
     class Meta:
         model = Estimate
@@ -17,6 +26,20 @@ class EstimateForm(forms.ModelForm):
             "approx_sq_ft", "bedrooms", "bathrooms", "levels",
             "addons", "within_radius",
         ]
-        widgets = {
-            "addons": forms.CheckboxSelectMultiple,
-        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["addons"].choices = get_catalog().choices()
+
+
+class QuoteForm(EstimateForm):
+    """Pricing inputs only; used for live price previews, never saved."""
+
+    class Meta(EstimateForm.Meta):
+        fields = [
+            "zip_code",
+            "service_type", "cleanliness_level", "frequency",
+            "furnished", "pets",
+            "approx_sq_ft", "bedrooms", "bathrooms", "levels",
+            "addons",
+        ]
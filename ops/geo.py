@@ -0,0 +1,109 @@
+"""Offline ZIP centroid table and cached service-area membership.
+
+ops/data/zip_centroids.csv.gz holds one "zip,lat,lon" row per US ZIP code
+(4 decimal places), exported from the MIT-licensed ``zipcodes`` package
+(coordinates from GeoNames, CC BY 4.0). Attribution and license text are in
+ops/data/NOTICE and ops/data/LICENSE.zipcodes.txt; ship them with the data.
+"""
+import csv
+import gzip
+import threading
+from pathlib import Path
+
+import numpy as np
+
+DATA_FILE = Path(__file__).resolve().parent / "data" / "zip_centroids.csv.gz"
+EARTH_RADIUS_MILES = 3958.7613
+
+
+class ZipTable:
+    """Sorted int32 ZIPs with parallel float64 lat/lon columns."""
+
+    def __init__(self, zips, lat, lon):
+        self.zips = zips
+        self.lat = lat
+        self.lon = lon
+
+    @classmethod
+    def load(cls, path=DATA_FILE) -> "ZipTable":
+        zips, lat, lon = [], [], []
+        with gzip.open(path, "rt", newline="") as f:
+            reader = csv.reader(f)
+            next(reader)  # header
+            for z, la, lo in reader:
+                zips.append(int(z))
+                lat.append(float(la))
+                lon.append(float(lo))
+        order = np.argsort(zips, kind="stable")
+        return cls(
+            np.asarray(zips, dtype=np.int32)[order],
+            np.asarray(lat, dtype=np.float64)[order],
+            np.asarray(lon, dtype=np.float64)[order],
+        )
+
+    def index_of(self, zip_code) -> int:
+        z = normalize_zip(zip_code)
+        if z is None:
+            return -1
+        i = int(np.searchsorted(self.zips, int(z)))
+        return i if i < len(self.zips) and self.zips[i] == int(z) else -1
+
+    def within(self, center, radius_miles) -> frozenset:
+        i = self.index_of(center)
+        if i < 0:
+            return frozenset()
+        miles = _haversine(self.lat[i], self.lon[i], self.lat, self.lon)
+        return frozenset(f"{z:05d}" for z in self.zips[miles <= radius_miles])
+
+    def distances(self, indices) -> np.ndarray:
+        """Square matrix of great-circle miles between the given table rows."""
+        lat, lon = self.lat[indices], self.lon[indices]
+        return _haversine(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+
+
+def _haversine(lat0, lon0, lat1, lon1):
+    lat0, lon0, lat1, lon1 = map(np.radians, (lat0, lon0, lat1, lon1))
+    a = np.sin((lat1 - lat0) / 2) ** 2 + np.cos(lat0) * np.cos(lat1) * np.sin((lon1 - lon0) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def normalize_zip(zip_code):
+    # "35055-1234" / " 35055 " -> "35055"; anything else -> None
+    z = (zip_code or "").strip()[:5]
+    return z if len(z) == 5 and z.isdigit() else None
+
+
+_lock = threading.Lock()
+_table = None
+_area = None  # ((center, radius), frozenset of ZIPs)
+
+
+def get_table() -> ZipTable:
+    global _table
+    if _table is None:
+        with _lock:
+            if _table is None:
+                _table = ZipTable.load()
+    return _table
+
+
+def service_area(center, radius_miles) -> frozenset:
+    """ZIPs whose centroid is within radius of center; recomputed only when either changes."""
+    global _area
+    key = (normalize_zip(center), radius_miles)
+    area = _area
+    if area is None or area[0] != key:
+        area = (key, get_table().within(key[0], radius_miles))
+        _area = area
+    return area[1]
+
+
+def in_service_area(zip_code, ps):
+    """True/False from the ZIP table, or None when the ZIP (or the center) isn't known."""
+    z = normalize_zip(zip_code)
+    if z is None or get_table().index_of(z) < 0:
+        return None
+    area = service_area(ps.service_zip_center, ps.service_radius_miles)
+    if not area:
+        return None
+    return z in area
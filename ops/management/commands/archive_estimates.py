@@ -0,0 +1,55 @@
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ops import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move estimates older than the cutoff into compressed ArchiveChunk rows "
+        "(see ops.archive), deleting them from the hot tables in the same chunked transactions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-days", type=int, help="Cutoff age (default: ARCHIVE_AFTER_DAYS).")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between chunks.")
+        parser.add_argument("--dry-run", action="store_true", help="Count what would move, by month.")
+        parser.add_argument("--import-dir", help="Load segments written to disk by earlier versions, then stop.")
+
+    def handle(self, *args, **opts):
+        if opts["import_dir"]:
+            added = archive.import_dir(opts["import_dir"])
+            self.stdout.write(self.style.SUCCESS(f"Imported {added} archived estimates from {opts['import_dir']}."))
+            return
+        days = opts["older_than_days"] if opts["older_than_days"] is not None else settings.ARCHIVE_AFTER_DAYS
+        if days < 0 or opts["chunk_size"] < 1:
+            raise CommandError("--older-than-days must be >= 0 and --chunk-size positive.")
+        cutoff = timezone.now() - timedelta(days=days)
+        qs = archive.candidates(cutoff)
+
+        if opts["dry_run"]:
+            months = Counter(f"{timezone.localtime(t):%Y-%m}" for t in qs.values_list("created_at", flat=True).iterator())
+            for month, n in sorted(months.items()):
+                self.stdout.write(f"  {month}: {n}")
+            self.stdout.write(self.style.SUCCESS(f"{sum(months.values())} estimates would be archived (before {cutoff:%Y-%m-%d})."))
+            return
+
+        started = time.monotonic()
+        moved = 0
+        while True:
+            ids = list(qs.values_list("id", flat=True)[: opts["chunk_size"]])
+            if not ids:
+                break
+            moved += archive.archive_chunk(ids, cutoff)
+            self.stdout.write(f"  {moved} archived, {time.monotonic() - started:.1f}s")
+            if opts["pause"]:
+                time.sleep(opts["pause"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {moved} estimates created before {cutoff:%Y-%m-%d} in {time.monotonic() - started:.2f}s"
+        ))
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ops.geo import get_table, normalize_zip, service_area
+from ops.models import Estimate
+from ops.pricing import get_snapshot
+
+
+class Command(BaseCommand):
+    help = "Set Estimate.within_radius from zip_code using the bundled ZIP centroid table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **opts):
+        ps = get_snapshot()
+        area = service_area(ps.service_zip_center, ps.service_radius_miles)
+        if not area:
+            self.stderr.write(f"Service center {ps.service_zip_center!r} is not in the ZIP table; nothing to do.")
+            return
+        table = get_table()
+        started = time.monotonic()
+        seen = unknown = 0
+        to_true, to_false = [], []
+
+        def flush():
+            if not opts["dry_run"]:
+                with transaction.atomic():
+                    if to_true:
+                        Estimate.objects.filter(id__in=to_true).update(within_radius=True)
+                    if to_false:
+                        Estimate.objects.filter(id__in=to_false).update(within_radius=False)
+            to_true.clear()
+            to_false.clear()
+
+        changed = 0
+        qs = Estimate.objects.order_by("id").values_list("id", "zip_code", "within_radius")
+        for pk, zip_code, current in qs.iterator(chunk_size=opts["chunk_size"]):
+            seen += 1
+            z = normalize_zip(zip_code)
+            if z is None or table.index_of(z) < 0:
+                unknown += 1
+                continue
+            inside = z in area
+            if inside != current:
+                (to_true if inside else to_false).append(pk)
+                changed += 1
+                if len(to_true) + len(to_false) >= opts["chunk_size"]:
+                    flush()
+        flush()
+
+        verb = "would change" if opts["dry_run"] else "updated"
+        self.stdout.write(self.style.SUCCESS(
+            f"{seen} estimates checked, {changed} {verb}, {unknown} left as-is (unknown ZIP) "
+            f"in {time.monotonic() - started:.2f}s"
+        ))
@@ -0,0 +1,211 @@
+import itertools
+import json
+import platform
+import subprocess
+import time
+
+import django
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+
+from ops.catalog import get_catalog
+from ops.geo import get_table
+from ops.models import AddOn, Estimate, PricingSettings
+from ops.pricing import get_snapshot
+from ops.quotes import get_quote_cache
+from ops.routing import nearest_neighbour, two_opt
+from ops.simulator import quotes
+from ops.views import _calc_price, _hours_from_details, _quote
+
+SERVICE_TYPES = [k for k, _ in Estimate.SERVICE_CHOICES]
+CLEAN_LEVELS = [k for k, _ in Estimate.CLEAN_CHOICES]
+FREQUENCIES = [k for k, _ in Estimate.FREQ_CHOICES]
+
+# Ceiling on DB queries per request once caches are warm; raise deliberately.
+QUERY_BUDGETS = {
+    "http_get_estimate": 0,
+    "http_post_estimate": 15,
+    "http_get_thanks": 0,
+}
+
+
+def _hours_grid():
+    for st, cl, furn, pets, bd, ba, sq, lv in itertools.product(
+        SERVICE_TYPES, CLEAN_LEVELS, (True, False), (True, False),
+        range(0, 7), range(0, 5), range(0, 5501, 500), (1, 2, 3),
+    ):
+        yield dict(service_type=st, cleanliness_level=cl, furnished=furn, pets=pets,
+                   bedrooms=bd, bathrooms=ba, approx_sq_ft=sq, levels=lv)
+
+
+def _payloads(addon_ids):
+    # Valid EstimateForm posts cycling through the input space
+    grid = itertools.product(SERVICE_TYPES, CLEAN_LEVELS, FREQUENCIES, range(1, 6), range(1, 4))
+    for i, (st, cl, fr, bd, ba) in enumerate(itertools.cycle(list(grid))):
+        data = {
+            "name": f"Bench {i}", "email": f"bench{i}@example.com", "phone": "256-555-0100",
+            "address": "1 Main St", "zip_code": "35055",
+            "service_type": st, "cleanliness_level": cl, "frequency": fr,
+            "approx_sq_ft": 800 + (i % 9) * 350, "bedrooms": bd, "bathrooms": ba, "levels": 1 + i % 3,
+            "addons": addon_ids[: i % (len(addon_ids) + 1)],
+        }
+        if i % 2:
+            data["furnished"] = "on"
+        if i % 3 == 0:
+            data["pets"] = "on"
+        yield data
+
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Benchmark the pricing functions and the /estimate/ request path; optionally compare to a saved run."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5, help="Micro-benchmark repeats (best is kept).")
+        parser.add_argument("--requests", type=int, default=200, help="HTTP requests per end-to-end benchmark.")
+        parser.add_argument("--output", "-o", help="Write results as JSON to this file.")
+        parser.add_argument("--compare", help="Earlier JSON result to compare against.")
+        parser.add_argument("--threshold", type=float, default=0.10,
+                            help="Fail when a benchmark is slower than --compare by more than this fraction.")
+        parser.add_argument("--keep-db", action="store_true", help="Reuse the test database between runs.")
+
+    def handle(self, *args, **opts):
+        setup_test_environment()
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=opts["keep_db"])
+        try:
+            results = self._run(opts)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=opts["keep_db"])
+            teardown_test_environment()
+
+        report = {
+            "meta": {
+                "git": _git_rev(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "db": connection.vendor,
+                "when": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            },
+            "results": results,
+        }
+        for name, r in results.items():
+            q = f"  {r['queries']} queries" if "queries" in r else ""
+            self.stdout.write(f"{name:<28} {r['per_call_us']:>10.2f} us/call  ({r['calls']} calls){q}")
+        if opts["output"]:
+            with open(opts["output"], "w") as f:
+                json.dump(report, f, indent=2)
+
+        failures = []
+        for name, budget in QUERY_BUDGETS.items():
+            if name in results and results[name]["queries"] > budget:
+                failures.append(f"{name}: {results[name]['queries']} queries per request (budget {budget})")
+        if opts["compare"]:
+            failures += self._compare(opts["compare"], results, opts["threshold"])
+        if failures:
+            raise CommandError("Benchmark regressions:\n  " + "\n  ".join(failures))
+
+    def _run(self, opts):
+        PricingSettings.objects.create()
+        AddOn.objects.bulk_create([
+            AddOn(key=k, name=k.replace("_", " ").title(), price_flat=p)
+            for k, p in (("inside_fridge", 40), ("inside_oven", 45), ("windows", 60), ("baseboards", 35))
+        ])
+        addon_ids = list(AddOn.objects.values_list("id", flat=True))
+        ps = get_snapshot()
+        catalog = get_catalog()
+        results = {}
+
+        grid = list(_hours_grid())
+        results["hours_from_details"] = self._micro(
+            lambda: [_hours_from_details(ps, **kw) for kw in grid], len(grid), opts["repeat"])
+
+        price_grid = [
+            (st, fr, h, addon_ids[:n])
+            for st in SERVICE_TYPES for fr in FREQUENCIES
+            for h in (_hours_from_details(ps, **kw) for kw in grid[::97])
+            for n in range(len(addon_ids) + 1)
+        ]
+        results["calc_price"] = self._micro(
+            lambda: [_calc_price(ps, service_type=st, frequency=fr, hours=h, addon_ids=a, catalog=catalog)
+                     for st, fr, h, a in price_grid],
+            len(price_grid), opts["repeat"])
+
+        quote_grid = [dict(kw, frequency=fr, addon_ids=addon_ids[:2]) for kw in grid[::7] for fr in FREQUENCIES]
+        results["quote_engine_int"] = self._micro(
+            lambda: quotes(quote_grid, ps.int_knobs, catalog), len(quote_grid), opts["repeat"])
+
+        qc = get_quote_cache()
+        qc.clear()
+        results["quote_memo_miss"] = self._micro(
+            lambda: (qc.clear(), [_quote(ps, catalog=catalog, **kw) for kw in quote_grid]),
+            len(quote_grid), 1)
+        hit_grid = quote_grid[: max(qc.maxsize // 2, 1)]  # must fit, or every lookup misses
+        results["quote_memo_hit"] = self._micro(
+            lambda: [_quote(ps, catalog=catalog, **kw) for kw in hit_grid], len(hit_grid), opts["repeat"])
+
+        # One day's route: the 300 ZIPs nearest the depot, nearest neighbour + 2-opt
+        table = get_table()
+        depot = table.index_of(ps.service_zip_center)
+        if depot >= 0:
+            lat, lon = table.lat[depot], table.lon[depot]
+            nodes = np.argsort((table.lat - lat) ** 2 + (table.lon - lon) ** 2)[:301]
+            dist = table.distances(nodes)
+            results["route_300_stops"] = self._micro(
+                lambda: two_opt(dist, nearest_neighbour(dist, range(1, len(nodes)))), 1, opts["repeat"])
+
+        client = Client()
+        n = opts["requests"]
+        results["http_get_estimate"] = self._http(lambda: client.get("/estimate/"), n, 200)
+        payloads = _payloads(addon_ids)
+        results["http_post_estimate"] = self._http(lambda: client.post("/estimate/", next(payloads)), n, 302)
+        thanks_url = client.post("/estimate/", next(payloads))["Location"]
+        results["http_get_thanks"] = self._http(lambda: client.get(thanks_url), n, 200)
+        return results
+
+    def _micro(self, fn, calls, repeat):
+        best = None
+        for _ in range(max(repeat, 1)):
+            started = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return {"calls": calls, "per_call_us": best / calls * 1e6}
+
+    def _http(self, fn, n, expected_status):
+        fn()  # warm caches and session
+        queries = 0
+        started = time.perf_counter()
+        for _ in range(n):
+            with CaptureQueriesContext(connection) as ctx:
+                response = fn()
+            if response.status_code != expected_status:
+                raise CommandError(f"Unexpected status {response.status_code} (wanted {expected_status})")
+            queries = max(queries, len(ctx))
+        elapsed = time.perf_counter() - started
+        return {"calls": n, "per_call_us": elapsed / n * 1e6, "queries": queries}
+
+    def _compare(self, path, results, threshold):
+        with open(path) as f:
+            baseline = json.load(f)["results"]
+        failures = []
+        self.stdout.write(f"\nCompared with {path} (threshold {threshold:.0%}):")
+        for name, r in results.items():
+            if name not in baseline:
+                continue
+            ratio = r["per_call_us"] / baseline[name]["per_call_us"]
+            flag = "REGRESSION" if ratio > 1 + threshold else ""
+            self.stdout.write(f"  {name:<28} {ratio:>6.2f}x {flag}")
+            if flag:
+                failures.append(f"{name}: {ratio:.2f}x slower than {path}")
+        return failures
@@ -0,0 +1,160 @@
+import copy
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, close_old_connections, connection, connections, transaction
+
+from ops.models import AddOn, Estimate
+
+
+def _sqlite_profiles(settings_dict):
+    return {
+        # Rollback journal, fsync on every commit, lock taken lazily
+        "sqlite-plain": {"OPTIONS": {"init_command": "PRAGMA journal_mode=DELETE;PRAGMA synchronous=FULL"}},
+        # Whatever cleaning_platform.settings chose (SQLITE_PROFILE=tuned by default)
+        "sqlite-settings": {"OPTIONS": copy.deepcopy(settings_dict.get("OPTIONS", {}))},
+    }
+
+
+def _postgres_profiles(settings_dict):
+    base = {k: v for k, v in settings_dict.get("OPTIONS", {}).items() if k != "pool"}
+    pool = settings_dict.get("OPTIONS", {}).get("pool") or {"min_size": 2, "max_size": 10, "timeout": 10}
+    return {
+        "pg-per-request": {"CONN_MAX_AGE": 0, "OPTIONS": base},
+        "pg-persistent": {"CONN_MAX_AGE": 600, "OPTIONS": base},
+        "pg-pool": {"CONN_MAX_AGE": 0, "OPTIONS": dict(base, pool=pool)},
+    }
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(p / 100 * len(sorted_values)))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the database layer under each connection profile (SQLite pragmas; Postgres "
+        "per-request, persistent and pooled connections) in a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8, help="Concurrent simulated requests.")
+        parser.add_argument("--seconds", type=float, default=5.0, help="Duration per profile.")
+        parser.add_argument("--writes", type=float, default=0.2, help="Fraction of requests that save an estimate.")
+        parser.add_argument("--profile", action="append", help="Only these profiles (repeatable).")
+        parser.add_argument("--output", "-o", help="Write results as JSON to this file.")
+
+    def handle(self, *args, **opts):
+        if opts["threads"] < 1 or opts["seconds"] <= 0 or not 0 <= opts["writes"] <= 1:
+            raise CommandError("--threads and --seconds must be positive, --writes within 0..1.")
+        settings_dict = connection.settings_dict
+        original = {k: copy.deepcopy(settings_dict.get(k)) for k in ("NAME", "OPTIONS", "CONN_MAX_AGE", "TEST")}
+        if connection.vendor == "sqlite":
+            profiles = _sqlite_profiles(settings_dict)
+        elif connection.vendor == "postgresql":
+            profiles = _postgres_profiles(settings_dict)
+        else:
+            raise CommandError(f"No load-test profiles for {connection.vendor}.")
+        names = opts["profile"] or list(profiles)
+        unknown = set(names) - set(profiles)
+        if unknown:
+            raise CommandError(f"Unknown profile(s) {sorted(unknown)}; choose from {sorted(profiles)}.")
+
+        results = {}
+        try:
+            for name in names:
+                results[name] = self._run_profile(name, profiles[name], opts)
+                r = results[name]
+                self.stdout.write(
+                    f"{name:<16} {r['rps']:>9.1f} req/s  p50 {r['p50_ms']:.2f} ms  p95 {r['p95_ms']:.2f} ms  "
+                    f"p99 {r['p99_ms']:.2f} ms  ({r['requests']} requests, {r['errors']} errors)"
+                )
+        finally:
+            settings_dict.update(original)
+
+        base = results[names[0]]["rps"]
+        if len(names) > 1 and base:
+            self.stdout.write("")
+            for name in names[1:]:
+                self.stdout.write(f"{name:<16} {results[name]['rps'] / base:.2f}x {names[0]}")
+        if opts["output"]:
+            with open(opts["output"], "w") as f:
+                json.dump({"db": connection.vendor, "threads": opts["threads"], "results": results}, f, indent=2)
+
+    def _run_profile(self, name, overrides, opts):
+        settings_dict = connection.settings_dict
+        old_name = settings_dict["NAME"]
+        connections.close_all()
+        settings_dict.update(copy.deepcopy(overrides))
+        if connection.vendor == "sqlite":
+            # A file, not the in-memory default, so threads share one database
+            settings_dict["TEST"] = dict(settings_dict.get("TEST") or {}, NAME=f"{old_name}.loadtest-{name}")
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            return self._load(opts)
+        finally:
+            connections.close_all()
+            if getattr(connection, "pool", None):
+                connection.close_pool()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _load(self, opts):
+        AddOn.objects.bulk_create([AddOn(key=f"load_{i}", name=f"Load {i}", price_flat=25 + i) for i in range(4)])
+        addon_ids = list(AddOn.objects.values_list("id", flat=True))
+        Estimate.objects.bulk_create([
+            Estimate(name=f"Seed {i}", email=f"seed{i}@example.com", email_normalized=f"seed{i}@example.com",
+                     service_type="residential", frequency="weekly")
+            for i in range(2000)
+        ])
+        connections.close_all()
+
+        deadline = time.perf_counter() + opts["seconds"]
+        lock = threading.Lock()
+        latencies, errors = [], [0]
+
+        def worker(n):
+            rng = random.Random(n)
+            mine, failed = [], 0
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                close_old_connections()  # what request_started does
+                try:
+                    if rng.random() < opts["writes"]:
+                        with transaction.atomic():
+                            est = Estimate.objects.create(
+                                name=f"Load {n}", email=f"load{n}@example.com",
+                                service_type="residential", frequency="weekly",
+                            )
+                            est.addons.set(rng.sample(addon_ids, 2))
+                    else:
+                        email = f"seed{rng.randrange(2000)}@example.com"
+                        list(Estimate.objects.filter(email_normalized=email).values_list("id", "estimated_price"))
+                except DatabaseError:
+                    failed += 1
+                finally:
+                    close_old_connections()  # what request_finished does
+                mine.append(time.perf_counter() - started)
+            connections.close_all()
+            with lock:
+                latencies.extend(mine)
+                errors[0] += failed
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=opts["threads"]) as pool:
+            list(pool.map(worker, range(opts["threads"])))
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            "requests": len(latencies),
+            "errors": errors[0],
+            "rps": len(latencies) / elapsed if elapsed else 0.0,
+            "p50_ms": _percentile(latencies, 50) * 1000,
+            "p95_ms": _percentile(latencies, 95) * 1000,
+            "p99_ms": _percentile(latencies, 99) * 1000,
+        }
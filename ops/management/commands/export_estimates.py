@@ -0,0 +1,36 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from ops.export import FORMATS
+from ops.models import Estimate
+
+
+class Command(BaseCommand):
+    help = "Stream estimates to CSV or NDJSON without loading the table into memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+        parser.add_argument("--output", "-o", help="File to write (default: stdout).")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument("--service-type", action="append", choices=[k for k, _ in Estimate.SERVICE_CHOICES])
+        parser.add_argument("--since", help="Only estimates created on or after this date (YYYY-MM-DD).")
+        parser.add_argument("--until", help="Only estimates created on or before this date (YYYY-MM-DD).")
+
+    def handle(self, *args, **opts):
+        qs = Estimate.objects.order_by("id")
+        if opts["service_type"]:
+            qs = qs.filter(service_type__in=opts["service_type"])
+        if opts["since"]:
+            qs = qs.filter(created_at__date__gte=opts["since"])
+        if opts["until"]:
+            qs = qs.filter(created_at__date__lte=opts["until"])
+
+        stream, _, _ = FORMATS[opts["format"]]
+        out = open(opts["output"], "w", newline="", encoding="utf-8") if opts["output"] else sys.stdout
+        try:
+            for piece in stream(qs, opts["chunk_size"]):
+                out.write(piece)
+        finally:
+            if out is not sys.stdout:
+                out.close()
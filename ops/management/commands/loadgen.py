@@ -0,0 +1,380 @@
+import http.client
+import json
+import logging
+import platform
+import random
+import re
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+
+from ops.geo import service_area
+from ops.management.commands.benchmark import _git_rev
+from ops.models import AddOn, Estimate, PricingSettings
+from ops.writer import journal_problem
+
+KINDS = ("get", "post", "thanks")
+EXPECTED = {"get": (200, 304), "post": (302,), "thanks": (200,)}
+CSRF_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+ADDON_RE = re.compile(r'name="addons" value="(\d+)"')
+METRIC_RE = re.compile(r'^ops_http_request_db_queries_(count|sum)\{view="([^"]+)"\} (\S+)$', re.M)
+
+
+def _parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in KINDS:
+            raise CommandError(f"Unknown request kind {kind!r} in --mix; use {', '.join(KINDS)}.")
+        try:
+            mix[kind] = float(weight)
+        except ValueError:
+            raise CommandError(f"Bad weight for {kind!r} in --mix.")
+    if not any(w > 0 for w in mix.values()):
+        raise CommandError("--mix needs at least one positive weight.")
+    return mix
+
+
+def _payload(rng, n, addon_ids, zips):
+    # A valid EstimateForm post; the counter keeps contact details unique so dedupe doesn't kick in
+    data = {
+        "name": f"Load {n}", "email": f"load{n}@example.com", "phone": f"256-555-{n % 10000:04d}",
+        "address": f"{rng.randint(1, 9999)} Main St", "zip_code": rng.choice(zips),
+        "service_type": rng.choice([k for k, _ in Estimate.SERVICE_CHOICES]),
+        "cleanliness_level": rng.choice([k for k, _ in Estimate.CLEAN_CHOICES]),
+        "frequency": rng.choice([k for k, _ in Estimate.FREQ_CHOICES]),
+        "approx_sq_ft": rng.randrange(500, 5001, 50), "bedrooms": rng.randint(0, 6),
+        "bathrooms": rng.randint(0, 4), "levels": rng.randint(1, 3),
+        "addons": rng.sample(addon_ids, rng.randint(0, len(addon_ids))),
+    }
+    for flag in ("furnished", "pets", "within_radius"):
+        if rng.random() < 0.5:
+            data[flag] = "on"
+    return data
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(p / 100 * len(sorted_values)))]
+
+
+def _summary(samples, elapsed):
+    # samples: [(seconds, ok, queries or None)]
+    latencies = sorted(s for s, _, _ in samples)
+    errors = sum(1 for _, ok, _ in samples if not ok)
+    queries = [q for _, _, q in samples if q is not None]
+    out = {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": errors / len(samples) if samples else 0.0,
+        "rps": len(samples) / elapsed if elapsed else 0.0,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+    }
+    if queries:
+        out["queries_mean"] = sum(queries) / len(queries)
+        out["queries_max"] = max(queries)
+    return out
+
+
+class InProcess:
+    """Requests through django.test.Client, one per worker, with per-request query counts."""
+
+    def __init__(self):
+        # Server errors come back as 500 responses and count as errors, like they would over HTTP
+        self.client = Client(raise_request_exception=False)
+
+    def request(self, kind, path, data=None):
+        with CaptureQueriesContext(connection) as ctx:
+            if kind == "post":
+                response = self.client.post(path, data)
+            else:
+                response = self.client.get(path)
+        return response.status_code, response.get("Location"), response.content, len(ctx)
+
+    def close(self):
+        connections.close_all()
+
+
+class Remote:
+    """Keep-alive HTTP/1.1 to --target, with the cookies and CSRF token a browser would send."""
+
+    def __init__(self, target):
+        parts = urlsplit(target)
+        conn_cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self.conn = conn_cls(parts.hostname, parts.port, timeout=30)
+        self.host = parts.netloc
+        self.cookies = {}
+        self.csrf = None
+
+    def request(self, kind, path, data=None):
+        headers = {"Host": self.host}
+        body = None
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        if kind == "post":
+            body = urlencode(dict(data, csrfmiddlewaretoken=self.csrf or ""), doseq=True)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+            headers["Referer"] = f"http://{self.host}{path}"
+        try:
+            self.conn.request("POST" if kind == "post" else "GET", path, body, headers)
+            response = self.conn.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            raise
+        for header in response.headers.get_all("Set-Cookie") or ():
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        if kind == "get" and response.status == 200:
+            match = CSRF_RE.search(content.decode(errors="replace"))
+            if match:
+                self.csrf = match.group(1)
+        return response.status, response.headers.get("Location"), content, None
+
+    def close(self):
+        self.conn.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the estimate endpoints (GET/POST /estimate/, /estimate/thanks/) with concurrent "
+        "workers, in process against a throwaway database or against a running server (--target), "
+        "and report throughput, latency percentiles, error rate and DB queries per request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target", help="Base URL of a running server, e.g. http://127.0.0.1:8000 "
+                                             "(default: serve in process from a test database).")
+        parser.add_argument("--workers", type=int, default=8, help="Concurrent workers (threads).")
+        parser.add_argument("--seconds", type=float, default=10.0, help="Duration of the run.")
+        parser.add_argument("--requests", type=int, help="Stop after this many requests in total.")
+        parser.add_argument("--mix", default="get=3,post=1,thanks=2",
+                            help="Relative weights of get/post/thanks requests.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--metrics-token", default=getattr(settings, "METRICS_TOKEN", ""),
+                            help="Bearer token for the target's /metrics (query counts in --target mode).")
+        parser.add_argument("--output", "-o", help="Write the report as JSON to this file.")
+        parser.add_argument("--compare", help="Earlier JSON report to print changes against.")
+
+    def handle(self, *args, **opts):
+        if opts["workers"] < 1 or opts["seconds"] <= 0 or (opts["requests"] is not None and opts["requests"] < 1):
+            raise CommandError("--workers, --seconds and --requests must be positive.")
+        mix = _parse_mix(opts["mix"])
+
+        if opts["target"]:
+            report = self._remote(opts, mix)
+        else:
+            report = self._in_process(opts, mix)
+
+        self._print(report)
+        if opts["compare"]:
+            self._compare(opts["compare"], report)
+        if opts["output"]:
+            with open(opts["output"], "w") as f:
+                json.dump(report, f, indent=2)
+
+    def _in_process(self, opts, mix):
+        setup_test_environment()
+        settings_dict = connection.settings_dict
+        old_name, old_test = settings_dict["NAME"], settings_dict.get("TEST")
+        if connection.vendor == "sqlite":
+            # A file, not the in-memory default, so worker threads share one database
+            settings_dict["TEST"] = dict(old_test or {}, NAME=f"{old_name}.loadgen")
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            PricingSettings.objects.create()
+            AddOn.objects.bulk_create([
+                AddOn(key=k, name=k.replace("_", " ").title(), price_flat=p)
+                for k, p in (("inside_fridge", 40), ("inside_oven", 45), ("windows", 60), ("baseboards", 35))
+            ])
+            addon_ids = list(AddOn.objects.values_list("id", flat=True))
+            connections.close_all()
+            # 500s are counted in the report; one traceback per failed request would drown it
+            request_log = logging.getLogger("django.request")
+            level = request_log.level
+            request_log.setLevel(logging.CRITICAL)
+            try:
+                return self._run(opts, mix, InProcess, addon_ids, target="in-process")
+            finally:
+                request_log.setLevel(level)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            settings_dict["TEST"] = old_test
+            teardown_test_environment()
+
+    def _remote(self, opts, mix):
+        target = opts["target"].rstrip("/")
+        probe = Remote(target)
+        try:
+            status, _, content, _ = probe.request("get", "/estimate/")
+        except OSError as e:
+            raise CommandError(f"Can't reach {target}: {e}")
+        finally:
+            probe.close()
+        if status != 200:
+            raise CommandError(f"GET {target}/estimate/ returned {status}.")
+        addon_ids = [int(a) for a in ADDON_RE.findall(content.decode(errors="replace"))]
+        before = self._scrape(target, opts["metrics_token"])
+        report = self._run(opts, mix, lambda: Remote(target), addon_ids, target=target)
+        after = self._scrape(target, opts["metrics_token"])
+        if before is not None and after is not None:
+            # Only the worker process that answered both scrapes; exact with a single worker
+            report["server_queries_per_request"] = {
+                view: (after[view]["sum"] - before.get(view, {}).get("sum", 0))
+                / (after[view]["count"] - before.get(view, {}).get("count", 0))
+                for view in after
+                if view in ("estimate", "estimate_thanks")
+                and after[view]["count"] > before.get(view, {}).get("count", 0)
+            }
+        return report
+
+    def _scrape(self, target, token):
+        session = Remote(target)
+        try:
+            headers = {"Host": session.host}
+            if token:
+                headers["Authorization"] = f"Bearer {token}"
+            session.conn.request("GET", "/metrics", headers=headers)
+            response = session.conn.getresponse()
+            text = response.read().decode(errors="replace")
+        except (OSError, http.client.HTTPException):
+            return None
+        finally:
+            session.close()
+        if response.status != 200:
+            return None
+        series = {}
+        for field, view, value in METRIC_RE.findall(text):
+            series.setdefault(view, {})[field] = float(value)
+        return series
+
+    def _run(self, opts, mix, make_session, addon_ids, target):
+        kinds, weights = zip(*mix.items())
+        ps = PricingSettings()  # default service area; the ZIPs only shape the payloads
+        zips = sorted(service_area(ps.service_zip_center, ps.service_radius_miles)) or [ps.service_zip_center]
+        zips += ["99501", "10001"]  # outside the service area
+        deadline = time.perf_counter() + opts["seconds"]
+        budget = opts["requests"]
+        lock = threading.Lock()
+        issued = [0]
+        samples = {k: [] for k in KINDS}
+        failures = []
+
+        def take():
+            with lock:
+                if budget is not None and issued[0] >= budget:
+                    return None
+                issued[0] += 1
+                return issued[0]
+
+        def worker(w):
+            rng = random.Random(opts["seed"] * 1000 + w)
+            session = make_session()
+            mine = {k: [] for k in KINDS}
+            thanks_url = None
+            try:
+                # Warm-up, not measured: page, CSRF cookie and one thanks URL per worker
+                try:
+                    session.request("get", "/estimate/")
+                    _, thanks_url, _, _ = session.request("post", "/estimate/", _payload(rng, -1 - w, addon_ids, zips))
+                except (OSError, http.client.HTTPException) as e:
+                    with lock:
+                        failures.append(f"warm-up: {e}")
+                while time.perf_counter() < deadline:
+                    n = take()
+                    if n is None:
+                        break
+                    kind = rng.choices(kinds, weights)[0]
+                    started = time.perf_counter()
+                    try:
+                        if kind == "get":
+                            status, _, _, queries = session.request("get", "/estimate/")
+                        elif kind == "post":
+                            status, location, _, queries = session.request(
+                                "post", "/estimate/", _payload(rng, w * 10_000_000 + n, addon_ids, zips))
+                            thanks_url = location or thanks_url
+                        else:
+                            status, _, _, queries = session.request("thanks", thanks_url or "/estimate/thanks/")
+                        ok = status in EXPECTED[kind]
+                    except (OSError, http.client.HTTPException) as e:
+                        ok, queries = False, None
+                        with lock:
+                            failures.append(f"{kind}: {e}")
+                    mine[kind].append((time.perf_counter() - started, ok, queries))
+            finally:
+                session.close()
+                with lock:
+                    for k in KINDS:
+                        samples[k].extend(mine[k])
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(w,), name=f"loadgen-{w}") for w in range(opts["workers"])]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        every = [s for k in KINDS for s in samples[k]]
+        return {
+            "meta": {
+                "git": _git_rev(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "db": connection.vendor if target == "in-process" else None,
+                "when": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "target": target,
+                "workers": opts["workers"],
+                "seconds": elapsed,
+                "mix": mix,
+                "seed": opts["seed"],
+                "deferred_writes": getattr(settings, "ESTIMATE_DEFERRED_WRITES", False) and journal_problem() is None,
+                "pricing_engine": getattr(settings, "PRICING_ENGINE", "decimal"),
+            },
+            "total": _summary(every, elapsed),
+            "by_kind": {k: _summary(samples[k], elapsed) for k in KINDS if samples[k]},
+            "transport_errors": failures[:20],
+        }
+
+    def _print(self, report):
+        rows = [("total", report["total"])] + list(report["by_kind"].items())
+        for name, r in rows:
+            q = f"  {r['queries_mean']:.1f} q/req (max {r['queries_max']})" if "queries_mean" in r else ""
+            self.stdout.write(
+                f"{name:<7} {r['rps']:>8.1f} req/s  p50 {r['p50_ms']:7.2f} ms  p95 {r['p95_ms']:7.2f} ms  "
+                f"p99 {r['p99_ms']:7.2f} ms  {r['requests']} requests, {r['error_rate']:.2%} errors{q}"
+            )
+        for view, q in report.get("server_queries_per_request", {}).items():
+            self.stdout.write(f"server  {view}: {q:.1f} queries/request")
+        for line in report["transport_errors"]:
+            self.stdout.write(self.style.WARNING(f"  {line}"))
+
+    def _compare(self, path, report):
+        with open(path) as f:
+            baseline = json.load(f)
+        self.stdout.write(f"\nvs {path} ({baseline['meta'].get('git')}, {baseline['meta'].get('target')}):")
+        rows = [("total", report["total"], baseline.get("total"))] + [
+            (k, r, baseline.get("by_kind", {}).get(k)) for k, r in report["by_kind"].items()
+        ]
+        for name, now, then in rows:
+            if not then or not then["rps"] or not then["p95_ms"]:
+                continue
+            self.stdout.write(
+                f"{name:<7} throughput {now['rps'] / then['rps'] - 1:+.1%}  "
+                f"p95 {now['p95_ms'] / then['p95_ms'] - 1:+.1%}  "
+                f"errors {now['error_rate'] - then['error_rate']:+.2%}"
+            )
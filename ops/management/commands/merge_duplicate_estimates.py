@@ -0,0 +1,108 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch
+
+from ops import dedupe, rollup
+from ops.models import AddOn, Estimate, Job, ServicePlan
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete estimates that repeat an earlier one's inputs and contact info within the duplicate window, "
+        "and stamp the survivors' fingerprints so new duplicates of them are caught. Duplicates that were "
+        "accepted or have jobs or service plans are kept and reported; a deleted duplicate's queued "
+        "emails go with it, since the survivor's cover the same request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument("--dry-run", action="store_true", help="Count duplicates without changing anything.")
+
+    def handle(self, *args, **opts):
+        # The live path's window; slots stamped here must agree with it
+        window = dedupe.window_seconds()
+        if opts["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive.")
+        dry_run = opts["dry_run"]
+
+        qs = (
+            Estimate.objects.order_by("created_at", "id")
+            .only(
+                "id", "created_at", "name", "email", "phone", "address", "zip_code",
+                "service_type", "cleanliness_level", "frequency",
+                "bedrooms", "bathrooms", "approx_sq_ft", "levels", "furnished", "pets",
+                "email_normalized", "phone_digits", "fingerprint", "dedupe_slot", "accepted_at",
+            )
+            .annotate(
+                has_jobs=Exists(Job.objects.filter(estimate=OuterRef("pk"))),
+                has_plans=Exists(ServicePlan.objects.filter(estimate=OuterRef("pk"))),
+            )
+            .prefetch_related(Prefetch("addons", queryset=AddOn.objects.only("id")))
+        )
+
+        started = time.monotonic()
+        seen = merged = stamped = kept = 0
+        open_rows = {}  # fingerprint -> (survivor, its timestamp) while later rows may still duplicate it
+        to_delete, to_stamp = [], []
+        held = set()  # (fingerprint, slot) already stored on a duplicate we keep
+
+        def settle(est, fp):
+            # A survivor no later row can duplicate: record its fingerprint/slot
+            slot = int(est.created_at.timestamp()) // window
+            if (fp, slot) in held:
+                return
+            if est.fingerprint != fp or est.dedupe_slot != slot:
+                est.fingerprint, est.dedupe_slot = fp, slot
+                to_stamp.append(est)
+
+        def flush():
+            nonlocal merged, stamped
+            merged += len(to_delete)
+            stamped += len(to_stamp)
+            if not dry_run and (to_delete or to_stamp):
+                with transaction.atomic():
+                    # Duplicates go first so their slots are free for the survivors
+                    if to_delete:
+                        rollup.forget(to_delete)
+                        Estimate.objects.filter(id__in=to_delete).delete()
+                    if to_stamp:
+                        Estimate.objects.bulk_update(to_stamp, ["fingerprint", "dedupe_slot"], batch_size=500)
+            to_delete.clear()
+            to_stamp.clear()
+
+        for est in qs.iterator(chunk_size=opts["chunk_size"]):
+            seen += 1
+            est.normalize_contact()
+            fp = dedupe.fingerprint(est, [a.id for a in est.addons.all()])
+            ts = est.created_at.timestamp()
+            survivor = open_rows.get(fp)
+            if survivor is not None and ts - survivor[1] < window:
+                if est.accepted_at or est.has_jobs or est.has_plans:
+                    # Booked work hangs off it; deleting would cascade to jobs and plans
+                    kept += 1
+                    held.add((est.fingerprint, est.dedupe_slot))
+                else:
+                    to_delete.append(est.id)
+            else:
+                if survivor is not None:
+                    settle(survivor[0], fp)
+                open_rows[fp] = (est, ts)
+
+            if seen % opts["chunk_size"] == 0:
+                # Rows are in time order, so anything older than the window is final
+                for key in [k for k, (_, t) in open_rows.items() if ts - t >= window]:
+                    settle(open_rows.pop(key)[0], key)
+                flush()
+                self.stdout.write(f"  {seen} checked, {merged} duplicates, {time.monotonic() - started:.1f}s")
+
+        for key, (survivor, _) in open_rows.items():
+            settle(survivor, key)
+        flush()
+
+        verb = "would be removed" if dry_run else "removed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{seen} estimates checked: {merged} duplicates {verb}, {kept} kept (accepted, booked or on a plan), "
+            f"{stamped} fingerprints {'to stamp' if dry_run else 'stamped'} in {time.monotonic() - started:.2f}s"
+        ))
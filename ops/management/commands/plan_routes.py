@@ -0,0 +1,72 @@
+import json
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ops.routing import plan_day
+
+
+class Command(BaseCommand):
+    help = (
+        "Group a day's jobs and recurring visits by ZIP proximity and order each group's stops in "
+        "booked order, by distance within each arrival window (nearest neighbour + 2-opt). "
+        "Read-only: prints the plan, changes nothing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", help="Day to plan (YYYY-MM-DD; default: tomorrow).")
+        parser.add_argument("--regroup", action="store_true",
+                            help="Ignore crew bookings and sweep all stops into proximity batches.")
+        parser.add_argument("--groups", type=int, help="Batches for --regroup (default: crews working that day).")
+        parser.add_argument("--output", "-o", help="Also write the plan as JSON to this file.")
+
+    def handle(self, *args, **opts):
+        try:
+            day = date.fromisoformat(opts["date"]) if opts["date"] else timezone.localdate() + timedelta(days=1)
+        except ValueError:
+            raise CommandError(f"Bad --date {opts['date']!r}; expected YYYY-MM-DD.")
+        if opts["groups"] is not None and opts["groups"] < 1:
+            raise CommandError("--groups must be positive.")
+
+        started = time.monotonic()
+        routes, unrouted = plan_day(day, regroup=opts["regroup"], groups=opts["groups"])
+        elapsed = time.monotonic() - started
+
+        for r in routes:
+            self.stdout.write(
+                f"{r.label}: {len(r.stops)} stops, {r.hours:.1f} h on site, "
+                f"{r.miles:.1f} mi (~{r.drive_minutes:.0f} min driving)"
+            )
+            for n, (stop, leg) in enumerate(r.rows, 1):
+                self.stdout.write(
+                    f"  {n:>3}. {timezone.localtime(stop.start):%H:%M} {stop.estimate.zip_code:<10} "
+                    f"+{leg:5.1f} mi  #{stop.estimate.pk} {stop.estimate.name}"
+                )
+        for stop in unrouted:
+            self.stdout.write(f"  no location: #{stop.estimate.pk} {stop.estimate.name} (ZIP {stop.estimate.zip_code!r})")
+        self.stdout.write(self.style.SUCCESS(
+            f"{sum(len(r.stops) for r in routes)} stops in {len(routes)} routes for {day:%Y-%m-%d}, "
+            f"{sum(r.miles for r in routes):.1f} mi total, {len(unrouted)} unrouted, in {elapsed:.3f}s"
+        ))
+
+        if opts["output"]:
+            with open(opts["output"], "w") as f:
+                json.dump({
+                    "date": day.isoformat(),
+                    "routes": [
+                        {
+                            "label": r.label,
+                            "crew": r.crew.pk if r.crew else None,
+                            "miles": round(r.miles, 2),
+                            "stops": [
+                                {"estimate": s.estimate.pk, "kind": s.kind, "zip": s.estimate.zip_code,
+                                 "start": s.start.isoformat(), "leg_miles": round(leg, 2)}
+                                for s, leg in r.rows
+                            ],
+                        }
+                        for r in routes
+                    ],
+                    "unrouted": [s.estimate.pk for s in unrouted],
+                }, f, indent=2)
@@ -0,0 +1,32 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = "Delete expired rows from django_session in bounded batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches.")
+
+    def handle(self, *args, **opts):
+        now = timezone.now()
+        total = 0
+        while True:
+            # Short transactions keep lock time bounded on a large table
+            with transaction.atomic():
+                keys = list(
+                    Session.objects.filter(expire_date__lt=now)
+                    .values_list("session_key", flat=True)[: opts["batch_size"]]
+                )
+                if not keys:
+                    break
+                Session.objects.filter(session_key__in=keys).delete()
+            total += len(keys)
+            if opts["pause"]:
+                time.sleep(opts["pause"])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {total} expired sessions."))
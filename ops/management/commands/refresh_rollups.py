@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ops import rollup
+
+
+class Command(BaseCommand):
+    help = "Fold estimates not yet counted into EstimateDailyRollup."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument("--rebuild", action="store_true", help="Drop the rollup and recount every estimate.")
+
+    def handle(self, *args, **opts):
+        started = time.monotonic()
+        fn = rollup.rebuild if opts["rebuild"] else rollup.refresh
+        n = fn(opts["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {n} estimates in {time.monotonic() - started:.2f}s"))
@@ -0,0 +1,103 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Prefetch
+
+from ops import rollup
+from ops.catalog import get_catalog
+from ops.models import AddOn, Estimate
+from ops.pricing import get_snapshot
+from ops.views import PRICING_FIELDS, _quote_batch
+
+
+class Command(BaseCommand):
+    help = "Recompute stored hours and estimated_price with the current pricing settings."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000,
+                            help="Rows fetched per cursor round-trip and written per transaction.")
+        parser.add_argument("--batch-size", type=int, default=500, help="Rows per bulk_update statement.")
+        parser.add_argument("--service-type", action="append", choices=[k for k, _ in Estimate.SERVICE_CHOICES],
+                            help="Only these service types (repeatable).")
+        parser.add_argument("--since", help="Only estimates created on or after this date (YYYY-MM-DD).")
+        parser.add_argument("--until", help="Only estimates created on or before this date (YYYY-MM-DD).")
+        parser.add_argument("--after-id", type=int, default=0, help="Resume after this estimate id.")
+        parser.add_argument("--checkpoint", help="File holding the last committed id; read on start, written per chunk.")
+        parser.add_argument("--dry-run", action="store_true", help="Compute and count changes without writing.")
+        parser.add_argument("--engine", choices=("decimal", "int"),
+                            help="Pricing engine (default: PRICING_ENGINE); int prices each chunk in one pass.")
+
+    def handle(self, *args, **opts):
+        chunk_size, batch_size = opts["chunk_size"], opts["batch_size"]
+        if chunk_size < 1 or batch_size < 1:
+            raise CommandError("--chunk-size and --batch-size must be positive.")
+
+        after_id = opts["after_id"]
+        checkpoint = Path(opts["checkpoint"]) if opts["checkpoint"] else None
+        if checkpoint and checkpoint.exists() and not after_id:
+            after_id = int(checkpoint.read_text().strip() or 0)
+            self.stdout.write(f"Resuming after id {after_id} from {checkpoint}")
+
+        qs = Estimate.objects.filter(id__gt=after_id).order_by("id")
+        if opts["service_type"]:
+            qs = qs.filter(service_type__in=opts["service_type"])
+        if opts["since"]:
+            qs = qs.filter(created_at__date__gte=opts["since"])
+        if opts["until"]:
+            qs = qs.filter(created_at__date__lte=opts["until"])
+        qs = qs.only(
+            "id", "service_type", "frequency", "cleanliness_level",
+            "bedrooms", "bathrooms", "approx_sq_ft", "levels",
+            "furnished", "pets", "hours", "estimated_price",
+        ).prefetch_related(Prefetch("addons", queryset=AddOn.objects.only("id")))
+
+        ps = get_snapshot()
+        catalog = get_catalog()
+        seen = changed = 0
+        started = time.monotonic()
+
+        def flush(chunk):
+            nonlocal seen, changed
+            dirty = []
+            items = [
+                dict({f: getattr(est, f) for f in PRICING_FIELDS}, addons=[a.id for a in est.addons.all()])
+                for est in chunk
+            ]
+            for est, (hours, price) in zip(chunk, _quote_batch(items, ps, catalog, engine=opts["engine"])):
+                if est.hours != hours or est.estimated_price != price:
+                    est.hours, est.estimated_price = hours, price
+                    dirty.append(est)
+            if dirty and not opts["dry_run"]:
+                ids = [est.id for est in dirty]
+                with transaction.atomic():
+                    # Move their rollup totals from the old prices to the new ones
+                    rollup.retract(ids)
+                    Estimate.objects.bulk_update(dirty, ["hours", "estimated_price"], batch_size=batch_size)
+                    rollup.record(ids)
+            seen += len(chunk)
+            changed += len(dirty)
+            last_id = chunk[-1].id
+            if checkpoint and not opts["dry_run"]:
+                checkpoint.write_text(str(last_id))
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"  through id {last_id}: {seen} rows, {changed} changed, {seen / elapsed if elapsed else 0:,.0f} rows/s"
+            )
+
+        chunk = []
+        for est in qs.iterator(chunk_size=chunk_size):
+            chunk.append(est)
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+
+        elapsed = time.monotonic() - started
+        verb = "would change" if opts["dry_run"] else "updated"
+        self.stdout.write(self.style.SUCCESS(
+            f"{seen} estimates checked, {changed} {verb} in {elapsed:.2f}s "
+            f"({seen / elapsed if elapsed else 0:,.0f} rows/s)"
+        ))
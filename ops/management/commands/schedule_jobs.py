@@ -0,0 +1,48 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ops.scheduling import horizon_start, schedule
+
+
+class Command(BaseCommand):
+    help = "Book the backlog of accepted estimates into crew working hours, in one pass."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="First day to book (YYYY-MM-DD; default: tomorrow).")
+        parser.add_argument("--days", type=int, default=7, help="Days in the booking window.")
+        parser.add_argument("--dry-run", action="store_true", help="Show the plan without creating jobs.")
+        parser.add_argument("--verbose-plan", action="store_true", help="List every booking.")
+
+    def handle(self, *args, **opts):
+        if opts["days"] < 1:
+            raise CommandError("--days must be positive.")
+        try:
+            day = date.fromisoformat(opts["start"]) if opts["start"] else None
+        except ValueError:
+            raise CommandError(f"Bad --start {opts['start']!r}; expected YYYY-MM-DD.")
+        start = horizon_start(day)
+
+        started = time.monotonic()
+        bookings, unplaced, too_long = schedule(start, opts["days"], dry_run=opts["dry_run"])
+        elapsed = time.monotonic() - started
+
+        if opts["verbose_plan"]:
+            for b in bookings:
+                self.stdout.write(
+                    f"  {b.crew}: {timezone.localtime(b.start):%a %Y-%m-%d %H:%M}–"
+                    f"{timezone.localtime(b.end):%H:%M}  #{b.estimate.pk} {b.estimate.name}"
+                )
+        for est in unplaced:
+            self.stdout.write(f"  no room: #{est.pk} {est.name} ({est.hours} h)")
+        for est in too_long:
+            self.stdout.write(self.style.WARNING(
+                f"  longer than a crew day, book by hand: #{est.pk} {est.name} ({est.hours} h)"
+            ))
+        verb = "would book" if opts["dry_run"] else "booked"
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(bookings)} jobs {verb} from {start:%Y-%m-%d} over {opts['days']} days, "
+            f"{len(unplaced)} left unplaced, {len(too_long)} too long for one day, in {elapsed:.2f}s"
+        ))
@@ -0,0 +1,46 @@
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand, CommandError
+
+from ops import outbox
+
+
+class Command(BaseCommand):
+    help = (
+        "Send pending estimate notifications from the outbox in batches over one mail connection, "
+        "checked (and reopened if dropped) before each batch, retrying failed messages with backoff. "
+        "Runs once, or keeps polling with --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=getattr(settings, "OUTBOX_BATCH_SIZE", 50))
+        parser.add_argument("--loop", action="store_true", help="Keep draining until interrupted.")
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds to wait when idle with --loop.")
+
+    def handle(self, *args, **opts):
+        if opts["batch_size"] < 1 or opts["interval"] <= 0:
+            raise CommandError("--batch-size and --interval must be positive.")
+        # One session across batches; send_batch checks it first and reopens it if the server dropped it
+        connection = get_connection()
+        try:
+            while True:
+                started = time.monotonic()
+                results = outbox.drain(connection, opts["batch_size"])
+                if results or not opts["loop"]:
+                    self.stdout.write(
+                        f"{results['sent']} sent, {results['retried']} to retry, {results['failed']} failed, "
+                        f"{results['deferred']} left pending by a mail connection error "
+                        f"in {time.monotonic() - started:.2f}s"
+                    )
+                if not opts["loop"]:
+                    if results["deferred"]:
+                        raise CommandError("The mail connection failed; the rest stays pending for the next run.")
+                    break
+                if not results or results["deferred"]:
+                    time.sleep(opts["interval"])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
@@ -0,0 +1,61 @@
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from ops.models import Estimate
+from ops.simulator import candidate_from, simulate
+
+
+def _dollars(cents) -> str:
+    return f"{cents / 100:,.2f}"
+
+
+class Command(BaseCommand):
+    help = "Reprice every past Estimate under candidate pricing settings and report revenue deltas."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--candidate", "-c", action="append", default=[], metavar="KNOB=VALUE[,KNOB=VALUE...]",
+            help="Knob overrides on top of the current settings; repeat for more candidates.",
+        )
+        parser.add_argument("--service-type", choices=[k for k, _ in Estimate.SERVICE_CHOICES])
+        parser.add_argument("--since", help="Only estimates created on or after this date (YYYY-MM-DD).")
+        parser.add_argument("--json", action="store_true", help="Print the raw result as JSON.")
+
+    def handle(self, *args, **opts):
+        candidates = []
+        for spec in opts["candidate"]:
+            try:
+                overrides = dict(pair.split("=", 1) for pair in spec.split(",") if pair)
+                candidates.append(candidate_from(overrides))
+            except ValueError:
+                raise CommandError(f"Bad candidate {spec!r}; expected KNOB=VALUE pairs.")
+            except (FieldDoesNotExist, ValidationError) as e:
+                raise CommandError(f"Bad candidate {spec!r}: {e}")
+        if not candidates:
+            raise CommandError("Give at least one --candidate.")
+
+        qs = Estimate.objects.all()
+        if opts["service_type"]:
+            qs = qs.filter(service_type=opts["service_type"])
+        if opts["since"]:
+            qs = qs.filter(created_at__date__gte=opts["since"])
+
+        result = simulate(candidates, queryset=qs)
+        if opts["json"]:
+            self.stdout.write(json.dumps(result, indent=2))
+            return
+
+        base = result["baseline"]
+        self.stdout.write(f"Estimates: {base['count']}  stored total: ${_dollars(result['stored_total_cents'])}")
+        self.stdout.write(f"Baseline (current settings): ${_dollars(base['total_cents'])}  mean ${_dollars(base['mean_cents'])}")
+        for spec, c in zip(opts["candidate"], result["candidates"]):
+            self.stdout.write("")
+            self.stdout.write(self.style.MIGRATE_HEADING(spec))
+            self.stdout.write(
+                f"  total ${_dollars(c['total_cents'])} ({c['delta_total_cents'] / 100:+,.2f})"
+                f"  mean ${_dollars(c['mean_cents'])} ({c['delta_mean_cents'] / 100:+,.2f})"
+            )
+            for st, cents in c["by_service_cents"].items():
+                self.stdout.write(f"  {st:<13} ${_dollars(cents)} ({c['delta_by_service_cents'][st] / 100:+,.2f})")
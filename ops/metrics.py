@@ -0,0 +1,219 @@
+"""In-process request/phase/DB metrics with a Prometheus text exposition.
+
+Numbers are per worker process; each scrape of /metrics sees the worker that
+served it.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.db import connections
+
+from .quotes import get_quote_cache
+from .writer import current_writer
+
+logger = logging.getLogger("ops.metrics")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labels):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._series = {}  # label values -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(label_values)
+            if s is None:
+                s = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                s[i] += 1
+            s[-2] += 1
+            s[-1] += value
+
+    def expose(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for label_values, s in sorted(series.items()):
+            base = _labels(self.labels, label_values)
+            running = 0
+            for bound, n in zip(self.buckets, s):
+                running += n
+                yield f'{self.name}_bucket{{{base}{"," if base else ""}le="{bound}"}} {running}'
+            yield f'{self.name}_bucket{{{base}{"," if base else ""}le="+Inf"}} {s[-2]}'
+            yield f"{self.name}_count{{{base}}} {s[-2]}"
+            yield f"{self.name}_sum{{{base}}} {s[-1]}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount, *label_values):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def expose(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            series = dict(self._series)
+        for label_values, v in sorted(series.items()):
+            yield f"{self.name}{{{_labels(self.labels, label_values)}}} {v}"
+
+
+def _labels(names, values):
+    def esc(v):
+        return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{n}="{esc(v)}"' for n, v in zip(names, values))
+
+
+REQUEST_SECONDS = Histogram(
+    "ops_http_request_duration_seconds", "Request latency by view.", LATENCY_BUCKETS, ("view", "method", "status"))
+REQUEST_QUERIES = Histogram(
+    "ops_http_request_db_queries", "DB queries per request by view.", QUERY_BUCKETS, ("view",))
+REQUEST_DB_SECONDS = Histogram(
+    "ops_http_request_db_duration_seconds", "Time spent in DB queries per request by view.", LATENCY_BUCKETS, ("view",))
+PHASE_SECONDS = Histogram(
+    "ops_phase_duration_seconds", "Duration of named phases inside a view.", LATENCY_BUCKETS, ("view", "phase"))
+PHASE_QUERIES = Counter(
+    "ops_phase_db_queries_total", "DB queries issued inside each named phase.", ("view", "phase"))
+
+REGISTRY = [REQUEST_SECONDS, REQUEST_QUERIES, REQUEST_DB_SECONDS, PHASE_SECONDS, PHASE_QUERIES]
+
+
+class RequestStats:
+    __slots__ = ("view", "queries", "db_seconds", "phases")
+
+    def __init__(self):
+        self.view = "unresolved"
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.phases = {}  # phase -> [seconds, queries]
+
+
+_current = ContextVar("ops_metrics_request", default=None)
+
+
+@contextmanager
+def phase(name):
+    """Time a block and attribute its DB queries to `name` (no-op outside a request)."""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    before = stats.queries
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        p = stats.phases.setdefault(name, [0.0, 0])
+        p[0] += elapsed
+        p[1] += stats.queries - before
+        PHASE_SECONDS.observe(elapsed, stats.view, name)
+        PHASE_QUERIES.inc(stats.queries - before, stats.view, name)
+
+
+def _query_wrapper(execute, sql, params, many, context):
+    stats = _current.get()
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """Outermost middleware: request latency, DB query count/time, slow-request log."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, "SLOW_REQUEST_MS", 0)
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            with _wrap_all_connections():
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, "resolver_match", None)
+        view = (match.url_name or match.view_name) if match else stats.view
+        REQUEST_SECONDS.observe(elapsed, view, request.method, f"{response.status_code // 100}xx")
+        REQUEST_QUERIES.observe(stats.queries, view)
+        REQUEST_DB_SECONDS.observe(stats.db_seconds, view)
+
+        if self.slow_ms and elapsed * 1000 >= self.slow_ms:
+            phases = ", ".join(f"{k}={v[0] * 1000:.1f}ms/{v[1]}q" for k, v in stats.phases.items())
+            logger.warning(
+                "slow request %s %s view=%s %.1fms queries=%d db=%.1fms phases[%s]",
+                request.method, request.path, view, elapsed * 1000, stats.queries, stats.db_seconds * 1000, phases,
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Phases recorded inside the view are labelled with its URL name
+        stats = _current.get()
+        if stats is not None and request.resolver_match:
+            stats.view = request.resolver_match.url_name or request.resolver_match.view_name
+
+
+@contextmanager
+def _wrap_all_connections():
+    with ExitStack() as stack:
+        for conn in connections.all():
+            stack.enter_context(conn.execute_wrapper(_query_wrapper))
+        yield
+
+
+class TimedSessionMiddleware(SessionMiddleware):
+    """SessionMiddleware whose response-time session write shows up as its own phase."""
+
+    def process_response(self, request, response):
+        with phase("session_save"):
+            return super().process_response(request, response)
+
+
+def expose() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose())
+    qstats = get_quote_cache().stats()
+    for key in ("hits", "backend_hits", "misses", "evictions"):
+        lines.append(f"# TYPE ops_quote_cache_{key}_total counter")
+        lines.append(f"ops_quote_cache_{key}_total {qstats[key]}")
+    lines.append("# TYPE ops_quote_cache_size gauge")
+    lines.append(f"ops_quote_cache_size {qstats['size']}")
+    w = current_writer()
+    if w is not None:
+        for key in ("queued", "written", "batches", "failures", "replayed", "dead_lettered"):
+            lines.append(f"# TYPE ops_estimate_writer_{key}_total counter")
+            lines.append(f"ops_estimate_writer_{key}_total {w.stats[key]}")
+        lines.append("# TYPE ops_estimate_writer_pending gauge")
+        lines.append(f"ops_estimate_writer_pending {w.pending()}")
+    return "\n".join(lines) + "\n"
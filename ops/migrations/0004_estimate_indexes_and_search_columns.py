@@ -0,0 +1,61 @@
+import re
+from django.db import migrations, models
+
+
+def backfill_search_columns(apps, schema_editor):
+    Estimate = apps.get_model("ops", "Estimate")
+    batch = []
+    for est in Estimate.objects.only("id", "email", "phone").iterator(chunk_size=2000):
+        est.email_normalized = (est.email or "").strip().lower()
+        est.phone_digits = re.sub(r"\D", "", est.phone or "")
+        batch.append(est)
+        if len(batch) >= 2000:
+            Estimate.objects.bulk_update(batch, ["email_normalized", "phone_digits"])
+            batch = []
+    if batch:
+        Estimate.objects.bulk_update(batch, ["email_normalized", "phone_digits"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ops", "0003_property_fields_and_pricing_knobs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="estimate",
+            name="email_normalized",
+            field=models.CharField(blank=True, editable=False, max_length=254),
+        ),
+        migrations.AddField(
+            model_name="estimate",
+            name="phone_digits",
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+        migrations.RunPython(backfill_search_columns, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="estimate",
+            index=models.Index(fields=["-created_at"], name="ops_est_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="estimate",
+            index=models.Index(fields=["service_type", "frequency", "-created_at"], name="ops_est_svc_freq_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="estimate",
+            index=models.Index(fields=["frequency", "-created_at"], name="ops_est_freq_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="estimate",
+            index=models.Index(fields=["email_normalized"], name="ops_est_email_norm_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="estimate",
+            index=models.Index(fields=["phone_digits"], name="ops_est_phone_digits_idx", opclasses=["varchar_pattern_ops"]),
+        ),
+        migrations.AddIndex(
+            model_name="estimate",
+            index=models.Index(fields=["zip_code"], name="ops_est_zip_idx", opclasses=["varchar_pattern_ops"]),
+        ),
+    ]
@@ -0,0 +1,68 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ops", "0004_estimate_indexes_and_search_columns"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="estimate",
+            name="rolled_up",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="estimate",
+            index=models.Index(condition=models.Q(rolled_up=False), fields=["id"], name="ops_est_rollup_pending_idx"),
+        ),
+        migrations.CreateModel(
+            name="EstimateDailyRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("day", models.DateField()),
+                ("service_type", models.CharField(
+                    choices=[
+                        ("residential", "Residential"),
+                        ("commercial", "Commercial"),
+                        ("construction", "Construction cleanup"),
+                        ("move", "Move in / Move out"),
+                        ("church", "Church"),
+                    ],
+                    max_length=20,
+                )),
+                ("frequency", models.CharField(
+                    choices=[
+                        ("one_time", "One-time"),
+                        ("weekly", "Weekly"),
+                        ("biweekly", "Bi-weekly"),
+                        ("monthly", "Monthly"),
+                    ],
+                    max_length=20,
+                )),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("hours_sum", models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ("value_sum", models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ("addon", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to="ops.addon")),
+            ],
+            options={
+                "verbose_name": "Estimate daily rollup",
+                "verbose_name_plural": "Estimate daily rollups",
+                "indexes": [models.Index(fields=["-day"], name="ops_rollup_day_idx")],
+                "constraints": [
+                    models.UniqueConstraint(
+                        condition=models.Q(addon__isnull=True),
+                        fields=("day", "service_type", "frequency"),
+                        name="ops_rollup_uniq_all",
+                    ),
+                    models.UniqueConstraint(
+                        condition=models.Q(addon__isnull=False),
+                        fields=("day", "service_type", "frequency", "addon"),
+                        name="ops_rollup_uniq_addon",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ops", "0005_estimate_daily_rollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="estimate",
+            name="idempotency_key",
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name="estimate",
+            name="fingerprint",
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="estimate",
+            name="dedupe_slot",
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name="estimate",
+            constraint=models.UniqueConstraint(fields=("fingerprint", "dedupe_slot"), name="ops_est_fingerprint_slot_uniq"),
+        ),
+    ]
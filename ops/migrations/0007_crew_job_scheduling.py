@@ -0,0 +1,73 @@
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ops", "0006_estimate_dedupe"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="estimate",
+            name="accepted_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="estimate",
+            index=models.Index(
+                condition=models.Q(accepted_at__isnull=False), fields=["accepted_at"], name="ops_est_accepted_idx"
+            ),
+        ),
+        migrations.CreateModel(
+            name="Crew",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=100)),
+                ("active", models.BooleanField(default=True)),
+                ("day_start", models.TimeField(default=datetime.time(8, 0))),
+                ("day_end", models.TimeField(default=datetime.time(17, 0))),
+                ("workdays", models.CharField(
+                    default="12345", help_text="ISO weekdays worked, e.g. 12345 for Mon–Fri", max_length=7,
+                )),
+            ],
+            options={
+                "verbose_name": "Crew",
+                "verbose_name_plural": "Crews",
+            },
+        ),
+        migrations.CreateModel(
+            name="Job",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("start", models.DateTimeField()),
+                ("end", models.DateTimeField()),
+                ("status", models.CharField(
+                    choices=[("scheduled", "Scheduled"), ("done", "Done"), ("cancelled", "Cancelled")],
+                    default="scheduled",
+                    max_length=20,
+                )),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("crew", models.ForeignKey(
+                    on_delete=django.db.models.deletion.PROTECT, related_name="jobs", to="ops.crew",
+                )),
+                ("estimate", models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE, related_name="jobs", to="ops.estimate",
+                )),
+            ],
+            options={
+                "verbose_name": "Job",
+                "verbose_name_plural": "Jobs",
+                "indexes": [models.Index(fields=["crew", "start"], name="ops_job_crew_start_idx")],
+                "constraints": [
+                    models.CheckConstraint(condition=models.Q(end__gt=models.F("start")), name="ops_job_end_after_start"),
+                    models.UniqueConstraint(
+                        condition=~models.Q(status="cancelled"), fields=["estimate"], name="ops_job_one_live_per_estimate",
+                    ),
+                ],
+            },
+        ),
+    ]
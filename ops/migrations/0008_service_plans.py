@@ -0,0 +1,77 @@
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ops", "0007_crew_job_scheduling"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ServicePlan",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("frequency", models.CharField(
+                    choices=[("weekly", "Weekly"), ("biweekly", "Bi-weekly"), ("monthly", "Monthly")], max_length=20,
+                )),
+                ("starts_on", models.DateField(
+                    help_text="Date of the first visit; later visits keep its weekday or day of month",
+                )),
+                ("ends_on", models.DateField(
+                    blank=True, help_text="Last day a visit may fall on; blank = open-ended", null=True,
+                )),
+                ("start_time", models.TimeField(default=datetime.time(9, 0))),
+                ("hours", models.DecimalField(decimal_places=2, max_digits=5)),
+                ("active", models.BooleanField(default=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("crew", models.ForeignKey(
+                    blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL,
+                    related_name="plans", to="ops.crew",
+                )),
+                ("estimate", models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE, related_name="plans", to="ops.estimate",
+                )),
+            ],
+            options={
+                "verbose_name": "Service plan",
+                "verbose_name_plural": "Service plans",
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(active=True), fields=["starts_on", "ends_on"], name="ops_plan_window_idx",
+                    ),
+                ],
+                "constraints": [
+                    models.CheckConstraint(
+                        condition=models.Q(ends_on__isnull=True) | models.Q(ends_on__gte=models.F("starts_on")),
+                        name="ops_plan_ends_after_start",
+                    ),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="PlanException",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("occurrence_date", models.DateField(help_text="The date the rule gives for the visit")),
+                ("kind", models.CharField(choices=[("skip", "Skip"), ("move", "Reschedule")], max_length=10)),
+                ("new_date", models.DateField(blank=True, null=True)),
+                ("new_start_time", models.TimeField(
+                    blank=True, help_text="Blank keeps the plan's start time", null=True,
+                )),
+                ("plan", models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE, related_name="exceptions", to="ops.serviceplan",
+                )),
+            ],
+            options={
+                "verbose_name": "Plan exception",
+                "verbose_name_plural": "Plan exceptions",
+                "constraints": [
+                    models.UniqueConstraint(fields=["plan", "occurrence_date"], name="ops_plan_exception_uniq"),
+                ],
+            },
+        ),
+    ]
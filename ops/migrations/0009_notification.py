@@ -0,0 +1,44 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ops", "0008_service_plans"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Notification",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("kind", models.CharField(choices=[("office", "Office"), ("customer", "Customer")], max_length=20)),
+                ("status", models.CharField(
+                    choices=[("pending", "Pending"), ("sent", "Sent"), ("failed", "Failed")],
+                    default="pending", max_length=20,
+                )),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("next_attempt_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("last_error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("sent_at", models.DateTimeField(blank=True, null=True)),
+                ("estimate", models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE, related_name="notifications", to="ops.estimate",
+                )),
+            ],
+            options={
+                "verbose_name": "Notification",
+                "verbose_name_plural": "Notifications",
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(status="pending"), fields=["next_attempt_at"], name="ops_notif_due_idx",
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(fields=["estimate", "kind"], name="ops_notif_estimate_kind_uniq"),
+                ],
+            },
+        ),
+    ]
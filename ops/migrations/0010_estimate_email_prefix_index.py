@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ops", "0009_notification"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="estimate",
+            name="ops_est_email_norm_idx",
+        ),
+        migrations.AddIndex(
+            model_name="estimate",
+            index=models.Index(fields=["email_normalized"], name="ops_est_email_norm_idx", opclasses=["varchar_pattern_ops"]),
+        ),
+    ]
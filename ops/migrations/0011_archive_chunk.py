@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ops", "0010_estimate_email_prefix_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchiveChunk",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("month", models.CharField(help_text="Local YYYY-MM the estimates were created in", max_length=7)),
+                ("data", models.BinaryField()),
+                ("count", models.PositiveIntegerField()),
+                ("min_id", models.BigIntegerField()),
+                ("max_id", models.BigIntegerField()),
+                ("first", models.DateTimeField(help_text="Earliest created_at in the chunk")),
+                ("last", models.DateTimeField(help_text="Latest created_at in the chunk")),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name": "Archive chunk",
+                "verbose_name_plural": "Archive chunks",
+                "indexes": [
+                    models.Index(fields=["min_id", "max_id"], name="ops_archive_ids_idx"),
+                    models.Index(fields=["first", "last"], name="ops_archive_created_idx"),
+                ],
+            },
+        ),
+    ]
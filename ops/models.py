@@ -1,4 +1,9 @@
+import re
+from datetime import time
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
 from decimal import Decimal
 
 class PricingSettings(models.Model):
@@ -106,9 +111,272 @@ class Estimate(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Normalized copies of contact info for indexed exact/prefix search
+    email_normalized = models.CharField(max_length=254, blank=True, editable=False)
+    phone_digits = models.CharField(max_length=40, blank=True, editable=False)
+
+    # Counted in EstimateDailyRollup yet (see ops.rollup)
+    rolled_up = models.BooleanField(default=False, editable=False)
+
+    # Set when the customer accepts; accepted estimates without a Job are the scheduling backlog
+    accepted_at = models.DateTimeField(null=True, blank=True)
+
+    # Duplicate-submission guards (see ops.dedupe); null on rows saved before them
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, unique=True, editable=False)
+    fingerprint = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    dedupe_slot = models.BigIntegerField(null=True, blank=True, editable=False)
+
     def __str__(self):
         return f"{self.name} – {self.service_type} ({self.frequency})"
 
+    def normalize_contact(self):
+        # Call before bulk_create/bulk_update, which skip save()
+        self.email_normalized = (self.email or "").strip().lower()
+        self.phone_digits = re.sub(r"\D", "", self.phone or "")
+
+    def save(self, *args, **kwargs):
+        self.normalize_contact()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"email", "phone"} & set(update_fields):
+            kwargs["update_fields"] = set(update_fields) | {"email_normalized", "phone_digits"}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Estimate"
         verbose_name_plural = "Estimates"
+        indexes = [
+            models.Index(fields=["-created_at"], name="ops_est_created_idx"),
+            models.Index(fields=["service_type", "frequency", "-created_at"], name="ops_est_svc_freq_created_idx"),
+            models.Index(fields=["frequency", "-created_at"], name="ops_est_freq_created_idx"),
+            # varchar_pattern_ops lets PostgreSQL serve LIKE 'prefix%' (and =); ignored elsewhere
+            models.Index(fields=["email_normalized"], name="ops_est_email_norm_idx", opclasses=["varchar_pattern_ops"]),
+            models.Index(fields=["phone_digits"], name="ops_est_phone_digits_idx", opclasses=["varchar_pattern_ops"]),
+            models.Index(fields=["zip_code"], name="ops_est_zip_idx", opclasses=["varchar_pattern_ops"]),
+            # Only the not-yet-rolled-up tail, so the rollup refresh never scans history
+            models.Index(fields=["id"], name="ops_est_rollup_pending_idx", condition=models.Q(rolled_up=False)),
+            models.Index(fields=["accepted_at"], name="ops_est_accepted_idx", condition=models.Q(accepted_at__isnull=False)),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["fingerprint", "dedupe_slot"], name="ops_est_fingerprint_slot_uniq"),
+        ]
+
+
+class EstimateDailyRollup(models.Model):
+    # One row per day/service/frequency; addon=None is "all estimates",
+    # otherwise only estimates that included that add-on.
+    day = models.DateField()
+    service_type = models.CharField(max_length=20, choices=Estimate.SERVICE_CHOICES)
+    frequency = models.CharField(max_length=20, choices=Estimate.FREQ_CHOICES)
+    addon = models.ForeignKey(AddOn, null=True, blank=True, on_delete=models.CASCADE)
+
+    count = models.PositiveIntegerField(default=0)
+    hours_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    value_sum = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    @property
+    def avg_hours(self):
+        return (self.hours_sum / self.count).quantize(Decimal("0.01")) if self.count else None
+
+    def __str__(self):
+        return f"{self.day} {self.service_type}/{self.frequency}" + (f" +{self.addon}" if self.addon_id else "")
+
+    class Meta:
+        verbose_name = "Estimate daily rollup"
+        verbose_name_plural = "Estimate daily rollups"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "service_type", "frequency"],
+                condition=models.Q(addon__isnull=True),
+                name="ops_rollup_uniq_all",
+            ),
+            models.UniqueConstraint(
+                fields=["day", "service_type", "frequency", "addon"],
+                condition=models.Q(addon__isnull=False),
+                name="ops_rollup_uniq_addon",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["-day"], name="ops_rollup_day_idx"),
+        ]
+
+
+class Crew(models.Model):
+    name = models.CharField(max_length=100)
+    active = models.BooleanField(default=True)
+    # Working hours in local time, on the listed ISO weekdays (1 = Monday)
+    day_start = models.TimeField(default=time(8, 0))
+    day_end = models.TimeField(default=time(17, 0))
+    workdays = models.CharField(max_length=7, default="12345", help_text="ISO weekdays worked, e.g. 12345 for Mon–Fri")
+
+    def works_on(self, day) -> bool:
+        return str(day.isoweekday()) in self.workdays
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = "Crew"
+        verbose_name_plural = "Crews"
+
+
+class Job(models.Model):
+    STATUS_CHOICES = [
+        ("scheduled", "Scheduled"),
+        ("done", "Done"),
+        ("cancelled", "Cancelled"),
+    ]
+
+    estimate = models.ForeignKey(Estimate, on_delete=models.CASCADE, related_name="jobs")
+    crew = models.ForeignKey(Crew, on_delete=models.PROTECT, related_name="jobs")
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="scheduled")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        start, end = timezone.localtime(self.start), timezone.localtime(self.end)
+        return f"{self.crew} {start:%Y-%m-%d %H:%M}–{end:%H:%M}: {self.estimate}"
+
+    class Meta:
+        verbose_name = "Job"
+        verbose_name_plural = "Jobs"
+        indexes = [
+            models.Index(fields=["crew", "start"], name="ops_job_crew_start_idx"),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(end__gt=models.F("start")), name="ops_job_end_after_start"),
+            # Cancelled jobs stay for the record; an estimate is booked at most once otherwise
+            models.UniqueConstraint(
+                fields=["estimate"], condition=~models.Q(status="cancelled"), name="ops_job_one_live_per_estimate",
+            ),
+        ]
+
+
+class ServicePlan(models.Model):
+    """A recurring visit rule; the visits themselves are expanded on demand (ops.recurrence)."""
+
+    FREQ_CHOICES = [c for c in Estimate.FREQ_CHOICES if c[0] != "one_time"]
+
+    estimate = models.ForeignKey(Estimate, on_delete=models.CASCADE, related_name="plans")
+    crew = models.ForeignKey(Crew, null=True, blank=True, on_delete=models.SET_NULL, related_name="plans")
+    frequency = models.CharField(max_length=20, choices=FREQ_CHOICES)
+    starts_on = models.DateField(help_text="Date of the first visit; later visits keep its weekday or day of month")
+    ends_on = models.DateField(null=True, blank=True, help_text="Last day a visit may fall on; blank = open-ended")
+    start_time = models.TimeField(default=time(9, 0))
+    hours = models.DecimalField(max_digits=5, decimal_places=2)
+    active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.estimate} – {self.get_frequency_display()} from {self.starts_on}"
+
+    class Meta:
+        verbose_name = "Service plan"
+        verbose_name_plural = "Service plans"
+        indexes = [
+            # Windowed lookups: starts_on <= window end AND (ends_on IS NULL OR ends_on >= window start)
+            models.Index(fields=["starts_on", "ends_on"], name="ops_plan_window_idx", condition=models.Q(active=True)),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(ends_on__isnull=True) | models.Q(ends_on__gte=models.F("starts_on")),
+                name="ops_plan_ends_after_start",
+            ),
+        ]
+
+
+class PlanException(models.Model):
+    """One visit of a plan skipped, or moved to another date/time."""
+
+    KIND_CHOICES = [
+        ("skip", "Skip"),
+        ("move", "Reschedule"),
+    ]
+
+    plan = models.ForeignKey(ServicePlan, on_delete=models.CASCADE, related_name="exceptions")
+    occurrence_date = models.DateField(help_text="The date the rule gives for the visit")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    new_date = models.DateField(null=True, blank=True)
+    new_start_time = models.TimeField(null=True, blank=True, help_text="Blank keeps the plan's start time")
+
+    def clean(self):
+        if self.kind == "move":
+            if self.new_date is None:
+                raise ValidationError({"new_date": "A rescheduled visit needs a new date."})
+            limit = getattr(settings, "RECURRENCE_MAX_SHIFT_DAYS", 31)
+            if abs((self.new_date - self.occurrence_date).days) > limit:
+                raise ValidationError({"new_date": f"Move visits at most {limit} days."})
+
+    def __str__(self):
+        if self.kind == "skip":
+            return f"Skip {self.occurrence_date}"
+        return f"Move {self.occurrence_date} to {self.new_date}"
+
+    class Meta:
+        verbose_name = "Plan exception"
+        verbose_name_plural = "Plan exceptions"
+        constraints = [
+            models.UniqueConstraint(fields=["plan", "occurrence_date"], name="ops_plan_exception_uniq"),
+        ]
+
+
+class Notification(models.Model):
+    """Outbox row: an email owed for an estimate, written in the estimate's transaction (ops.outbox)."""
+
+    KIND_CHOICES = [
+        ("office", "Office"),
+        ("customer", "Customer"),
+    ]
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    ]
+
+    estimate = models.ForeignKey(Estimate, on_delete=models.CASCADE, related_name="notifications")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    # Due time; also pushed ahead while a sender holds the row, so a crashed sender's rows come back
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} email for estimate #{self.estimate_id} ({self.status})"
+
+    class Meta:
+        verbose_name = "Notification"
+        verbose_name_plural = "Notifications"
+        indexes = [
+            # The drain only ever looks at due pending rows
+            models.Index(fields=["next_attempt_at"], name="ops_notif_due_idx", condition=models.Q(status="pending")),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["estimate", "kind"], name="ops_notif_estimate_kind_uniq"),
+        ]
+
+
+class ArchiveChunk(models.Model):
+    """A chunk of archived estimates: gzip-compressed NDJSON, one record per line (ops.archive)."""
+
+    month = models.CharField(max_length=7, help_text="Local YYYY-MM the estimates were created in")
+    data = models.BinaryField()
+    count = models.PositiveIntegerField()
+    min_id = models.BigIntegerField()
+    max_id = models.BigIntegerField()
+    first = models.DateTimeField(help_text="Earliest created_at in the chunk")
+    last = models.DateTimeField(help_text="Latest created_at in the chunk")
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.month}: {self.count} estimates #{self.min_id}–#{self.max_id}"
+
+    class Meta:
+        verbose_name = "Archive chunk"
+        verbose_name_plural = "Archive chunks"
+        indexes = [
+            models.Index(fields=["min_id", "max_id"], name="ops_archive_ids_idx"),
+            models.Index(fields=["first", "last"], name="ops_archive_created_idx"),
+        ]
@@ -0,0 +1,200 @@
+"""Transactional outbox for estimate emails.
+
+enqueue() adds the office and customer Notification rows in the estimate's own
+transaction (one INSERT), so a saved estimate always has its emails owed and a
+rolled-back one never does; the request path never talks to SMTP.
+
+The send_notifications command drains due rows. claim() takes a batch with
+SELECT ... FOR UPDATE SKIP LOCKED and pushes its due time out by
+OUTBOX_LEASE_SECONDS, so concurrent senders never share a row and a sender that
+dies mid-batch hands its rows back when the lease runs out (delivery is at
+least once). send_batch() checks the backend connection before each batch
+(reopening it if the server dropped it while the sender was idle), sends each
+message over it and records the outcome: sent, or retried with exponential
+backoff until OUTBOX_MAX_ATTEMPTS, then failed. A connection-level error is
+not the message's fault: it ends the batch, and that message and the rest go
+back to pending as they were, without an attempt counted or a backoff.
+"""
+import logging
+import random
+import smtplib
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Notification
+
+logger = logging.getLogger("ops.outbox")
+
+SUBJECTS = {
+    "office": "New estimate #{pk}: {name} – ${price}",
+    "customer": "Your cleaning estimate: ${price}",
+}
+
+
+def enqueue(estimates, customers: bool = True) -> list:
+    """bulk_create the emails owed for new estimates; call inside the transaction that saves them.
+
+    customers=False queues only the office copies.
+    """
+    if not getattr(settings, "ESTIMATE_NOTIFICATIONS", True):
+        return []
+    office = getattr(settings, "ESTIMATE_OFFICE_EMAIL", "")
+    rows = []
+    for est in estimates:
+        if office:
+            rows.append(Notification(estimate=est, kind="office"))
+        if customers and est.email:
+            rows.append(Notification(estimate=est, kind="customer"))
+    return Notification.objects.bulk_create(rows) if rows else []
+
+
+def claim(limit: int, now=None) -> list:
+    """Lease up to `limit` due notifications to this sender, oldest due first."""
+    now = now or timezone.now()
+    lease = timedelta(seconds=getattr(settings, "OUTBOX_LEASE_SECONDS", 300))
+    with transaction.atomic():
+        ids = list(
+            Notification.objects.filter(status="pending", next_attempt_at__lte=now)
+            .order_by("next_attempt_at", "id")
+            .select_for_update(skip_locked=True)
+            .values_list("id", flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        Notification.objects.filter(id__in=ids).update(next_attempt_at=now + lease)
+    return list(
+        Notification.objects.filter(id__in=ids)
+        .select_related("estimate")
+        .prefetch_related("estimate__addons")
+        .order_by("id")
+    )
+
+
+def build_message(n: Notification) -> EmailMessage:
+    est = n.estimate
+    # Header-safe: a name with a line break would make the subject invalid
+    name = " ".join(est.name.split())
+    subject = SUBJECTS[n.kind].format(pk=est.pk, name=name, price=est.estimated_price)
+    body = render_to_string(f"email/estimate_{n.kind}.txt", {
+        "estimate": est,
+        "addons": [a.name for a in est.addons.all()],
+    })
+    if n.kind == "office":
+        return EmailMessage(
+            subject, body, settings.DEFAULT_FROM_EMAIL, [settings.ESTIMATE_OFFICE_EMAIL],
+            reply_to=[est.email] if est.email else None,
+        )
+    return EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [est.email])
+
+
+def backoff(attempts: int) -> timedelta:
+    base = getattr(settings, "OUTBOX_BACKOFF_SECONDS", 30)
+    cap = getattr(settings, "OUTBOX_BACKOFF_MAX_SECONDS", 3600)
+    # Jitter, so a backlog that failed together doesn't retry in lockstep
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), cap) * random.uniform(0.8, 1.2))
+
+
+def connection_error(e: Exception) -> bool:
+    """True for failures of the mail connection itself rather than of one message."""
+    if isinstance(e, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError,
+                      smtplib.SMTPHeloError, smtplib.SMTPAuthenticationError)):
+        return True
+    if isinstance(e, smtplib.SMTPResponseException) and e.smtp_code == 421:
+        return True  # "service not available, closing transmission channel"
+    # Socket errors and timeouts; other SMTPExceptions (also OSErrors) are about the message
+    return isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException)
+
+
+def _ready(connection):
+    """Make sure the backend has a live session, reopening one the server has dropped."""
+    session = getattr(connection, "connection", None)  # the SMTP backend's smtplib.SMTP, if open
+    if session is not None:
+        try:
+            alive = session.noop()[0] == 250
+        except Exception:
+            alive = False
+        if not alive:
+            try:
+                connection.close()
+            except Exception:
+                connection.connection = None  # close() gave up mid-QUIT; open() needs it cleared
+    connection.open()
+
+
+def _reconnect(connection):
+    # A failed send can leave an SMTP session unusable; start a fresh one for the rest of the batch
+    try:
+        connection.close()
+        connection.open()
+    except Exception:
+        logger.warning("outbox: reconnecting the mail backend failed; next send retries", exc_info=True)
+
+
+def _defer(notifications, error, results):
+    # Due again now, attempts untouched: the next batch tries them on a fresh connection
+    now = timezone.now()
+    for n in notifications:
+        n.next_attempt_at, n.last_error = now, error
+    results["deferred"] += len(notifications)
+    logger.warning("outbox: mail connection failed, %d notifications left pending: %s", len(notifications), error)
+
+
+def send_batch(notifications, connection) -> Counter:
+    """Send claimed notifications over the connection and record each outcome.
+
+    results["deferred"] counts those put back untried after a connection-level error.
+    """
+    max_attempts = getattr(settings, "OUTBOX_MAX_ATTEMPTS", 8)
+    results = Counter()
+    try:
+        _ready(connection)
+        todo = notifications
+    except Exception as e:
+        _defer(notifications, f"{type(e).__name__}: {e}"[:2000], results)
+        todo = []
+    for i, n in enumerate(todo):
+        try:
+            if not connection.send_messages([build_message(n)]):
+                raise RuntimeError("mail backend accepted no messages")
+        except Exception as e:
+            if connection_error(e):
+                _defer(todo[i:], f"{type(e).__name__}: {e}"[:2000], results)
+                break
+            n.attempts += 1
+            n.last_error = f"{type(e).__name__}: {e}"[:2000]
+            if n.attempts >= max_attempts:
+                n.status = "failed"
+                results["failed"] += 1
+                logger.error("outbox: giving up on %s after %d attempts: %s", n, n.attempts, n.last_error)
+            else:
+                n.next_attempt_at = timezone.now() + backoff(n.attempts)
+                results["retried"] += 1
+                logger.warning("outbox: %s failed (attempt %d): %s", n, n.attempts, n.last_error)
+            _reconnect(connection)
+        else:
+            n.attempts += 1
+            n.status, n.sent_at, n.last_error = "sent", timezone.now(), ""
+            results["sent"] += 1
+    Notification.objects.bulk_update(notifications, ["status", "attempts", "next_attempt_at", "last_error", "sent_at"])
+    return results
+
+
+def drain(connection, batch_size: int = None) -> Counter:
+    """Send everything due now, batch by batch, over one connection.
+
+    Stops early when the connection fails; the deferred rows are due again at once.
+    """
+    batch_size = batch_size or getattr(settings, "OUTBOX_BATCH_SIZE", 50)
+    totals = Counter()
+    while True:
+        batch = claim(batch_size)
+        if batch:
+            totals += send_batch(batch, connection)
+        if len(batch) < batch_size or totals["deferred"]:
+            return totals
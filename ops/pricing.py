@@ -0,0 +1,162 @@
+import hashlib
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Mapping
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import PricingSettings
+
+# Shared version stamp. Every worker compares it against the snapshot it holds
+# and only goes back to the database when the stamp has moved. A snapshot's own
+# version is the stamp plus a digest of what was loaded, so a reload after
+# PRICING_SNAPSHOT_MAX_AGE that finds different settings under an unchanged
+# stamp (LocMem, where bumps don't cross processes) still gets a new version
+# and never matches quotes memoized from the old settings.
+VERSION_CACHE_KEY = "ops:pricing:version"
+
+
+@dataclass(frozen=True)
+class PricingSnapshot:
+    version: str
+
+    # Hour knobs, already resolved to Decimal (None -> 0)
+    base_hours_res: Decimal
+    hours_per_bedroom: Decimal
+    hours_per_bathroom: Decimal
+    hours_per_500_sqft: Decimal
+    hours_per_level: Decimal
+    pets_extra_hours: Decimal
+    furnished_extra_hours: Decimal
+
+    # "basic"/"deep" -> multiplier, service_type -> multiplier
+    cleanliness_multipliers: Mapping[str, Decimal]
+    property_multipliers: Mapping[str, Decimal]
+
+    # Rates (USD per hour)
+    res_base: Decimal
+    one_time_res: Decimal
+    comm_base: Decimal
+
+    # frequency -> discount fraction, frequency -> residential hourly rate
+    frequency_discounts: Mapping[str, Decimal]
+    residential_hourly: Mapping[str, Decimal]
+
+    # Service area
+    service_radius_miles: int
+    service_zip_center: str
+
+    # The same knobs as scaled integers for the "int" engine (ops.simulator), scaled once here
+    int_knobs: Mapping[str, object] = None
+
+    @classmethod
+    def from_settings(cls, ps: PricingSettings, version: str = "") -> "PricingSnapshot":
+        from .simulator import _knobs  # simulator -> catalog -> pricing
+
+        res_base = Decimal(ps.res_base)
+        discounts = {
+            "weekly": Decimal(ps.weekly_discount or 0) / Decimal("100"),
+            "biweekly": Decimal(ps.biweekly_discount or 0) / Decimal("100"),
+            "monthly": Decimal(ps.monthly_discount or 0) / Decimal("100"),
+        }
+        # Same arithmetic as the old per-request path: discount, then floor at res_base
+        residential = {"one_time": Decimal(ps.one_time_res)}
+        for freq, disc in discounts.items():
+            residential[freq] = max(res_base * (Decimal("1") - disc), res_base)
+
+        return cls(
+            version=version,
+            base_hours_res=Decimal(ps.base_hours_res or 0),
+            hours_per_bedroom=Decimal(ps.hours_per_bedroom or 0),
+            hours_per_bathroom=Decimal(ps.hours_per_bathroom or 0),
+            hours_per_500_sqft=Decimal(ps.hours_per_500_sqft or 0),
+            hours_per_level=Decimal(ps.hours_per_level or 0),
+            pets_extra_hours=Decimal(ps.pets_extra_hours or 0),
+            furnished_extra_hours=Decimal(ps.furnished_extra_hours or 0),
+            cleanliness_multipliers=MappingProxyType({
+                "basic": Decimal(ps.cleanliness_multiplier_basic),
+                "deep": Decimal(ps.cleanliness_multiplier_deep),
+            }),
+            property_multipliers=MappingProxyType({
+                "residential": Decimal(ps.property_multiplier_residential or 1),
+                "commercial": Decimal(ps.property_multiplier_commercial or 1),
+                "construction": Decimal(ps.property_multiplier_construction or 1),
+                "move": Decimal(ps.property_multiplier_move or 1),
+                "church": Decimal(ps.property_multiplier_church or 1),
+            }),
+            res_base=res_base,
+            one_time_res=Decimal(ps.one_time_res),
+            comm_base=Decimal(ps.comm_base),
+            frequency_discounts=MappingProxyType(discounts),
+            residential_hourly=MappingProxyType(residential),
+            service_radius_miles=ps.service_radius_miles,
+            service_zip_center=ps.service_zip_center,
+            int_knobs=MappingProxyType(_knobs(ps)),
+        )
+
+    def clean_multiplier(self, cleanliness_level: str) -> Decimal:
+        key = "deep" if cleanliness_level == "deep" else "basic"
+        return self.cleanliness_multipliers[key]
+
+    def property_multiplier(self, service_type: str) -> Decimal:
+        return self.property_multipliers.get(service_type, Decimal("1.00"))
+
+    def hourly_rate(self, service_type: str, frequency: str) -> Decimal:
+        # Discounts only on residential recurring
+        if service_type == "residential":
+            return self.residential_hourly.get(frequency, self.res_base)
+        return self.comm_base
+
+
+# (snapshot, stamp it was loaded under, monotonic load time) for this worker process
+_local = None
+
+
+def _max_age() -> float:
+    return getattr(settings, "PRICING_SNAPSHOT_MAX_AGE", 300)
+
+
+def _digest(values) -> str:
+    return hashlib.blake2b(repr(values).encode(), digest_size=8).hexdigest()
+
+
+def _load(stamp: str) -> PricingSnapshot:
+    ps = PricingSettings.objects.first() or PricingSettings()
+    digest = _digest([getattr(ps, f.attname) for f in PricingSettings._meta.concrete_fields])
+    return PricingSnapshot.from_settings(ps, version=f"{stamp}.{digest}")
+
+
+def current_version() -> str:
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        # Cache was flushed or never primed; first writer wins
+        cache.add(VERSION_CACHE_KEY, uuid4().hex, None)
+        version = cache.get(VERSION_CACHE_KEY)
+    return version
+
+
+def bump_version() -> str:
+    global _local
+    version = uuid4().hex
+    cache.set(VERSION_CACHE_KEY, version, None)
+    _local = None
+    return version
+
+
+def get_snapshot() -> PricingSnapshot:
+    global _local
+    stamp = current_version()
+    now = time.monotonic()
+    if _local is not None:
+        snap, loaded_stamp, loaded_at = _local
+        # The max age is a safety net for per-process caches where another
+        # worker's bump never reaches us.
+        if loaded_stamp == stamp and now - loaded_at < _max_age():
+            return snap
+    snap = _load(stamp)
+    _local = (snap, stamp, now)
+    return snap
@@ -0,0 +1,109 @@
+import threading
+from collections import OrderedDict
+from math import ceil
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def quote_key(*, pricing_version: str, addons_version: str, service_type: str, frequency: str,
+              cleanliness_level: str, bedrooms: int, bathrooms: int, approx_sq_ft: int, levels: int,
+              furnished: bool, pets: bool, addon_ids) -> tuple:
+    # Canonicalize to exactly what the pricing functions can tell apart
+    blocks = ceil((approx_sq_ft or 0) / 500) if approx_sq_ft else 0
+    if service_type != "residential":
+        frequency = ""  # only residential rates depend on frequency
+    # A plain tuple hashes far faster than a formatted string; the shared
+    # cache tier formats it on demand (see _backend_key).
+    return (
+        pricing_version, addons_version,
+        service_type, frequency,
+        cleanliness_level == "deep",
+        bedrooms or 0, bathrooms or 0, blocks, levels or 0,
+        bool(furnished), bool(pets),
+        tuple(sorted(set(addon_ids))) if addon_ids else (),
+    )
+
+
+def _backend_key(key: tuple) -> str:
+    *head, addons = key
+    return "ops:quote:" + ":".join(str(p) for p in head) + ":" + "-".join(str(i) for i in addons)
+
+
+class QuoteCache:
+    """Bounded in-process LRU of (hours, price), optionally backed by a Django cache."""
+
+    def __init__(self, maxsize: int = 4096, alias: str = None, timeout: int = 3600):
+        self.maxsize = maxsize
+        self.alias = alias
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.backend_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+        if self.alias:
+            value = caches[self.alias].get(_backend_key(key))
+            if value is not None:
+                with self._lock:
+                    self.backend_hits += 1
+                self._put(key, value)
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        self._put(key, value)
+        if self.alias:
+            caches[self.alias].set(_backend_key(key), value, self.timeout)
+
+    def _put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.backend_hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.backend_hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "backend": self.alias,
+                "hits": self.hits,
+                "backend_hits": self.backend_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.backend_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+_cache = None
+
+
+def get_quote_cache() -> QuoteCache:
+    global _cache
+    if _cache is None:
+        _cache = QuoteCache(
+            maxsize=getattr(settings, "QUOTE_CACHE_SIZE", 4096),
+            alias=getattr(settings, "QUOTE_CACHE_ALIAS", None),
+            timeout=getattr(settings, "QUOTE_CACHE_TIMEOUT", 3600),
+        )
+    return _cache
@@ -0,0 +1,179 @@
+"""Lazy expansion of ServicePlan rules into visits.
+
+Nothing is stored per visit: a plan is a rule (frequency from starts_on until
+ends_on) plus PlanException rows for skipped or moved visits. expand() jumps
+straight to the first rule date in the window and yields visits in time order;
+visits_between() picks only the plans active in the window (ops_plan_window_idx)
+and merges their expansions lazily.
+
+Windows are inclusive dates. A moved visit shows on its new date, which is at
+most RECURRENCE_MAX_SHIFT_DAYS from the rule date, so plans and rule dates
+are looked up with that much slack around the window.
+"""
+import calendar
+import heapq
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from math import ceil
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Job, PlanException, ServicePlan
+
+STEP_DAYS = {"weekly": 7, "biweekly": 14}
+
+
+@dataclass(frozen=True, order=True)
+class Visit:
+    start: datetime
+    end: datetime = field(compare=False)
+    plan: ServicePlan = field(compare=False)
+    rule_date: date = field(compare=False)
+    moved: bool = field(default=False, compare=False)
+
+
+def _shift_days() -> int:
+    return getattr(settings, "RECURRENCE_MAX_SHIFT_DAYS", 31)
+
+
+def _add_months(d: date, months: int, day: int) -> date:
+    y, m = divmod(d.month - 1 + months, 12)
+    year, month = d.year + y, m + 1
+    return date(year, month, min(day, calendar.monthrange(year, month)[1]))
+
+
+def rule_dates(plan: ServicePlan, first: date, last: date):
+    """Dates the rule gives within [first, last], without walking from starts_on."""
+    first = max(first, plan.starts_on)
+    if plan.ends_on is not None:
+        last = min(last, plan.ends_on)
+    if first > last:
+        return
+    step = STEP_DAYS.get(plan.frequency)
+    if step:
+        d = plan.starts_on + timedelta(days=ceil((first - plan.starts_on).days / step) * step)
+        while d <= last:
+            yield d
+            d += timedelta(days=step)
+    elif plan.frequency == "monthly":
+        s = plan.starts_on
+        k = (first.year - s.year) * 12 + (first.month - s.month)
+        if _add_months(s, k, s.day) < first:
+            k += 1
+        while True:
+            d = _add_months(s, k, s.day)
+            if d > last:
+                return
+            yield d
+            k += 1
+
+
+def next_rule_date(frequency: str, after: date) -> date:
+    """The date one period after `after`, as the rule for `frequency` would step."""
+    step = STEP_DAYS.get(frequency)
+    if step:
+        return after + timedelta(days=step)
+    return _add_months(after, 1, after.day)
+
+
+def _visit(plan, rule_date, on, at, moved, tz):
+    start = timezone.make_aware(datetime.combine(on, at), tz)
+    return Visit(start, start + timedelta(hours=float(plan.hours)), plan, rule_date, moved)
+
+
+def expand(plan: ServicePlan, first: date, last: date, exceptions=None):
+    """Yield the plan's visits that fall on [first, last], in start order.
+
+    `exceptions` maps rule date -> PlanException; when None they are loaded.
+    A visit can be moved earlier than rule dates already scanned, so visits
+    wait in a heap until the scan is further past them than any move goes back.
+    """
+    if exceptions is None:
+        exceptions = {e.occurrence_date: e for e in plan.exceptions.all()}
+    tz = timezone.get_current_timezone()
+    moves = [e for e in exceptions.values() if e.kind == "move" and e.new_date is not None]
+    slack = timedelta(days=_shift_days()) if moves else timedelta(0)
+    back = timedelta(days=max([(e.occurrence_date - e.new_date).days for e in moves] + [0]))
+    pending = []  # visits waiting until nothing scanned later can come before them
+    for d in rule_dates(plan, first - slack, last + slack):
+        while pending and pending[0].start.date() < d - back:
+            yield heapq.heappop(pending)
+        exc = exceptions.get(d)
+        if exc is not None and exc.kind == "skip":
+            continue
+        if exc is not None and exc.kind == "move":
+            if first <= exc.new_date <= last:
+                heapq.heappush(pending, _visit(plan, d, exc.new_date, exc.new_start_time or plan.start_time, True, tz))
+            continue
+        if first <= d <= last:
+            heapq.heappush(pending, _visit(plan, d, d, plan.start_time, False, tz))
+    while pending:
+        yield heapq.heappop(pending)
+
+
+def active_plans(first: date, last: date, slack_days: int = None):
+    """Plans whose rule can put a visit in [first, last]; served by ops_plan_window_idx."""
+    slack = timedelta(days=_shift_days() if slack_days is None else slack_days)
+    return ServicePlan.objects.filter(
+        Q(ends_on__isnull=True) | Q(ends_on__gte=first - slack),
+        active=True,
+        starts_on__lte=last + slack,
+    )
+
+
+def visits_between(first: date, last: date, plans=None):
+    """All visits on [first, last] across active plans, merged in start order.
+
+    Two queries (plans, then their exceptions); everything else is lazy.
+    """
+    if plans is None:
+        plans = active_plans(first, last).select_related("estimate", "crew")
+    plans = list(plans)
+    by_plan = defaultdict(dict)
+    for exc in PlanException.objects.filter(plan__in=plans):
+        by_plan[exc.plan_id][exc.occurrence_date] = exc
+    return heapq.merge(*(expand(p, first, last, by_plan[p.pk]) for p in plans))
+
+
+def start_plans(estimates) -> list:
+    """bulk_create a plan for each recurring estimate that has none yet.
+
+    With a live job, the plan continues from it: its first visit is one period
+    after the job, at the job's time and with its crew (the job itself stays
+    the one appointment for that day). Otherwise it starts the day after
+    acceptance at the default start time.
+    """
+    estimates = [e for e in estimates if e.frequency in STEP_DAYS or e.frequency == "monthly"]
+    have = set(
+        ServicePlan.objects.filter(estimate__in=estimates, active=True).values_list("estimate_id", flat=True)
+    )
+    jobs = {
+        j.estimate_id: j
+        for j in Job.objects.filter(estimate__in=estimates).exclude(status="cancelled").order_by("start")
+    }
+    plans = []
+    for est in estimates:
+        if est.pk in have or est.hours is None:
+            continue
+        job = jobs.get(est.pk)
+        plan = ServicePlan(estimate=est, frequency=est.frequency, hours=est.hours)
+        if job is not None:
+            local = timezone.localtime(job.start)
+            plan.starts_on = next_rule_date(est.frequency, local.date())
+            plan.start_time, plan.crew_id = local.time(), job.crew_id
+        else:
+            plan.starts_on = timezone.localtime(est.accepted_at or timezone.now()).date() + timedelta(days=1)
+        plans.append(plan)
+    return ServicePlan.objects.bulk_create(plans)
+
+
+def hours_by_day(first: date, last: date, plans=None):
+    """{(day, crew_id or None): Decimal hours} of recurring work, for capacity planning."""
+    totals = defaultdict(Decimal)
+    for v in visits_between(first, last, plans):
+        totals[(timezone.localtime(v.start).date(), v.plan.crew_id)] += v.plan.hours
+    return dict(totals)
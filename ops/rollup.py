@@ -0,0 +1,139 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Estimate, EstimateDailyRollup
+
+
+def _bucket(rows, addon_map):
+    # (day, service_type, frequency, addon_id|None) -> [count, hours_sum, value_sum]
+    totals = defaultdict(lambda: [0, Decimal("0"), Decimal("0")])
+    for pk, created_at, st, fr, hours, price in rows:
+        day = timezone.localdate(created_at) if timezone.is_aware(created_at) else created_at.date()
+        hours, price = hours or Decimal("0"), price or Decimal("0")
+        for addon_id in [None] + addon_map.get(pk, []):
+            t = totals[(day, st, fr, addon_id)]
+            t[0] += 1
+            t[1] += hours
+            t[2] += price
+    return totals
+
+
+def _upsert(totals):
+    for (day, st, fr, addon_id), (count, hours, value) in totals.items():
+        lookup = dict(day=day, service_type=st, frequency=fr, addon_id=addon_id)
+        bump = dict(count=F("count") + count, hours_sum=F("hours_sum") + hours, value_sum=F("value_sum") + value)
+        if EstimateDailyRollup.objects.filter(**lookup).update(**bump):
+            continue
+        try:
+            with transaction.atomic():
+                EstimateDailyRollup.objects.create(count=count, hours_sum=hours, value_sum=value, **lookup)
+        except IntegrityError:
+            # Another writer created the row first
+            EstimateDailyRollup.objects.filter(**lookup).update(**bump)
+
+
+def _process(pending) -> int:
+    """Fold a queryset of not-yet-rolled-up estimates into the rollup; caller holds a transaction."""
+    rows = list(
+        pending.select_for_update(skip_locked=True)
+        .values_list("id", "created_at", "service_type", "frequency", "hours", "estimated_price")
+    )
+    if not rows:
+        return 0
+    ids = [r[0] for r in rows]
+    addon_map = defaultdict(list)
+    for est_id, addon_id in Estimate.addons.through.objects.filter(estimate_id__in=ids).values_list("estimate_id", "addon_id"):
+        addon_map[est_id].append(addon_id)
+    _upsert(_bucket(rows, addon_map))
+    Estimate.objects.filter(id__in=ids).update(rolled_up=True)
+    return len(rows)
+
+
+def add(estimates, addon_lists) -> int:
+    """Save path: count estimates just inserted in the caller's transaction, from the values in hand.
+
+    The caller stores them with rolled_up=True, so no later refresh counts them again.
+    """
+    rows = [(i, e.created_at, e.service_type, e.frequency, e.hours, e.estimated_price) for i, e in enumerate(estimates)]
+    if rows:
+        _upsert(_bucket(rows, {i: sorted(set(addons)) for i, addons in enumerate(addon_lists)}))
+    return len(rows)
+
+
+def record(estimate_ids) -> int:
+    """Roll up these estimates if they're still pending (after their add-ons are saved)."""
+    with transaction.atomic():
+        return _process(Estimate.objects.filter(id__in=list(estimate_ids), rolled_up=False))
+
+
+def forget(estimate_ids) -> int:
+    """Subtract already rolled-up estimates that are about to be deleted; caller holds a transaction."""
+    rows = list(
+        Estimate.objects.filter(id__in=list(estimate_ids), rolled_up=True)
+        .select_for_update()
+        .values_list("id", "created_at", "service_type", "frequency", "hours", "estimated_price")
+    )
+    if not rows:
+        return 0
+    addon_map = defaultdict(list)
+    for est_id, addon_id in Estimate.addons.through.objects.filter(
+        estimate_id__in=[r[0] for r in rows]
+    ).values_list("estimate_id", "addon_id"):
+        addon_map[est_id].append(addon_id)
+    for key, (count, hours, value) in _bucket(rows, addon_map).items():
+        day, st, fr, addon_id = key
+        EstimateDailyRollup.objects.filter(day=day, service_type=st, frequency=fr, addon_id=addon_id).update(
+            count=F("count") - count, hours_sum=F("hours_sum") - hours, value_sum=F("value_sum") - value,
+        )
+    return len(rows)
+
+
+def retract(estimate_ids) -> int:
+    """Take estimates out of the rollup before their hours, price, type or add-ons change.
+
+    Caller holds a transaction. They are pending again afterwards; record() (or
+    the next refresh) counts them with their new values.
+    """
+    ids = list(estimate_ids)
+    n = forget(ids)
+    if n:
+        Estimate.objects.filter(id__in=ids, rolled_up=True).update(rolled_up=False)
+    return n
+
+
+def refresh(chunk_size: int = 2000) -> int:
+    """Roll up everything still pending, one transaction per chunk; returns rows processed."""
+    done = 0
+    while True:
+        with transaction.atomic():
+            n = _process(Estimate.objects.filter(rolled_up=False).order_by("id")[:chunk_size])
+        done += n
+        if n < chunk_size:
+            return done
+
+
+def rebuild(chunk_size: int = 2000) -> int:
+    with transaction.atomic():
+        EstimateDailyRollup.objects.all().delete()
+        Estimate.objects.filter(rolled_up=True).update(rolled_up=False)
+        # Archived estimates left the table but still count (ops.archive imports this module)
+        from .archive import iter_records, to_estimate
+
+        done, chunk = 0, []
+        for record in iter_records():
+            chunk.append(to_estimate(record))
+            if len(chunk) >= chunk_size:
+                done += _fold_archived(chunk)
+                chunk = []
+        done += _fold_archived(chunk)
+    return done + refresh(chunk_size)
+
+
+def _fold_archived(estimates) -> int:
+    rows = [(e.pk, e.created_at, e.service_type, e.frequency, e.hours, e.estimated_price) for e in estimates]
+    _upsert(_bucket(rows, {e.pk: e.archived_addons for e in estimates}))
+    return len(rows)
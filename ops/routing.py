@@ -0,0 +1,234 @@
+"""Daily route batching: group a day's stops by proximity and order each group.
+
+A day's stops are its scheduled jobs plus recurring plan visits (ops.recurrence),
+one stop per estimate (a job wins over a plan visit for the same estimate),
+located by ZIP centroid (ops.geo). One great-circle distance matrix is built for
+the depot (PricingSettings.service_zip_center) and every distinct ZIP of the
+day; stops sharing a ZIP share a node.
+
+Customers have been given their start times, so a route keeps stops in booked
+order up to the arrival window they were promised: a group is cut into time
+windows (stops starting within ROUTE_WINDOW_MINUTES, an hour by default, of
+the window's first stop) and only the stops inside a window are reordered by
+distance, by nearest neighbour from where the previous
+window ended and then 2-opt, both reading rows of that matrix. A 2-opt pass is
+one vectorised scan per tour position, so a few hundred stops take milliseconds.
+
+By default a group is a crew as booked, plus one group for visits without a
+crew. regroup=True instead sweeps every stop around the depot into contiguous
+sectors of roughly equal hours, one per crew working that day.
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from operator import attrgetter
+
+import numpy as np
+from django.conf import settings
+
+from .geo import get_table
+from .models import Crew, Estimate, Job, PricingSettings
+from .recurrence import visits_between
+from .scheduling import horizon_start
+
+
+@dataclass
+class Stop:
+    estimate: Estimate
+    crew: Crew
+    start: datetime
+    end: datetime
+    kind: str  # "job" or "visit"
+    node: int = -1  # row in the day's distance matrix; -1 = ZIP not in the table
+
+    @property
+    def hours(self) -> float:
+        return (self.end - self.start).total_seconds() / 3600
+
+
+@dataclass
+class Route:
+    label: str
+    crew: Crew
+    stops: list = field(default_factory=list)
+    legs: list = field(default_factory=list)  # miles driven to reach each stop
+    miles: float = 0.0  # whole loop, back to the depot included
+
+    @property
+    def drive_minutes(self) -> float:
+        return self.miles / getattr(settings, "ROUTE_AVG_MPH", 30) * 60
+
+    @property
+    def hours(self) -> float:
+        return sum(s.hours for s in self.stops)
+
+    @property
+    def rows(self) -> list:
+        return list(zip(self.stops, self.legs))
+
+
+def day_stops(day: date) -> list:
+    """Scheduled jobs starting on `day` and the recurring visits on it, one stop per estimate.
+
+    A plan visit for an estimate that already has a job that day is the same
+    appointment, so only the job is kept.
+    """
+    first = horizon_start(day)
+    jobs = (
+        Job.objects.filter(start__gte=first, start__lt=first + timedelta(days=1), status="scheduled")
+        .select_related("estimate", "crew")
+        .order_by("start")
+    )
+    stops = [Stop(j.estimate, j.crew, j.start, j.end, "job") for j in jobs]
+    seen = {s.estimate.pk for s in stops}
+    for v in visits_between(day, day):
+        if v.plan.estimate_id not in seen:
+            seen.add(v.plan.estimate_id)
+            stops.append(Stop(v.plan.estimate, v.plan.crew, v.start, v.end, "visit"))
+    return stops
+
+
+def distance_matrix(stops, depot_zip):
+    """Set each stop's node and return (miles, lat, lon) over the nodes; node 0 is the depot.
+
+    With the depot's ZIP unknown, node 0 is a free point (zero miles to
+    everything), which turns every closed tour into an open route.
+    """
+    table = get_table()
+    rows, nodes = [], {}
+    for stop in stops:
+        i = table.index_of(stop.estimate.zip_code)
+        if i >= 0 and i not in nodes:
+            nodes[i] = len(rows) + 1
+            rows.append(i)
+        stop.node = nodes.get(i, -1)
+    depot = table.index_of(depot_zip)
+    n = len(rows) + 1
+    dist = np.zeros((n, n))
+    lat, lon = np.zeros(n), np.zeros(n)
+    lat[1:], lon[1:] = table.lat[rows], table.lon[rows]
+    if depot >= 0:
+        lat[0], lon[0] = table.lat[depot], table.lon[depot]
+        dist[:] = table.distances([depot] + rows)
+    elif rows:
+        lat[0], lon[0] = lat[1:].mean(), lon[1:].mean()
+        dist[1:, 1:] = table.distances(rows)
+    return dist, lat, lon
+
+
+def nearest_neighbour(dist, nodes) -> list:
+    """Tour from node 0 that always drives to the closest node not yet visited."""
+    left = np.asarray(list(nodes), dtype=np.intp)
+    tour, here = [0], 0
+    while left.size:
+        k = int(np.argmin(dist[here, left]))
+        here = int(left[k])
+        tour.append(here)
+        left = np.delete(left, k)
+    return tour
+
+
+def two_opt(dist, tour, max_passes=50) -> list:
+    """Reverse tour segments while any reversal shortens the closed loop; node 0 stays first."""
+    path = np.asarray(tour + [tour[0]], dtype=np.intp)
+    m = len(path)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, m - 2):
+            # Reversing path[i..j] swaps edges (a, b), (c, e) for (a, c), (b, e), for every j at once
+            a, b = path[i - 1], path[i]
+            c, e = path[i + 1:m - 1], path[i + 2:m]
+            delta = dist[a, c] + dist[b, e] - dist[a, b] - dist[c, e]
+            k = int(np.argmin(delta))
+            if delta[k] < -1e-9:
+                j = i + 1 + k
+                path[i:j + 1] = path[i:j + 1][::-1]
+                improved = True
+        if not improved:
+            break
+    return path[:-1].tolist()
+
+
+def sweep(stops, lat, lon, groups: int) -> list:
+    """Split located stops into angular sectors around node 0 with roughly equal hours each."""
+    if not stops:
+        return []
+    nodes = np.array([s.node for s in stops])
+    dy = lat[nodes] - lat[0]
+    dx = (lon[nodes] - lon[0]) * np.cos(np.radians(lat[0]))
+    angle = np.arctan2(dy, dx)
+    order = np.argsort(angle, kind="stable")
+    # Start the sweep just past the widest empty sector, so no group straddles it
+    gaps = np.diff(np.append(angle[order], angle[order[0]] + 2 * np.pi))
+    order = np.roll(order, -(int(np.argmax(gaps)) + 1))
+    hours = np.array([max(stops[k].hours, 0.0) for k in order])
+    if not hours.sum():
+        hours = np.ones(len(order))
+    mid = np.cumsum(hours) - hours / 2
+    group = np.minimum((mid / hours.sum() * groups).astype(int), groups - 1)
+    return [[stops[k] for k in order[group == g]] for g in range(groups) if (group == g).any()]
+
+
+def time_windows(stops, minutes: int = None) -> list:
+    """Split stops, in start order, into runs that start within `minutes` of the run's first stop."""
+    width = timedelta(minutes=getattr(settings, "ROUTE_WINDOW_MINUTES", 60) if minutes is None else minutes)
+    windows = []
+    for stop in sorted(stops, key=attrgetter("start")):
+        if windows and stop.start - windows[-1][0].start <= width:
+            windows[-1].append(stop)
+        else:
+            windows.append([stop])
+    return windows
+
+
+def _window_order(dist, here, nodes, last: bool) -> list:
+    """Order `nodes` as a path from `here`: nearest neighbour, then 2-opt.
+
+    Runs on the sub-matrix of here + nodes with the legs back to `here`
+    replaced by what follows the window: the drive to the depot after the
+    last window, else nothing (the next window starts wherever this one ends).
+    """
+    index = np.asarray([here] + list(nodes), dtype=np.intp)
+    local = dist[np.ix_(index, index)]
+    local[:, 0] = dist[index, 0] if last else 0.0
+    return [int(index[k]) for k in two_opt(local, nearest_neighbour(local, range(1, len(index))))[1:]]
+
+
+def route(label, crew, stops, dist) -> Route:
+    """Order one group's stops, window by window; stops at the same ZIP in a window go together."""
+    result, prev = Route(label, crew), 0
+    windows = time_windows(stops)
+    for n, window in enumerate(windows, 1):
+        by_node = defaultdict(list)
+        for stop in window:
+            by_node[stop.node].append(stop)
+        order = list(by_node) if len(by_node) == 1 else _window_order(dist, prev, by_node, n == len(windows))
+        for node in order:
+            for k, stop in enumerate(by_node[node]):
+                result.stops.append(stop)
+                result.legs.append(float(dist[prev, node]) if k == 0 else 0.0)
+            prev = node
+    result.miles = sum(result.legs) + float(dist[prev, 0])
+    return result
+
+
+def plan_day(day: date, regroup: bool = False, groups: int = None, stops=None):
+    """(routes, stops whose ZIP isn't in the table) for `day`. Nothing is written."""
+    ps = PricingSettings.objects.first() or PricingSettings()
+    stops = day_stops(day) if stops is None else stops
+    dist, lat, lon = distance_matrix(stops, ps.service_zip_center)
+    located = [s for s in stops if s.node >= 0]
+    unrouted = [s for s in stops if s.node < 0]
+    if regroup:
+        if not groups:
+            groups = sum(1 for c in Crew.objects.filter(active=True) if c.works_on(day))
+        batches = sweep(located, lat, lon, max(groups or 1, 1))
+        return [route(f"Batch {i}", None, b, dist) for i, b in enumerate(batches, 1)], unrouted
+    by_crew = defaultdict(list)
+    for stop in located:
+        by_crew[stop.crew].append(stop)
+    crews = sorted((c for c in by_crew if c is not None), key=attrgetter("name", "pk"))
+    routes = [route(c.name, c, by_crew[c], dist) for c in crews]
+    if by_crew.get(None):
+        routes.append(route("Unassigned", None, by_crew[None], dist))
+    return routes, unrouted
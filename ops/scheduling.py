@@ -0,0 +1,253 @@
+"""Crew scheduling: book accepted estimates into crew working hours.
+
+Time is cut into SCHEDULE_SLOT_MINUTES slots over a horizon of whole days.
+Each crew's horizon is a SlotTree, a segment tree that keeps, per node, the
+free slot count and the longest free run (plus its prefix/suffix runs), so
+"is this range free", "first run of k free slots" and "book this range" are
+all O(log n) in the number of slots, whatever the number of booked jobs.
+Outside working hours is booked up front, which also keeps a job inside one
+working day. An estimate longer than the longest crew day can never fit, so
+schedule() reports it as too long instead of as out of room in the horizon.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from math import ceil
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Crew, Estimate, Job
+from .recurrence import active_plans, visits_between
+
+
+class SlotTree:
+    """Free/busy state of n slots with O(log n) range booking and first-fit search."""
+
+    def __init__(self, n: int):
+        self.n = n
+        size = 1
+        while size < max(n, 1):
+            size *= 2
+        self.size = size
+        # Per node: free count, longest free run, free prefix, free suffix, lazy (None / True=free / False=busy)
+        self.free = [0] * (2 * size)
+        self.best = [0] * (2 * size)
+        self.pre = [0] * (2 * size)
+        self.suf = [0] * (2 * size)
+        self.lazy = [None] * (2 * size)
+        self.width = [0] * (2 * size)
+        for i in range(size):
+            w = 1 if i < n else 0
+            self.width[size + i] = w
+            self.free[size + i] = self.best[size + i] = self.pre[size + i] = self.suf[size + i] = w
+        for i in range(size - 1, 0, -1):
+            self.width[i] = self.width[2 * i] + self.width[2 * i + 1]
+            self._pull(i)
+
+    def _apply(self, i, free: bool):
+        w = self.width[i] if free else 0
+        self.free[i] = self.best[i] = self.pre[i] = self.suf[i] = w
+        if i < self.size:
+            self.lazy[i] = free
+
+    def _push(self, i):
+        if self.lazy[i] is not None:
+            self._apply(2 * i, self.lazy[i])
+            self._apply(2 * i + 1, self.lazy[i])
+            self.lazy[i] = None
+
+    def _pull(self, i):
+        left, right = 2 * i, 2 * i + 1
+        self.free[i] = self.free[left] + self.free[right]
+        self.pre[i] = self.pre[left] if self.pre[left] < self.width[left] else self.width[left] + self.pre[right]
+        self.suf[i] = self.suf[right] if self.suf[right] < self.width[right] else self.width[right] + self.suf[left]
+        self.best[i] = max(self.best[left], self.best[right], self.suf[left] + self.pre[right])
+
+    def _assign(self, i, lo, hi, a, b, free):
+        if b <= lo or hi <= a:
+            return
+        if a <= lo and hi <= b:
+            self._apply(i, free)
+            return
+        self._push(i)
+        mid = (lo + hi) // 2
+        self._assign(2 * i, lo, mid, a, b, free)
+        self._assign(2 * i + 1, mid, hi, a, b, free)
+        self._pull(i)
+
+    def _count_free(self, i, lo, hi, a, b) -> int:
+        if b <= lo or hi <= a:
+            return 0
+        if a <= lo and hi <= b:
+            return self.free[i]
+        self._push(i)
+        mid = (lo + hi) // 2
+        return self._count_free(2 * i, lo, mid, a, b) + self._count_free(2 * i + 1, mid, hi, a, b)
+
+    def book(self, a: int, b: int):
+        self._assign(1, 0, self.size, max(a, 0), min(b, self.n), False)
+
+    def release(self, a: int, b: int):
+        self._assign(1, 0, self.size, max(a, 0), min(b, self.n), True)
+
+    def is_free(self, a: int, b: int) -> bool:
+        return 0 <= a < b <= self.n and self._count_free(1, 0, self.size, a, b) == b - a
+
+    def first_fit(self, k: int):
+        """Start of the leftmost run of k free slots, or None."""
+        if k < 1 or self.best[1] < k:
+            return None
+        i, lo, hi = 1, 0, self.size
+        while i < self.size:
+            self._push(i)
+            mid = (lo + hi) // 2
+            left, right = 2 * i, 2 * i + 1
+            if self.best[left] >= k:
+                i, hi = left, mid
+            elif self.suf[left] + self.pre[right] >= k:
+                return mid - self.suf[left]
+            else:
+                i, lo = right, mid
+        return lo
+
+
+@dataclass
+class Booking:
+    estimate: Estimate
+    crew: Crew
+    start: datetime
+    end: datetime
+
+
+class Scheduler:
+    """Crew availability over [start, start + days) built from crews and already booked jobs."""
+
+    def __init__(self, start: datetime, days: int, crews, jobs=(), slot_minutes: int = None):
+        self.slot = timedelta(minutes=slot_minutes or getattr(settings, "SCHEDULE_SLOT_MINUTES", 15))
+        self.start = start
+        self.days = days
+        self.n = int(timedelta(days=days) / self.slot)
+        self.crews = {c.pk: c for c in crews}
+        self.trees = {pk: self._working_hours(c) for pk, c in self.crews.items()}
+        # Longest single working day any crew has, in slots; no job can be longer
+        self.day_slots = max((
+            int((datetime.combine(start.date(), c.day_end) - datetime.combine(start.date(), c.day_start)) / self.slot)
+            for c in self.crews.values() if c.workdays
+        ), default=0)
+        for job in jobs:
+            self.block(job.crew_id, job.start, job.end)
+
+    def block(self, crew_id, start: datetime, end: datetime):
+        """Mark [start, end) busy for a crew (an existing job, a recurring visit)."""
+        tree = self.trees.get(crew_id)
+        if tree is not None:
+            tree.book(self._index(start), self._index_ceil(end))
+
+    def _index(self, when) -> int:
+        return int((when - self.start) / self.slot)
+
+    def _index_ceil(self, when) -> int:
+        return ceil((when - self.start) / self.slot)
+
+    def _at(self, index) -> datetime:
+        return self.start + index * self.slot
+
+    def _working_hours(self, crew: Crew) -> SlotTree:
+        tree = SlotTree(self.n)
+        tree.book(0, self.n)
+        tz = timezone.get_current_timezone()
+        first_day = timezone.localtime(self.start, tz).date()
+        for d in range(self.days + 1):
+            day = first_day + timedelta(days=d)
+            if not crew.works_on(day):
+                continue
+            opens = timezone.make_aware(datetime.combine(day, crew.day_start), tz)
+            closes = timezone.make_aware(datetime.combine(day, crew.day_end), tz)
+            tree.release(self._index_ceil(max(opens, self.start)), self._index(closes))
+        return tree
+
+    def slots_for(self, hours) -> int:
+        return max(ceil(timedelta(hours=float(hours or 0)) / self.slot), 1)
+
+    def fits_a_day(self, estimate: Estimate) -> bool:
+        # With no working crews nothing fits at all; that's "no room", not "too long"
+        return not self.day_slots or self.slots_for(estimate.hours) <= self.day_slots
+
+    def is_free(self, crew_id, start: datetime, end: datetime) -> bool:
+        tree = self.trees.get(crew_id)
+        return tree is not None and tree.is_free(self._index(start), self._index_ceil(end))
+
+    def book(self, estimate: Estimate):
+        """Earliest slot across crews that fits the estimate's hours; books it, or returns None."""
+        k = self.slots_for(estimate.hours)
+        fits = []
+        for crew_id, tree in self.trees.items():
+            at = tree.first_fit(k)
+            if at is not None:
+                fits.append((at, crew_id))
+        if not fits:
+            return None
+        at, crew_id = min(fits)
+        self.trees[crew_id].book(at, at + k)
+        return Booking(estimate, self.crews[crew_id], self._at(at), self._at(at + k))
+
+
+def backlog():
+    """Accepted estimates with no live job, oldest acceptance first."""
+    live = Job.objects.filter(estimate=OuterRef("pk")).exclude(status="cancelled")
+    return (
+        Estimate.objects.filter(accepted_at__isnull=False)
+        .filter(~Exists(live))
+        .order_by("accepted_at", "id")
+    )
+
+
+def horizon_start(day=None) -> datetime:
+    """Local midnight of `day` (default: tomorrow) as an aware datetime."""
+    day = day or timezone.localdate() + timedelta(days=1)
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def schedule(start: datetime, days: int = 7, estimate_ids=None, dry_run: bool = False):
+    """Book the backlog (or the part of it in estimate_ids) into [start, start + days) in one pass.
+
+    Returns (bookings, unplaced, too_long): estimates that found no room in the
+    horizon, and estimates longer than any crew's working day, which no horizon
+    can fit and which need booking by hand.
+
+    Crews are locked for the run so two schedulers can't hand out the same slot,
+    and the backlog is read once the lock is held, so an estimate another run
+    has just booked is no longer in it. The new jobs are written with one
+    bulk_create.
+    """
+    end = start + timedelta(days=days)
+    with transaction.atomic():
+        crews = list(Crew.objects.filter(active=True).order_by("id").select_for_update())
+        jobs = (
+            Job.objects.filter(crew__in=crews, start__lt=end, end__gt=start)
+            .exclude(status="cancelled")
+            .only("crew_id", "start", "end")
+        )
+        scheduler = Scheduler(start, days, crews, jobs)
+        # Recurring visits aren't rows; expand the crews' plans over the window
+        first, last = timezone.localtime(start).date(), timezone.localtime(end - timedelta(microseconds=1)).date()
+        for visit in visits_between(first, last, active_plans(first, last).filter(crew__in=crews)):
+            scheduler.block(visit.plan.crew_id, visit.start, visit.end)
+        todo = backlog().filter(hours__isnull=False)
+        if estimate_ids is not None:
+            todo = todo.filter(pk__in=list(estimate_ids))
+        todo = list(todo)
+        bookings, unplaced, too_long = [], [], []
+        for est in todo:
+            if not scheduler.fits_a_day(est):
+                too_long.append(est)
+                continue
+            booking = scheduler.book(est)
+            (bookings if booking else unplaced).append(booking or est)
+        if not dry_run:
+            Job.objects.bulk_create([
+                Job(estimate=b.estimate, crew=b.crew, start=b.start, end=b.end) for b in bookings
+            ])
+    return bookings, unplaced, too_long
@@ -0,0 +1,19 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import catalog, pricing
+from .models import AddOn, PricingSettings
+
+
+@receiver(post_save, sender=PricingSettings)
+@receiver(post_delete, sender=PricingSettings)
+def pricing_settings_changed(sender, **kwargs):
+    # Bump after commit so no worker reloads the old row under the new stamp
+    transaction.on_commit(pricing.bump_version)
+
+
+@receiver(post_save, sender=AddOn)
+@receiver(post_delete, sender=AddOn)
+def addon_changed(sender, **kwargs):
+    transaction.on_commit(catalog.bump_version)
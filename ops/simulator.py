@@ -0,0 +1,228 @@
+"""Vectorized what-if repricing of the whole Estimate history.
+
+Everything is kept in scaled integers so the results round exactly like the
+Decimal path in ops.views: knobs and hours in hundredths, multipliers in
+hundredths, discounts in hundredths of a percent, and quantize() is
+ROUND_HALF_EVEN on the exact integer product.
+
+The same arithmetic is the "int" PRICING_ENGINE: quotes() prices in-memory
+inputs against the knobs a PricingSnapshot scaled once when it was loaded.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+import numpy as np
+
+from .catalog import get_catalog
+from .models import Estimate, PricingSettings
+
+SERVICE_TYPES = tuple(k for k, _ in Estimate.SERVICE_CHOICES)
+FREQUENCIES = tuple(k for k, _ in Estimate.FREQ_CHOICES)
+
+FEATURE_FIELDS = (
+    "id", "service_type", "frequency", "cleanliness_level",
+    "bedrooms", "bathrooms", "approx_sq_ft", "levels",
+    "furnished", "pets", "estimated_price",
+)
+CODED = ("service", "frequency", "deep", "bedrooms", "bathrooms", "blocks", "levels", "furnished", "pets")
+
+_ST_CODE = {k: i for i, k in enumerate(SERVICE_TYPES)}
+_FR_CODE = {k: i for i, k in enumerate(FREQUENCIES)}
+
+
+def _scaled(value, default=0, scale=100) -> int:
+    d = Decimal(value if value is not None else default) * scale
+    if d != d.to_integral_value():
+        raise ValueError(f"{value!r} has more precision than the pricing fields allow")
+    return int(d)
+
+
+def _round_div(x, d: int):
+    # x / d rounded half-even, exact for int64 (and Python-int object) arrays
+    q, r = x // d, x % d
+    up = (2 * r > d) | ((2 * r == d) & (q % 2 == 1))
+    return q + up
+
+
+def _exact(*arrays):
+    # The arrays as they are when their product fits comfortably in int64, else
+    # as Python-int object arrays, so out-of-range knobs come out exact, not wrapped
+    bound = 1
+    for a in arrays:
+        bound *= int(np.abs(a).max()) if np.size(a) else 0
+    if bound < 2 ** 62:
+        return arrays
+    return tuple(np.asarray(a).astype(object) for a in arrays)
+
+
+def _encode(cols, st, fr, cl, bd, ba, sq, lv, furn, pets):
+    cols["service"].append(_ST_CODE.get(st, len(SERVICE_TYPES)))
+    cols["frequency"].append(_FR_CODE.get(fr, len(FREQUENCIES)))
+    cols["deep"].append(cl == "deep")
+    cols["bedrooms"].append(bd or 0)
+    cols["bathrooms"].append(ba or 0)
+    cols["blocks"].append((sq + 499) // 500 if sq else 0)
+    cols["levels"].append(lv or 0)
+    cols["furnished"].append(bool(furn))
+    cols["pets"].append(bool(pets))
+
+
+def load_features(queryset=None, chunk_size: int = 2000) -> dict:
+    """Stream estimates into columnar int64 arrays (one pass, constant row memory)."""
+    qs = queryset if queryset is not None else Estimate.objects.all()
+    cols = defaultdict(list)
+    ids = []
+    for (pk, st, fr, cl, bd, ba, sq, lv, furn, pets, price) in (
+        qs.order_by("id").values_list(*FEATURE_FIELDS).iterator(chunk_size=chunk_size)
+    ):
+        ids.append(pk)
+        _encode(cols, st, fr, cl, bd, ba, sq, lv, furn, pets)
+        cols["stored_cents"].append(_scaled(price) if price is not None else 0)
+
+    features = {k: np.asarray(cols[k], dtype=np.int64) for k in CODED + ("stored_cents",)}
+    features["id"] = np.asarray(ids, dtype=np.int64)
+
+    # Add-on totals at today's add-on prices; the candidates never change them
+    addon_cents = np.zeros(len(ids), dtype=np.int64)
+    if ids:
+        catalog = get_catalog()
+        price_of = {e.id: e.price_cents for e in catalog.entries}
+        pos = {pk: i for i, pk in enumerate(ids)}
+        through = Estimate.addons.through.objects.filter(estimate__in=qs)
+        for est_id, addon_id in through.values_list("estimate_id", "addon_id").iterator(chunk_size=chunk_size):
+            i = pos.get(est_id)
+            if i is not None:
+                addon_cents[i] += price_of.get(addon_id, 0)
+    features["addon_cents"] = addon_cents
+    return features
+
+
+def features_from(items, catalog=None) -> dict:
+    """Feature arrays for in-memory quote inputs (the keyword arguments of views._quote)."""
+    catalog = catalog or get_catalog()
+    price_of = {e.id: e.price_cents for e in catalog.entries}
+    cols = defaultdict(list)
+    addon_cents = []
+    for kw in items:
+        _encode(cols, kw["service_type"], kw["frequency"], kw["cleanliness_level"], kw["bedrooms"],
+                kw["bathrooms"], kw["approx_sq_ft"], kw["levels"], kw["furnished"], kw["pets"])
+        # Each add-on counts once, as in AddOnCatalog.total()
+        addon_cents.append(sum(price_of.get(i, 0) for i in set(kw["addon_ids"] or ())))
+    features = {k: np.asarray(cols[k], dtype=np.int64) for k in CODED}
+    features["addon_cents"] = np.asarray(addon_cents, dtype=np.int64)
+    return features
+
+
+def _knobs(ps: PricingSettings) -> dict:
+    prop = [
+        _scaled(getattr(ps, f"property_multiplier_{st}") or 1) for st in SERVICE_TYPES
+    ] + [100]  # unknown service type
+    disc = {
+        "weekly": _scaled(ps.weekly_discount, 0),
+        "biweekly": _scaled(ps.biweekly_discount, 0),
+        "monthly": _scaled(ps.monthly_discount, 0),
+    }
+    # Residential hourly by frequency code in 1e-6 dollars: res_base * (1 - d/100), floored
+    res_base = _scaled(ps.res_base) * 10000
+    res_hourly = []
+    for fr in FREQUENCIES + ("",):
+        if fr == "one_time":
+            res_hourly.append(_scaled(ps.one_time_res) * 10000)
+        else:
+            res_hourly.append(max(_scaled(ps.res_base) * (10000 - disc.get(fr, 0)), res_base))
+    return {
+        "base": _scaled(ps.base_hours_res),
+        "bedroom": _scaled(ps.hours_per_bedroom),
+        "bathroom": _scaled(ps.hours_per_bathroom),
+        "block": _scaled(ps.hours_per_500_sqft),
+        "level": _scaled(ps.hours_per_level),
+        "pets": _scaled(ps.pets_extra_hours),
+        "furnished": _scaled(ps.furnished_extra_hours),
+        "clean_basic": _scaled(ps.cleanliness_multiplier_basic),
+        "clean_deep": _scaled(ps.cleanliness_multiplier_deep),
+        "prop": np.asarray(prop, dtype=np.int64),
+        "res_hourly": np.asarray(res_hourly, dtype=np.int64),
+        "comm_hourly": _scaled(ps.comm_base) * 10000,
+    }
+
+
+def reprice(features: dict, ps: PricingSettings = None, knobs: dict = None):
+    """Return (hours in hundredths, price in cents) arrays for one candidate.
+
+    Pass `knobs` (a PricingSnapshot's int_knobs) to skip scaling the settings again.
+    """
+    k = knobs if knobs is not None else _knobs(ps)
+    f = features
+    raw = (
+        k["base"]
+        + k["bedroom"] * f["bedrooms"]
+        + k["bathroom"] * f["bathrooms"]
+        + k["block"] * f["blocks"]
+        + k["level"] * f["levels"]
+        + k["pets"] * f["pets"]
+        + k["furnished"] * f["furnished"]
+    )
+    clean = np.where(f["deep"] == 1, k["clean_deep"], k["clean_basic"])
+    raw, clean, prop = _exact(raw, clean, k["prop"][f["service"]])
+    hours = _round_div(raw * clean * prop, 10000)
+
+    residential = f["service"] == SERVICE_TYPES.index("residential")
+    hourly = np.where(residential, k["res_hourly"][f["frequency"]], k["comm_hourly"])
+    # hourly (1e-6) * hours (1e-2) -> 1e-8 dollars; add-ons lifted to the same scale
+    hourly, scaled_hours = _exact(hourly, hours)
+    price = _round_div(hourly * scaled_hours + f["addon_cents"] * 1000000, 1000000)
+    return hours, price
+
+
+def quotes(items, knobs: dict, catalog=None) -> list:
+    """(hours, price) Decimals for quote inputs in one vectorised pass; same values as the Decimal path."""
+    hours, cents = reprice(features_from(items, catalog), knobs=knobs)
+    return [(Decimal(int(h)).scaleb(-2), Decimal(int(c)).scaleb(-2)) for h, c in zip(hours, cents)]
+
+
+def _summary(features: dict, cents) -> dict:
+    n = len(cents)
+    total = int(cents.sum())
+    by_service = {}
+    for code, st in enumerate(SERVICE_TYPES):
+        mask = features["service"] == code
+        if mask.any():
+            by_service[st] = int(cents[mask].sum())
+    return {"count": n, "total_cents": total, "mean_cents": total / n if n else 0.0, "by_service_cents": by_service}
+
+
+def candidate_from(overrides: dict, base: PricingSettings = None) -> PricingSettings:
+    """Unsaved copy of the current settings with some knobs overridden."""
+    base = base or PricingSettings.objects.first() or PricingSettings()
+    ps = PricingSettings(**{
+        f.attname: getattr(base, f.attname) for f in PricingSettings._meta.concrete_fields if not f.primary_key
+    })
+    for name, value in overrides.items():
+        field = PricingSettings._meta.get_field(name)  # FieldDoesNotExist on typos
+        setattr(ps, field.attname, field.to_python(value))
+    return ps
+
+
+def simulate(candidates, baseline: PricingSettings = None, features: dict = None, queryset=None) -> dict:
+    """Compare candidate PricingSettings against the baseline over one load of the history."""
+    if features is None:
+        features = load_features(queryset)
+    baseline = baseline or PricingSettings.objects.first() or PricingSettings()
+
+    _, base_cents = reprice(features, baseline)
+    base = _summary(features, base_cents)
+    results = []
+    for ps in candidates:
+        _, cents = reprice(features, ps)
+        s = _summary(features, cents)
+        s["delta_total_cents"] = s["total_cents"] - base["total_cents"]
+        s["delta_mean_cents"] = s["mean_cents"] - base["mean_cents"]
+        s["delta_by_service_cents"] = {
+            st: v - base["by_service_cents"].get(st, 0) for st, v in s["by_service_cents"].items()
+        }
+        results.append(s)
+    return {
+        "stored_total_cents": int(features["stored_cents"].sum()),
+        "baseline": base,
+        "candidates": results,
+    }
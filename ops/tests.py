@@ -0,0 +1,516 @@
+import gzip
+import json
+import random
+import smtplib
+import tempfile
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+
+from django.db import DatabaseError, OperationalError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import archive, catalog, dedupe, outbox, recurrence, rollup, routing, writer
+from .export import _json_default
+from .models import (
+    AddOn, ArchiveChunk, Crew, Estimate, EstimateDailyRollup, Notification, PlanException, PricingSettings,
+    ServicePlan,
+)
+from .pricing import PricingSnapshot
+from .quotes import get_quote_cache
+from .simulator import load_features, reprice
+from .views import PRICING_FIELDS, _calc_price, _hours_from_details, _pricing_inputs, _quote, _quote_batch
+
+# Unknown keys exercise the fallbacks (default multiplier, base/commercial rate)
+SERVICE_TYPES = [k for k, _ in Estimate.SERVICE_CHOICES] + ["unknown"]
+CLEAN_LEVELS = [k for k, _ in Estimate.CLEAN_CHOICES] + ["unknown"]
+FREQUENCIES = [k for k, _ in Estimate.FREQ_CHOICES] + ["unknown"]
+
+KNOB_FIELDS = [f for f in PricingSettings._meta.concrete_fields if f.get_internal_type() == "DecimalField"]
+
+
+def _random_decimal(rng, field) -> Decimal:
+    # Any value the column can hold, biased towards realistic magnitudes
+    top = 10 ** (field.max_digits - field.decimal_places) - 1
+    whole = rng.choice((0, 1, 2, 5, rng.randint(0, min(top, 300)), rng.randint(0, top)))
+    return Decimal(f"{whole}.{rng.randint(0, 99):02d}")
+
+
+def _random_settings(rng) -> PricingSettings:
+    ps = PricingSettings()
+    for f in KNOB_FIELDS:
+        setattr(ps, f.attname, _random_decimal(rng, f))
+    return ps
+
+
+class SimulatorMatchesDecimalPricingTests(TestCase):
+    """simulator.reprice() (vectorised int64) must agree with the Decimal request path to the cent."""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(20240611)
+        price = AddOn._meta.get_field("price_flat")
+        AddOn.objects.bulk_create([
+            AddOn(key=f"addon_{i}", name=f"Add-on {i}", price_flat=_random_decimal(rng, price)) for i in range(5)
+        ])
+        addon_ids = list(AddOn.objects.values_list("id", flat=True))
+        estimates = Estimate.objects.bulk_create([
+            Estimate(
+                name=f"Sim {n}", email="", phone="", address="", zip_code="35055",
+                service_type=rng.choice(SERVICE_TYPES),
+                frequency=rng.choice(FREQUENCIES),
+                cleanliness_level=rng.choice(CLEAN_LEVELS),
+                bedrooms=rng.choice((0, 1, 2, 3, 4, rng.randint(0, 50))),
+                bathrooms=rng.choice((0, 1, 2, 3, rng.randint(0, 50))),
+                approx_sq_ft=rng.choice((0, 1, 499, 500, 501, 1000, rng.randint(0, 20000))),
+                levels=rng.choice((0, 1, 2, 3, rng.randint(0, 20))),
+                furnished=rng.random() < 0.5,
+                pets=rng.random() < 0.5,
+            )
+            for n in range(400)
+        ])
+        Through = Estimate.addons.through
+        Through.objects.bulk_create([
+            Through(estimate_id=est.pk, addon_id=addon_id)
+            for est in estimates
+            for addon_id in rng.sample(addon_ids, rng.randint(0, 3))
+        ])
+        catalog.bump_version()
+        cls.seed = rng.randrange(2 ** 32)
+
+    def _assert_matches(self, settings_obj):
+        features = load_features()
+        hours, cents = reprice(features, settings_obj)
+        ps = PricingSnapshot.from_settings(settings_obj)
+        cat = catalog.get_catalog()
+        addons = {}
+        for est_id, addon_id in Estimate.addons.through.objects.values_list("estimate_id", "addon_id"):
+            addons.setdefault(est_id, []).append(addon_id)
+        for i, est in enumerate(Estimate.objects.order_by("id")):
+            want_hours = _hours_from_details(
+                ps, bedrooms=est.bedrooms, bathrooms=est.bathrooms, approx_sq_ft=est.approx_sq_ft,
+                levels=est.levels, furnished=est.furnished, pets=est.pets,
+                cleanliness_level=est.cleanliness_level, service_type=est.service_type,
+            )
+            want_price = _calc_price(
+                ps, service_type=est.service_type, frequency=est.frequency, hours=want_hours,
+                addon_ids=addons.get(est.pk, []), catalog=cat,
+            )
+            self.assertEqual(
+                (int(hours[i]), int(cents[i])), (int(want_hours * 100), int(want_price * 100)),
+                f"estimate {est.pk} ({est.service_type}/{est.frequency}/{est.cleanliness_level})",
+            )
+
+    def test_default_settings(self):
+        self._assert_matches(PricingSettings())
+
+    def test_random_settings(self):
+        rng = random.Random(self.seed)
+        for n in range(25):
+            with self.subTest(settings=n):
+                self._assert_matches(_random_settings(rng))
+
+    def test_int_engine_quotes_like_decimal(self):
+        items = [
+            dict({f: getattr(est, f) for f in PRICING_FIELDS}, addons=[a.pk for a in est.addons.all()])
+            for est in Estimate.objects.prefetch_related("addons").order_by("id")
+        ]
+        rng = random.Random(self.seed)
+        cat = catalog.get_catalog()
+        for n, settings_obj in enumerate([PricingSettings()] + [_random_settings(rng) for _ in range(5)]):
+            ps = PricingSnapshot.from_settings(settings_obj, version=f"engine-{n}")
+            with self.subTest(settings=n):
+                get_quote_cache().clear()
+                # As strings, so "3.0" against "3.00" would fail too
+                want = [(str(h), str(p)) for h, p in _quote_batch(items, ps, cat, engine="decimal")]
+                get_quote_cache().clear()
+                self.assertEqual([(str(h), str(p)) for h, p in _quote_batch(items, ps, cat, engine="int")], want)
+                get_quote_cache().clear()
+                hours, price = _quote(ps, catalog=cat, engine="int", **_pricing_inputs(items[0]))
+                self.assertEqual((str(hours), str(price)), want[0])
+
+
+def _estimate(n=0, **fields) -> Estimate:
+    values = dict(
+        name=f"Customer {n}", email=f"customer{n}@example.com", phone="205-555-0100", address=f"{n} Main St",
+        zip_code="35055", service_type="residential", frequency="one_time", cleanliness_level="average",
+        bedrooms=2, bathrooms=1, approx_sq_ft=1200, levels=1, hours=Decimal("3.00"), estimated_price=Decimal("120.00"),
+    )
+    values.update(fields)
+    return Estimate(**values)
+
+
+@override_settings(DUPLICATE_WINDOW_SECONDS=600)
+class DedupeWindowTests(TestCase):
+    """Keys and fingerprints only find an original within DUPLICATE_WINDOW_SECONDS."""
+
+    def _stored(self, key, age):
+        est = _estimate()
+        when = timezone.now() - age
+        dedupe.stamp(est, [], key=key, when=when)
+        est.save()
+        Estimate.objects.filter(pk=est.pk).update(created_at=when)
+        return est
+
+    def _resubmit(self, key):
+        est = _estimate()
+        dedupe.stamp(est, [], key=key)
+        return est, dedupe.find_original(est)
+
+    def test_replay_within_window_finds_original(self):
+        stored = self._stored("replaykey1", timedelta(seconds=30))
+        _, original = self._resubmit("replaykey1")
+        self.assertEqual(original.pk, stored.pk)
+
+    def test_key_replayed_after_window_is_new(self):
+        # A cached form page can hand back an old key a week later
+        self._stored("replaykey2", timedelta(days=7))
+        est, original = self._resubmit("replaykey2")
+        self.assertIsNone(original)
+        self.assertIsNone(est.idempotency_key)
+        est.save()
+
+    def test_key_with_other_content_is_dropped(self):
+        self._stored("replaykey3", timedelta(seconds=30))
+        est = _estimate(bedrooms=5)
+        dedupe.stamp(est, [], key="replaykey3")
+        self.assertIsNone(dedupe.find_original(est))
+        self.assertIsNone(est.idempotency_key)
+
+    def test_fingerprint_only_within_window(self):
+        recent = self._stored(None, timedelta(seconds=30))
+        self.assertEqual(self._resubmit(None)[1].pk, recent.pk)
+        Estimate.objects.filter(pk=recent.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertIsNone(self._resubmit(None)[1])
+
+    def test_copies_within_one_batch_point_at_the_first(self):
+        batch = [_estimate(), _estimate(), _estimate(n=1)]
+        for est in batch:
+            dedupe.stamp(est, [])
+        self.assertEqual(dedupe.find_originals(batch), [None, batch[0], None])
+
+
+class RecurrenceOrderTests(TestCase):
+    """expand() and visits_between() yield visits in start order, moved ones included."""
+
+    def setUp(self):
+        est = _estimate()
+        est.save()
+        self.plan = ServicePlan.objects.create(
+            estimate=est, frequency="weekly", starts_on=date(2026, 1, 1), start_time=time(9), hours=Decimal("2.00"),
+        )
+
+    def _dates(self, visits):
+        return [timezone.localtime(v.start).date() for v in visits]
+
+    def test_backward_move_across_another_visit(self):
+        # The 15th comes forward to the 3rd, before the 8th that the scan reaches first
+        PlanException.objects.create(plan=self.plan, occurrence_date=date(2026, 1, 15), kind="move",
+                                     new_date=date(2026, 1, 3))
+        got = self._dates(recurrence.expand(self.plan, date(2026, 1, 1), date(2026, 1, 28)))
+        self.assertEqual(got, [date(2026, 1, 1), date(2026, 1, 3), date(2026, 1, 8), date(2026, 1, 22)])
+
+    def test_forward_move_skip_and_merge(self):
+        PlanException.objects.bulk_create([
+            PlanException(plan=self.plan, occurrence_date=date(2026, 1, 1), kind="move", new_date=date(2026, 1, 10)),
+            PlanException(plan=self.plan, occurrence_date=date(2026, 1, 22), kind="skip"),
+        ])
+        other = ServicePlan.objects.create(
+            estimate=self.plan.estimate, frequency="biweekly", starts_on=date(2026, 1, 2), start_time=time(8),
+            hours=Decimal("1.00"),
+        )
+        visits = list(recurrence.visits_between(date(2026, 1, 1), date(2026, 1, 31)))
+        self.assertEqual([v.start for v in visits], sorted(v.start for v in visits))
+        self.assertEqual(
+            [(d, v.plan.pk) for d, v in zip(self._dates(visits), visits)],
+            [(date(2026, 1, 2), other.pk), (date(2026, 1, 8), self.plan.pk), (date(2026, 1, 10), self.plan.pk),
+             (date(2026, 1, 15), self.plan.pk), (date(2026, 1, 16), other.pk), (date(2026, 1, 29), self.plan.pk),
+             (date(2026, 1, 30), other.pk)],
+        )
+
+    def test_visit_moved_out_of_the_window_is_gone(self):
+        PlanException.objects.create(plan=self.plan, occurrence_date=date(2026, 1, 8), kind="move",
+                                     new_date=date(2026, 2, 5))
+        got = self._dates(recurrence.expand(self.plan, date(2026, 1, 1), date(2026, 1, 31)))
+        self.assertEqual(got, [date(2026, 1, 1), date(2026, 1, 15), date(2026, 1, 22), date(2026, 1, 29)])
+
+
+class RoutingTests(TestCase):
+    """Routes shorten crossing tours inside the arrival window and keep booked order outside it."""
+
+    ZIPS = ("60601", "60640", "60614", "60660")  # booked order zigzags north along the lake
+
+    def setUp(self):
+        PricingSettings.objects.create(service_zip_center="60601")
+        self.crew = Crew.objects.create(name="North")
+        self.day = date(2026, 3, 2)
+
+    def _stops(self, minutes_apart):
+        start = timezone.make_aware(datetime.combine(self.day, time(9)))
+        stops = []
+        for n, zip_code in enumerate(self.ZIPS):
+            est = _estimate(n, zip_code=zip_code)
+            est.save()
+            at = start + timedelta(minutes=minutes_apart * n)
+            stops.append(routing.Stop(est, self.crew, at, at + timedelta(minutes=10), "job"))
+        return stops
+
+    def _route(self, stops):
+        [r], unrouted = routing.plan_day(self.day, stops=stops)
+        self.assertEqual(unrouted, [])
+        return r
+
+    def _route_in_order(self, stops):
+        # Miles of the loop driven in booked order, from the same matrix
+        dist, _, _ = routing.distance_matrix(stops, "60601")
+        nodes = [0] + [s.node for s in stops] + [0]
+        return float(sum(dist[a, b] for a, b in zip(nodes, nodes[1:])))
+
+    def test_default_window_uncrosses_the_route(self):
+        stops = self._stops(minutes_apart=15)
+        r = self._route(stops)
+        self.assertEqual([s.estimate.zip_code for s in r.stops], ["60601", "60614", "60640", "60660"])
+        self.assertLess(r.miles, self._route_in_order(stops))
+
+    def test_stops_further_apart_keep_booked_order(self):
+        r = self._route(self._stops(minutes_apart=120))
+        self.assertEqual([s.estimate.zip_code for s in r.stops], list(self.ZIPS))
+
+
+def _saved(n, addon_ids=(), **fields) -> Estimate:
+    # Through the save path the request and the writer use: stamped, rolled up, emails owed
+    est = _estimate(n, **fields)
+    dedupe.stamp(est, list(addon_ids), key=dedupe.new_key())
+    [est] = writer.bulk_insert([est], [list(addon_ids)])
+    return est
+
+
+@mock.patch("ops.writer.close_old_connections")  # would close the test's transaction
+class WriterTests(TestCase):
+    """Transient errors retry the whole batch; anything else is split until the bad records are dead-lettered."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.journal = writer.Journal(tmp.name, fsync=False)
+        self.writer = writer.EstimateWriter(self.journal, batch_ms=0, batch_size=100)
+        self.writer.stop()  # no background thread; batches are written here
+        self.writer._stop.clear()
+
+    def _batch(self, count, bad=()):
+        batch = []
+        for n in range(count):
+            est = _estimate(n)
+            dedupe.stamp(est, [], key=dedupe.new_key())
+            record = writer.to_record(est, [], timezone.now())
+            if n in bad:
+                record["name"] = None  # NOT NULL: fails inside the INSERT, with its batch-mates
+
+            batch.append((self.journal.append(record), record))
+        return batch
+
+    def _dead_letters(self):
+        path = self.journal.dir / "dead-letter.jsonl"
+        return [json.loads(line) for line in path.read_text().splitlines()] if path.exists() else []
+
+    def test_bad_records_are_dead_lettered_and_the_rest_commit(self, _):
+        batch = self._batch(6, bad={1, 4})
+        with self.assertLogs("ops.writer", "ERROR"):
+            self.writer._write(batch)
+        self.assertEqual(Estimate.objects.count(), 4)
+        dead = self._dead_letters()
+        self.assertEqual([d["key"] for d in dead], [batch[1][1]["key"], batch[4][1]["key"]])
+        self.assertTrue(all("error" in d for d in dead))
+        self.assertEqual(self.writer.stats["written"], 4)
+        self.assertEqual(self.writer.stats["dead_lettered"], 2)
+        self.assertEqual(self.journal.dir.joinpath(batch[0][0].name).stat().st_size, 0)  # all accounted for
+
+    def test_transient_error_retries_the_whole_batch(self, _):
+        persist, calls = self.writer._persist, []
+
+        def flaky(records):
+            calls.append(len(records))
+            if len(calls) == 1:
+                raise OperationalError("server closed the connection unexpectedly")
+            persist(records)
+
+        with mock.patch.object(self.writer, "_persist", flaky), \
+                mock.patch.object(self.writer._stop, "wait", return_value=False), self.assertLogs("ops.writer"):
+            self.writer._write(self._batch(3))
+        self.assertEqual(calls, [3, 3])  # retried as it was, never split
+        self.assertEqual(Estimate.objects.count(), 3)
+        self.assertEqual(self._dead_letters(), [])
+        self.assertEqual(self.writer.stats["failures"], 1)
+
+
+class FakeConnection:
+    """Mail backend stand-in: sends `ok` messages, then fails each send with `error`."""
+
+    def __init__(self, ok=None, error=None):
+        self.ok, self.error, self.sent = ok, error, []
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        if self.ok is not None and len(self.sent) >= self.ok:
+            raise self.error
+        self.sent.extend(messages)
+        return len(messages)
+
+
+@override_settings(ESTIMATE_NOTIFICATIONS=True, ESTIMATE_OFFICE_EMAIL="office@example.com", OUTBOX_LEASE_SECONDS=300)
+class OutboxTests(TestCase):
+    """claim() leases rows; a dropped connection defers the rest of the batch without counting attempts."""
+
+    def setUp(self):
+        for n in range(2):
+            _saved(n)  # an office and a customer email each
+        self.now = timezone.now()
+
+    def test_claim_leases_rows_until_the_lease_runs_out(self):
+        claimed = outbox.claim(10, now=self.now)
+        self.assertEqual(len(claimed), 4)
+        lease_end = self.now + timedelta(seconds=300)
+        self.assertEqual(set(Notification.objects.values_list("next_attempt_at", flat=True)), {lease_end})
+        self.assertEqual(outbox.claim(10, now=self.now), [])
+        self.assertEqual(len(outbox.claim(10, now=lease_end)), 4)
+
+    def test_connection_error_defers_the_rest_of_the_batch(self):
+        connection = FakeConnection(ok=1, error=smtplib.SMTPServerDisconnected("gone"))
+        with self.assertLogs("ops.outbox", "WARNING"):
+            results = outbox.send_batch(outbox.claim(10), connection)
+        self.assertEqual(results, Counter(sent=1, deferred=3))
+        rows = list(Notification.objects.order_by("id"))
+        self.assertEqual([(n.status, n.attempts) for n in rows], [("sent", 1)] + [("pending", 0)] * 3)
+        for n in rows[1:]:
+            self.assertLessEqual(n.next_attempt_at, timezone.now())
+            self.assertIn("SMTPServerDisconnected", n.last_error)
+
+    def test_message_error_counts_an_attempt_and_backs_off(self):
+        refused = smtplib.SMTPRecipientsRefused({"customer0@example.com": (550, b"no such user")})
+        connection = FakeConnection(ok=0, error=refused)
+        with mock.patch.object(connection, "send_messages", side_effect=[refused, 1, 1, 1]), \
+                self.assertLogs("ops.outbox", "WARNING"):
+            results = outbox.send_batch(outbox.claim(10), connection)
+        self.assertEqual(results, Counter(sent=3, retried=1))
+        failed = Notification.objects.get(status="pending")
+        self.assertEqual(failed.attempts, 1)
+        self.assertGreater(failed.next_attempt_at, timezone.now())
+
+    def test_drain_stops_at_a_dead_connection(self):
+        with self.assertLogs("ops.outbox", "WARNING"):
+            totals = outbox.drain(FakeConnection(ok=0, error=ConnectionRefusedError()), batch_size=2)
+        self.assertEqual(totals, Counter(deferred=2))
+        self.assertEqual(Notification.objects.filter(status="pending", attempts=0).count(), 4)
+
+
+class RollupTests(TestCase):
+    """EstimateDailyRollup totals follow saves and deletes, and rebuild() recomputes them, archive included."""
+
+    def setUp(self):
+        self.addon = AddOn.objects.create(key="windows", name="Windows", price_flat=Decimal("60.00"))
+        catalog.bump_version()
+        self.estimates = [
+            _saved(0, [self.addon.pk]),
+            _saved(1, hours=Decimal("2.50"), estimated_price=Decimal("95.00")),
+            _saved(2, service_type="commercial", hours=Decimal("4.00"), estimated_price=Decimal("200.00")),
+        ]
+        self.today = timezone.localdate()
+
+    def _totals(self):
+        return {
+            (r.day, r.service_type, r.addon_id): (r.count, r.hours_sum, r.value_sum)
+            for r in EstimateDailyRollup.objects.all() if r.count
+        }
+
+    def test_add_counts_each_save(self):
+        self.assertEqual(self._totals(), {
+            (self.today, "residential", None): (2, Decimal("5.50"), Decimal("215.00")),
+            (self.today, "residential", self.addon.pk): (1, Decimal("3.00"), Decimal("120.00")),
+            (self.today, "commercial", None): (1, Decimal("4.00"), Decimal("200.00")),
+        })
+
+    def test_forget_subtracts_a_deleted_estimate(self):
+        est = self.estimates[0]
+        rollup.forget([est.pk])
+        est.delete()
+        self.assertEqual(self._totals(), {
+            (self.today, "residential", None): (1, Decimal("2.50"), Decimal("95.00")),
+            (self.today, "commercial", None): (1, Decimal("4.00"), Decimal("200.00")),
+        })
+
+    def test_rebuild_recounts_drifted_totals_archive_included(self):
+        old = timezone.now() - timedelta(days=400)
+        Estimate.objects.filter(pk=self.estimates[0].pk).update(created_at=old)
+        self.assertEqual(archive.archive_chunk([self.estimates[0].pk], timezone.now() - timedelta(days=365)), 1)
+        EstimateDailyRollup.objects.update(count=99, hours_sum=0)
+        self.assertEqual(rollup.rebuild(), 3)
+        day = timezone.localdate(old)
+        self.assertEqual(self._totals(), {
+            (day, "residential", None): (1, Decimal("3.00"), Decimal("120.00")),
+            (day, "residential", self.addon.pk): (1, Decimal("3.00"), Decimal("120.00")),
+            (self.today, "residential", None): (1, Decimal("2.50"), Decimal("95.00")),
+            (self.today, "commercial", None): (1, Decimal("4.00"), Decimal("200.00")),
+        })
+
+
+class ArchiveTests(TestCase):
+    """A chunk is archived and deleted together or not at all; import_dir() takes only indexed members, once."""
+
+    def setUp(self):
+        self.addon = AddOn.objects.create(key="oven", name="Oven", price_flat=Decimal("45.00"))
+        self.old = timezone.now() - timedelta(days=400)
+        self.cutoff = timezone.now() - timedelta(days=365)
+        self.ids = [_saved(n, [self.addon.pk] if n == 0 else []).pk for n in range(4)]
+        Estimate.objects.filter(pk__in=self.ids).update(created_at=self.old)
+
+    def test_chunk_moves_rows_and_skips_ones_accepted_since(self):
+        Estimate.objects.filter(pk=self.ids[3]).update(accepted_at=timezone.now())
+        self.assertEqual(archive.archive_chunk(self.ids, self.cutoff), 3)
+        self.assertEqual(list(Estimate.objects.values_list("pk", flat=True)), [self.ids[3]])
+        est, archived = archive.lookup(self.ids[0])
+        self.assertTrue(archived)
+        self.assertEqual((est.name, est.archived_addons), ("Customer 0", [self.addon.pk]))
+        self.assertEqual(archive.lookup(self.ids[3]), (Estimate.objects.get(pk=self.ids[3]), False))
+
+    def test_failed_delete_leaves_no_chunk(self):
+        with mock.patch("django.db.models.query.QuerySet.delete", side_effect=DatabaseError("disk full")):
+            with self.assertRaises(DatabaseError):
+                archive.archive_chunk(self.ids, self.cutoff)
+        self.assertFalse(ArchiveChunk.objects.exists())
+        self.assertEqual(Estimate.objects.count(), 4)
+        self.assertEqual(archive.lookup(self.ids[0])[1], False)
+
+    def _member(self, records) -> bytes:
+        body = "".join(json.dumps(r, default=_json_default) + "\n" for r in records)
+        return gzip.compress(body.encode())
+
+    def test_import_dir_skips_torn_index_and_unindexed_tail(self):
+        rows = list(Estimate.objects.order_by("id").values(*archive.ARCHIVE_FIELDS))
+        for row in rows:
+            row["addons"] = []
+        Estimate.objects.all().delete()
+        # As a crash left the file layout: member 1 indexed, member 2 with a torn
+        # index line, member 3 written but never indexed
+        members = [self._member(rows[:2]), self._member(rows[2:3]), self._member(rows[3:])]
+        month = f"{timezone.localtime(self.old):%Y-%m}"
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        directory = Path(tmp.name)
+        directory.joinpath(f"estimates-{month}.ndjson.gz").write_bytes(b"".join(members))
+        entry = {"offset": 0, "length": len(members[0]), "count": 2, "min_id": rows[0]["id"], "max_id": rows[1]["id"]}
+        torn = json.dumps({"offset": len(members[0]), "length": len(members[1])})[:20]
+        directory.joinpath(f"estimates-{month}.index.ndjson").write_text(json.dumps(entry) + "\n" + torn)
+
+        self.assertEqual(archive.import_dir(directory), 2)
+        self.assertEqual(archive.import_dir(directory), 0)  # a second run adds nothing
+        self.assertEqual([r["id"] for r in archive.iter_records()], self.ids[:2])
+        self.assertIsNone(archive.find(self.ids[2]))
+        self.assertEqual(archive.months(), [month])
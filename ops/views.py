@@ -1,130 +1,505 @@
+import hashlib
+import json
+import time
+from datetime import date, datetime, timezone as dt_timezone
 from decimal import Decimal
 from math import ceil
+from pathlib import Path
+from urllib.parse import urlencode
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core import signing
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse, JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
 from django.shortcuts import render, redirect
-from django.db import models
 from django.urls import reverse
-from .forms import EstimateForm
-from .models import PricingSettings, AddOn, Estimate
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import cache_page
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, last_modified, require_http_methods
+from .forms import EstimateForm, QuoteForm
+from .geo import in_service_area
+from . import dedupe, outbox, recurrence, rollup, simulator, writer
+from .catalog import AddOnCatalog, get_catalog
+from .metrics import expose as metrics_text, phase
+from .models import Estimate
+from .pricing import PricingSnapshot, get_snapshot
+from .quotes import get_quote_cache, quote_key
 
-def _get_settings():
-    ps = PricingSettings.objects.first()
-    if not ps:
-        ps = PricingSettings()
-    return ps
+THANKS_SALT = "ops.estimate_thanks"
+OUTSIDE_AREA_NOTE = (
+    "You appear to be outside our service area. Our office will contact you. "
+    "(You can also call 256-736-9944.)"
+)
 
-def _hours_from_details(ps: PricingSettings, *, bedrooms: int, bathrooms: int, approx_sq_ft: int, levels: int, furnished: bool, pets: bool, cleanliness_level: str, service_type: str) -> Decimal:
+def _hours_from_details(ps: PricingSnapshot, *, bedrooms: int, bathrooms: int, approx_sq_ft: int, levels: int, furnished: bool, pets: bool, cleanliness_level: str, service_type: str) -> Decimal:
     # Base + bedrooms/baths
-    hours = Decimal(ps.base_hours_res or 0)
-    hours += Decimal(ps.hours_per_bedroom or 0) * Decimal(bedrooms or 0)
-    hours += Decimal(ps.hours_per_bathroom or 0) * Decimal(bathrooms or 0)
+    hours = ps.base_hours_res
+    hours += ps.hours_per_bedroom * (bedrooms or 0)
+    hours += ps.hours_per_bathroom * (bathrooms or 0)
 
     # Square footage (per 500 sqft)
     per_500_blocks = ceil((approx_sq_ft or 0) / 500) if approx_sq_ft else 0
-    hours += Decimal(ps.hours_per_500_sqft or 0) * Decimal(per_500_blocks)
+    hours += ps.hours_per_500_sqft * per_500_blocks
 
     # Levels/floors
-    hours += Decimal(ps.hours_per_level or 0) * Decimal(levels or 0)
+    hours += ps.hours_per_level * (levels or 0)
 
     # Extras
     if pets:
-        hours += Decimal(ps.pets_extra_hours or 0)
+        hours += ps.pets_extra_hours
     if furnished:
-        hours += Decimal(ps.furnished_extra_hours or 0)
+        hours += ps.furnished_extra_hours
 
     # Cleanliness multiplier
-    clean_mult = Decimal(ps.cleanliness_multiplier_deep if cleanliness_level == "deep" else ps.cleanliness_multiplier_basic)
-    hours *= clean_mult
+    hours *= ps.clean_multiplier(cleanliness_level)
 
     # Property multiplier
-    prop_map = {
-        "residential": ps.property_multiplier_residential,
-        "commercial":  ps.property_multiplier_commercial,
-        "construction":ps.property_multiplier_construction,
-        "move":        ps.property_multiplier_move,
-        "church":      ps.property_multiplier_church,
-    }
-    hours *= Decimal(prop_map.get(service_type, Decimal("1.00")) or 1)
+    hours *= ps.property_multiplier(service_type)
 
     return hours.quantize(Decimal("0.01"))
 
-def _calc_price(ps: PricingSettings, *, service_type: str, frequency: str, hours: Decimal, addon_ids):
+def _calc_price(ps: PricingSnapshot, *, service_type: str, frequency: str, hours: Decimal, addon_ids, catalog: AddOnCatalog = None):
     # Base hourly rate by service type (discounts only on residential recurring)
-    if service_type == "residential":
-        if frequency == "one_time":
-            hourly = Decimal(ps.one_time_res)
-        else:
-            hourly = Decimal(ps.res_base)
-            disc = Decimal("0")
-            if frequency == "weekly":
-                disc = Decimal(ps.weekly_discount or 0) / Decimal("100")
-            elif frequency == "biweekly":
-                disc = Decimal(ps.biweekly_discount or 0) / Decimal("100")
-            elif frequency == "monthly":
-                disc = Decimal(ps.monthly_discount or 0) / Decimal("100")
-            hourly = hourly * (Decimal("1") - disc)
-            if hourly < Decimal(ps.res_base):
-                hourly = Decimal(ps.res_base)
-    else:
-        hourly = Decimal(ps.comm_base)
+    hourly = ps.hourly_rate(service_type, frequency)
 
     # Add-ons (flat)
-    addons_total = AddOn.objects.filter(id__in=addon_ids).aggregate(
-        total_sum=models.Sum("price_flat")
-    )["total_sum"] or Decimal("0")
+    addons_total = (catalog or get_catalog()).total(addon_ids)
 
     total = (hourly * Decimal(hours)) + Decimal(addons_total)
     return total.quantize(Decimal("0.01"))
 
+def _engine(engine: str = None) -> str:
+    return engine or getattr(settings, "PRICING_ENGINE", "decimal")
+
+def _quote(ps: PricingSnapshot, *, service_type: str, frequency: str, cleanliness_level: str, bedrooms: int, bathrooms: int, approx_sq_ft: int, levels: int, furnished: bool, pets: bool, addon_ids, catalog: AddOnCatalog = None, engine: str = None):
+    # Memoized (hours, price); the key carries both versions so edits invalidate it
+    catalog = catalog or get_catalog()
+    key = quote_key(
+        pricing_version=ps.version,
+        addons_version=catalog.version,
+        service_type=service_type,
+        frequency=frequency,
+        cleanliness_level=cleanliness_level,
+        bedrooms=bedrooms,
+        bathrooms=bathrooms,
+        approx_sq_ft=approx_sq_ft,
+        levels=levels,
+        furnished=furnished,
+        pets=pets,
+        addon_ids=addon_ids,
+    )
+    qc = get_quote_cache()
+    cached = qc.get(key)
+    if cached is not None:
+        return cached
+
+    if _engine(engine) == "int":
+        [(hours, total)] = simulator.quotes([dict(
+            service_type=service_type,
+            frequency=frequency,
+            cleanliness_level=cleanliness_level,
+            bedrooms=bedrooms,
+            bathrooms=bathrooms,
+            approx_sq_ft=approx_sq_ft,
+            levels=levels,
+            furnished=furnished,
+            pets=pets,
+            addon_ids=addon_ids,
+        )], ps.int_knobs, catalog)
+    else:
+        hours = _hours_from_details(
+            ps,
+            bedrooms=bedrooms,
+            bathrooms=bathrooms,
+            approx_sq_ft=approx_sq_ft,
+            levels=levels,
+            furnished=furnished,
+            pets=pets,
+            cleanliness_level=cleanliness_level,
+            service_type=service_type,
+        )
+        total = _calc_price(
+            ps,
+            service_type=service_type,
+            frequency=frequency,
+            hours=hours,
+            addon_ids=addon_ids,
+            catalog=catalog,
+        )
+    qc.set(key, (hours, total))
+    return hours, total
+
+PRICING_FIELDS = (
+    "service_type", "frequency", "cleanliness_level",
+    "bedrooms", "bathrooms", "approx_sq_ft", "levels",
+    "furnished", "pets",
+)
+
+def _pricing_inputs(cleaned_data) -> dict:
+    inputs = {f: cleaned_data[f] for f in PRICING_FIELDS}
+    inputs["addon_ids"] = cleaned_data.get("addons", [])
+    return inputs
+
+def _quote_batch(items, ps: PricingSnapshot = None, catalog: AddOnCatalog = None, engine: str = None):
+    """Price many cleaned inputs against one snapshot and one add-on catalog.
+
+    The "int" engine prices every memo miss in one vectorised simulator pass.
+    """
+    ps = ps or get_snapshot()
+    catalog = catalog or get_catalog()
+    inputs = [_pricing_inputs(cd) for cd in items]
+    if _engine(engine) != "int":
+        return [_quote(ps, catalog=catalog, **kw) for kw in inputs]
+    qc = get_quote_cache()
+    keys = [quote_key(pricing_version=ps.version, addons_version=catalog.version, **kw) for kw in inputs]
+    results = [qc.get(key) for key in keys]
+    missing = [i for i, r in enumerate(results) if r is None]
+    for i, quote in zip(missing, simulator.quotes([inputs[i] for i in missing], ps.int_knobs, catalog)):
+        qc.set(keys[i], quote)
+        results[i] = quote
+    return results
+
+_HOME_TEMPLATE = Path(__file__).resolve().parent / "templates" / "index.html"
+
+def _home_last_modified(request):
+    return datetime.fromtimestamp(_HOME_TEMPLATE.stat().st_mtime, tz=dt_timezone.utc)
+
+@last_modified(_home_last_modified)
+@cache_page(getattr(settings, "HOME_CACHE_SECONDS", 600))
 def home(request):
     return render(request, "index.html")
 
+def _form_version() -> str:
+    # Anything that changes the rendered form: add-on choices and pricing knobs
+    return f"{get_snapshot().version}:{get_catalog().version}"
+
+def _estimate_etag(request):
+    # The unbound form only varies by _form_version() and the CSRF secret in the
+    # visitor's cookie; with no cookie yet there's nothing to revalidate against.
+    # Weak: each render carries a fresh idempotency key, which doesn't change its meaning.
+    csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME)
+    if request.method != "GET" or not csrf_cookie:
+        return None
+    return 'W/"%s"' % hashlib.sha256(f"{_form_version()}:{csrf_cookie}".encode()).hexdigest()[:32]
+
+def _thanks_redirect(est: Estimate):
+    # Hand the result to the thanks page in a signed URL token, not the session
+    token = signing.dumps({"price": str(est.estimated_price), "outside": not est.within_radius}, salt=THANKS_SALT)
+    return redirect(f"{reverse('estimate_thanks')}?{urlencode({'t': token})}")
+
+@condition(etag_func=_estimate_etag)
 def estimate(request):
     if request.method == "POST":
-        form = EstimateForm(request.POST)
-        if form.is_valid():
+        with phase("form_validation"):
+            form = EstimateForm(request.POST)
+            valid = form.is_valid()
+        idempotency_key = dedupe.clean_key(
+            request.POST.get("idempotency_key") or request.headers.get("Idempotency-Key")
+        )
+        if valid:
             est: Estimate = form.save(commit=False)
-            ps = _get_settings()
-
-            computed_hours = _hours_from_details(
-                ps,
-                bedrooms=est.bedrooms,
-                bathrooms=est.bathrooms,
-                approx_sq_ft=est.approx_sq_ft,
-                levels=est.levels,
-                furnished=est.furnished,
-                pets=est.pets,
-                cleanliness_level=est.cleanliness_level,
-                service_type=est.service_type,
-            )
-            est.hours = computed_hours
+            addon_ids = form.cleaned_data.get("addons", [])
+            now = timezone.now()
+            with phase("dedupe"):
+                dedupe.stamp(est, addon_ids, key=idempotency_key, when=now)
+                original = dedupe.find_original(est, when=now)
+            if original is not None:
+                # Resubmission: same answer, nothing written
+                return _thanks_redirect(original)
 
-            total = _calc_price(
-                ps,
-                service_type=est.service_type,
-                frequency=est.frequency,
-                hours=computed_hours,
-                addon_ids=[a.id for a in form.cleaned_data.get("addons", [])],
-            )
-            est.estimated_price = total
-            est.save()
-            form.save_m2m()
-
-            request.session["last_estimate_price"] = str(total)
-            if not form.cleaned_data.get("within_radius"):
-                request.session["estimate_note"] = (
-                    "You appear to be outside our service area. Our office will contact you. "
-                    "(You can also call 256-736-9944.)"
+            with phase("settings"):
+                ps = get_snapshot()
+
+            with phase("pricing"):
+                computed_hours, total = _quote(
+                    ps,
+                    service_type=est.service_type,
+                    frequency=est.frequency,
+                    cleanliness_level=est.cleanliness_level,
+                    bedrooms=est.bedrooms,
+                    bathrooms=est.bathrooms,
+                    approx_sq_ft=est.approx_sq_ft,
+                    levels=est.levels,
+                    furnished=est.furnished,
+                    pets=est.pets,
+                    addon_ids=addon_ids,
                 )
-            else:
-                request.session.pop("estimate_note", None)
+            est.hours = computed_hours
+            est.estimated_price = total
+            # ZIP table decides when it knows the ZIP; else keep the self-reported box
+            auto = in_service_area(est.zip_code, ps)
+            if auto is not None:
+                est.within_radius = auto
+            est.rolled_up = getattr(settings, "ROLLUP_ON_SAVE", True)
+            try:
+                # Row, add-ons, owed emails and the rollup together; the unique
+                # indexes settle a race with an identical submission
+                with transaction.atomic():
+                    with phase("save"):
+                        est.save()
+                    with phase("save_m2m"):
+                        form.save_m2m()
+                    with phase("outbox"):
+                        outbox.enqueue([est])
+                    if est.rolled_up:
+                        with phase("rollup"):
+                            rollup.add([est], [addon_ids])
+            except IntegrityError:
+                original = dedupe.find_original(est)
+                if original is None:
+                    raise
+                return _thanks_redirect(original)
 
-            return redirect(reverse("estimate_thanks"))
+            return _thanks_redirect(est)
     else:
         form = EstimateForm()
+        idempotency_key = None
+
+    return _render_estimate(request, form, idempotency_key)
 
-    return render(request, "estimate.html", {"form": form})
+def _render_estimate(request, form, idempotency_key=None):
+    with phase("render"):
+        return render(request, "estimate.html", {
+            "form": form,
+            "idempotency_key": idempotency_key or dedupe.new_key(),
+            "form_version": _form_version(),
+            "form_cache_seconds": getattr(settings, "ESTIMATE_FORM_CACHE_SECONDS", 3600),
+        })
+
+def _estimate_deferred(request):
+    """POST /estimate/ without waiting on the database: price, journal, queue, redirect."""
+    with phase("form_validation"):
+        form = EstimateForm(request.POST)
+        valid = form.is_valid()
+    idempotency_key = dedupe.clean_key(
+        request.POST.get("idempotency_key") or request.headers.get("Idempotency-Key")
+    )
+    if not valid:
+        return _render_estimate(request, form, idempotency_key)
+
+    est: Estimate = form.save(commit=False)
+    addon_ids = form.cleaned_data.get("addons", [])
+    now = timezone.now()
+    with phase("settings"):
+        ps = get_snapshot()
+    with phase("pricing"):
+        est.hours, est.estimated_price = _quote(ps, **_pricing_inputs(form.cleaned_data))
+    auto = in_service_area(est.zip_code, ps)
+    if auto is not None:
+        est.within_radius = auto
+    # Every journaled record carries a key so a replay can't insert it twice;
+    # duplicates are dropped by the writer, with the same price shown here.
+    dedupe.stamp(est, addon_ids, key=idempotency_key or dedupe.new_key(), when=now)
+    with phase("enqueue"):
+        writer.get_writer().submit(writer.to_record(est, addon_ids, now))
+    return _thanks_redirect(est)
+
+async def estimate_async(request):
+    """/estimate/ for ASGI: GETs as before, POSTs persisted by the background writer.
+
+    Forms and the pricing snapshot are synchronous Django code, so both run in
+    the sync thread; the response no longer waits on any INSERT.
+    """
+    if request.method == "POST":
+        return await sync_to_async(_estimate_deferred)(request)
+    return await sync_to_async(estimate)(request)
 
 def estimate_thanks(request):
-    price = request.session.pop("last_estimate_price", None)
-    note = request.session.pop("estimate_note", None)
+    # Stateless: everything comes from the signed token, so no DB or session access
+    price = note = None
+    try:
+        data = signing.loads(
+            request.GET.get("t", ""), salt=THANKS_SALT, max_age=getattr(settings, "ESTIMATE_TOKEN_MAX_AGE", 3600)
+        )
+    except signing.BadSignature:
+        data = None
+    if isinstance(data, dict):
+        price = data.get("price")
+        if data.get("outside"):
+            note = OUTSIDE_AREA_NOTE
     return render(request, "estimate_thanks.html", {"price": price, "note": note})
+
+def _json_error(message: str, status: int = 400):
+    return JsonResponse({"errors": {"__all__": [{"message": message, "code": "invalid"}]}}, status=status)
+
+# Read-only price preview: no Estimate row, no session, so no CSRF needed
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def quote_api(request):
+    if request.method == "GET":
+        data = request.GET
+    elif request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return _json_error("Invalid JSON.")
+        if not isinstance(data, dict):
+            return _json_error("Expected a JSON object.")
+    else:
+        data = request.POST
+
+    form = QuoteForm(data)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors.get_json_data()}, status=400)
+
+    cd = form.cleaned_data
+    ps = get_snapshot()
+    catalog = get_catalog()
+    addon_ids = cd.get("addons", [])
+    hours, total = _quote(ps, catalog=catalog, **_pricing_inputs(cd))
+    return JsonResponse({
+        "hours": str(hours),
+        "hourly_rate": str(ps.hourly_rate(cd["service_type"], cd["frequency"]).quantize(Decimal("0.01"))),
+        "addons_total": str(catalog.total(addon_ids).quantize(Decimal("0.01"))),
+        "price": str(total),
+        "within_service_area": in_service_area(cd.get("zip_code"), ps),
+    })
+
+def _bulk_caller(request):
+    """(caller id, None) for an allowed /api/estimates/bulk/ caller, else (None, error response)."""
+    # Integrations send the bearer token; a staff session also works, but then
+    # the request has to pass the CSRF check the view is exempt from.
+    token = getattr(settings, "ESTIMATE_BULK_TOKEN", "")
+    if token and constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return "token", None
+    user = request.user
+    if user.is_active and user.is_staff:
+        rejected = CsrfViewMiddleware(lambda r: None).process_view(request, None, (), {})
+        return (None, rejected) if rejected else (f"staff:{user.pk}", None)
+    return None, _json_error("Authentication required.", status=401)
+
+def _take_bulk_quota(caller: str, n: int) -> bool:
+    # Fixed hourly window per caller in the shared cache; False leaves the count as it was
+    limit = getattr(settings, "ESTIMATE_BULK_HOURLY_LIMIT", 2000)
+    if not limit:
+        return True
+    key = f"ops:bulk:quota:{caller}:{int(time.time() // 3600)}"
+    cache.add(key, 0, 3600)
+    try:
+        used = cache.incr(key, n)
+    except ValueError:
+        # Evicted between add and incr
+        cache.set(key, n, 3600)
+        used = n
+    if used > limit:
+        cache.decr(key, n)
+        return False
+    return True
+
+# Many properties in one request: one snapshot, one catalog, bulk inserts.
+# Authenticated (see _bulk_caller), so exempt from the cookie-based CSRF check.
+@csrf_exempt
+@require_http_methods(["POST"])
+def estimate_bulk(request):
+    caller, denied = _bulk_caller(request)
+    if denied:
+        return denied
+    try:
+        items = json.loads(request.body or b"[]")
+    except ValueError:
+        return _json_error("Invalid JSON.")
+    if not isinstance(items, list) or not items:
+        return _json_error("Expected a non-empty JSON array.")
+    max_items = getattr(settings, "ESTIMATE_BULK_MAX", 500)
+    if len(items) > max_items:
+        return _json_error(f"At most {max_items} estimates per request.", status=413)
+
+    bound = [EstimateForm(item if isinstance(item, dict) else {}) for item in items]
+    errors = {i: f.errors.get_json_data() for i, f in enumerate(bound) if not f.is_valid()}
+    if errors:
+        return JsonResponse({"errors": errors}, status=400)
+    if not _take_bulk_quota(caller, len(items)):
+        response = _json_error("Hourly bulk estimate limit reached; try again later.", status=429)
+        response["Retry-After"] = str(3600 - int(time.time()) % 3600)
+        return response
+
+    now = timezone.now()
+    ps = get_snapshot()
+    results = _quote_batch([f.cleaned_data for f in bound], ps=ps)
+    estimates, addon_lists = [], []
+    for item, f, (hours, total) in zip(items, bound, results):
+        est = f.save(commit=False)
+        est.hours = hours
+        est.estimated_price = total
+        auto = in_service_area(est.zip_code, ps)
+        if auto is not None:
+            est.within_radius = auto
+        addon_ids = f.cleaned_data.get("addons", [])
+        dedupe.stamp(est, addon_ids, key=dedupe.clean_key(item.get("idempotency_key")), when=now)
+        estimates.append(est)
+        addon_lists.append(addon_ids)
+
+    try:
+        answered = writer.bulk_insert(
+            estimates, addon_lists, when=now,
+            notify_customers=getattr(settings, "ESTIMATE_BULK_CUSTOMER_EMAILS", False),
+        )
+    except IntegrityError:
+        # Lost a race with an identical submission; a retry replays it
+        return _json_error("A duplicate of one of these estimates was just saved; retry the request.", status=409)
+
+    # Duplicates (of stored rows or of earlier items) answer with the original
+    return JsonResponse({
+        "estimates": [
+            {"id": est.pk, "hours": str(est.hours), "price": str(est.estimated_price),
+             "within_radius": est.within_radius, "duplicate": est is not mine}
+            for est, mine in zip(answered, estimates)
+        ]
+    }, status=201 if any(a is e for a, e in zip(answered, estimates)) else 200)
+
+@staff_member_required
+def quote_cache_stats(request):
+    return JsonResponse(get_quote_cache().stats())
+
+@staff_member_required
+@require_http_methods(["GET"])
+def visits(request):
+    """Recurring visits on [start, end] (inclusive dates), expanded from service plans."""
+    try:
+        first = date.fromisoformat(request.GET.get("start", ""))
+        last = date.fromisoformat(request.GET.get("end", ""))
+    except ValueError:
+        return _json_error("start and end are required, as YYYY-MM-DD.")
+    if not first <= last or (last - first).days > 366:
+        return _json_error("end must be on or after start, at most 366 days later.")
+    crew = request.GET.get("crew")
+    if crew:
+        try:
+            crew = int(crew)
+        except ValueError:
+            crew = 0
+        if not 0 < crew < 2**63:
+            return _json_error("crew must be a crew id.")
+    plans = recurrence.active_plans(first, last).select_related("estimate", "crew")
+    if crew:
+        plans = plans.filter(crew_id=crew)
+    return JsonResponse({
+        "visits": [
+            {
+                "plan": v.plan.pk,
+                "estimate": v.plan.estimate_id,
+                "name": v.plan.estimate.name,
+                "crew": v.plan.crew.name if v.plan.crew else None,
+                "start": v.start.isoformat(),
+                "end": v.end.isoformat(),
+                "hours": str(v.plan.hours),
+                "moved_from": v.rule_date.isoformat() if v.moved else None,
+            }
+            for v in recurrence.visits_between(first, last, plans)
+        ]
+    })
+
+def metrics(request):
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if not token:
+        # Open only for local development; production has to opt in with a token
+        if not settings.DEBUG:
+            raise Http404
+    elif not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponse(status=401)
+    return HttpResponse(metrics_text(), content_type="text/plain; version=0.0.4; charset=utf-8")
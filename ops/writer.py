@@ -0,0 +1,325 @@
+"""Deferred estimate persistence: a per-process background writer with a journal.
+
+The deferred /estimate/ path prices a submission, appends it to an on-disk JSONL
+journal and queues it; a daemon thread drains the queue into one bulk_create
+transaction every ESTIMATE_WRITER_BATCH_MS or ESTIMATE_WRITER_BATCH_SIZE items.
+A journal segment is truncated or deleted once everything in it is committed.
+
+Each process holds an flock on its own segments. On start-up a writer replays
+segments nobody holds (a worker that died with items in flight); records carry
+an idempotency key, so replaying something that did commit is a no-op.
+
+Only connection-level errors (OperationalError, InterfaceError) are retried.
+Any other failure splits the batch until the records that fail on their own
+are found; those go to dead-letter.jsonl in the journal directory (the journal
+record plus an "error" key) and are logged, and the rest commit. Renaming that
+file to estimates-<anything>.jsonl makes the next start-up replay it.
+
+The journal is the only copy of a submission until its batch commits, so it
+needs an explicit, durable ESTIMATE_JOURNAL_DIR; journal_problem() says why
+one can't be used (unset, or a Heroku dyno's ephemeral disk), and the deferred
+path is refused then.
+"""
+import atexit
+import fcntl
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import InterfaceError, OperationalError, close_old_connections, transaction
+
+from . import dedupe, outbox, rollup
+from .models import Estimate
+
+logger = logging.getLogger("ops.writer")
+
+# Worth retrying as-is: the database or the connection to it, not the data
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
+RECORD_FIELDS = (
+    "name", "email", "phone", "address", "zip_code", "within_radius",
+    "service_type", "cleanliness_level", "frequency", "furnished", "pets",
+    "approx_sq_ft", "bedrooms", "bathrooms", "levels",
+)
+
+
+def bulk_insert(estimates, addon_lists, when=None, notify_customers=True):
+    """Insert stamped, priced estimates, their add-ons and their owed emails, skipping duplicates.
+
+    notify_customers=False queues only the office emails. Returns, for each input, the estimate that stands for it: itself when
+    inserted, else the stored (or earlier in the list) original.
+    """
+    originals = dedupe.find_originals(estimates, when=when)
+    fresh = [(est, addons) for est, addons, original in zip(estimates, addon_lists, originals) if original is None]
+    Through = Estimate.addons.through
+    rolled = getattr(settings, "ROLLUP_ON_SAVE", True)
+    with transaction.atomic():
+        for est, _ in fresh:
+            est.rolled_up = rolled
+        Estimate.objects.bulk_create([est for est, _ in fresh])
+        Through.objects.bulk_create([
+            Through(estimate_id=est.pk, addon_id=addon_id)
+            for est, addons in fresh
+            for addon_id in sorted(set(addons))
+        ])
+        outbox.enqueue([est for est, _ in fresh], customers=notify_customers)
+        if rolled:
+            rollup.add([est for est, _ in fresh], [addons for _, addons in fresh])
+    return [original or est for est, original in zip(estimates, originals)]
+
+
+def to_record(est: Estimate, addon_ids, when: datetime) -> dict:
+    record = {f: getattr(est, f) for f in RECORD_FIELDS}
+    record.update(
+        key=est.idempotency_key,
+        at=when.isoformat(),
+        hours=str(est.hours),
+        price=str(est.estimated_price),
+        addons=sorted(set(addon_ids)),
+    )
+    return record
+
+
+def from_record(record: dict):
+    """(stamped Estimate, add-on ids, submission time) from a journal record."""
+    est = Estimate(**{f: record[f] for f in RECORD_FIELDS})
+    est.hours = Decimal(record["hours"])
+    est.estimated_price = Decimal(record["price"])
+    when = datetime.fromisoformat(record["at"])
+    dedupe.stamp(est, record["addons"], key=record["key"], when=when)
+    return est, record["addons"], when
+
+
+class Journal:
+    """Append-only JSONL segments owned (flocked) by this process."""
+
+    def __init__(self, directory, fsync=True, max_bytes=8 << 20):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.fsync = fsync
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._segments = {}  # path -> [file, records not yet committed]
+        self._path = None
+        self._open_segment()
+
+    def _open_segment(self):
+        path = self.dir / f"estimates-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl"
+        f = open(path, "ab")
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._segments[path] = [f, 0]
+        self._path = path
+
+    def append(self, record: dict) -> Path:
+        line = json.dumps(record, separators=(",", ":")).encode() + b"\n"
+        with self._lock:
+            seg = self._segments[self._path]
+            if seg[1] and seg[0].tell() >= self.max_bytes:
+                self._open_segment()
+                seg = self._segments[self._path]
+            seg[0].write(line)
+            seg[0].flush()
+            if self.fsync:
+                os.fsync(seg[0].fileno())
+            seg[1] += 1
+            return self._path
+
+    def committed(self, counts: Counter):
+        with self._lock:
+            for path, n in counts.items():
+                seg = self._segments[path]
+                seg[1] -= n
+                if seg[1]:
+                    continue
+                if path == self._path:
+                    seg[0].truncate(0)
+                else:
+                    seg[0].close()
+                    path.unlink(missing_ok=True)
+                    del self._segments[path]
+
+    def dead_letter(self, record: dict, error: Exception):
+        line = json.dumps(dict(record, error=f"{type(error).__name__}: {error}"), separators=(",", ":")).encode()
+        with self._lock, open(self.dir / "dead-letter.jsonl", "ab") as f:
+            f.write(line + b"\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def orphans(self):
+        """Segments in the directory that no live process holds."""
+        for path in sorted(self.dir.glob("estimates-*.jsonl")):
+            if path in self._segments:
+                continue
+            try:
+                f = open(path, "rb")
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                continue
+            yield path, f
+
+
+class EstimateWriter:
+    def __init__(self, journal: Journal, batch_ms: int, batch_size: int):
+        self.journal = journal
+        self.batch_seconds = batch_ms / 1000
+        self.batch_size = max(batch_size, 1)
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self.stats = Counter()
+        self._thread = threading.Thread(target=self._run, name="ops-estimate-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, record: dict):
+        """Journal a priced submission and queue it for the next batch."""
+        path = self.journal.append(record)
+        self._queue.put((path, record))
+        self.stats["queued"] += 1
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _run(self):
+        try:
+            self.recover()
+        except Exception:
+            logger.exception("estimate writer: journal replay failed; will retry on next start")
+        while not self._stop.is_set() or not self._queue.empty():
+            batch = self._collect()
+            if batch:
+                self._write(batch)
+
+    def _collect(self):
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_seconds
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        # Retry transient errors until the database takes it; the journal still holds the batch meanwhile
+        delay = 0.5
+        while True:
+            close_old_connections()
+            try:
+                dead = self._store([record for _, record in batch])
+                break
+            except TRANSIENT_ERRORS:
+                self.stats["failures"] += 1
+                logger.exception("estimate writer: batch of %d failed; retrying in %.1fs", len(batch), delay)
+                if self._stop.wait(delay):
+                    return  # shutting down; the next worker replays our journal
+                delay = min(delay * 2, 30)
+        self.journal.committed(Counter(path for path, _ in batch))
+        self.stats["batches"] += 1
+        self.stats["written"] += len(batch) - dead
+
+    def _store(self, records):
+        """Persist records, halving around ones that can never be saved; returns how many were dead-lettered.
+
+        Transient errors propagate; halves already committed replay as no-ops.
+        """
+        try:
+            self._persist(records)
+            return 0
+        except TRANSIENT_ERRORS:
+            raise
+        except Exception as e:
+            if len(records) > 1:
+                mid = len(records) // 2
+                return self._store(records[:mid]) + self._store(records[mid:])
+            self.journal.dead_letter(records[0], e)
+            self.stats["dead_lettered"] += 1
+            logger.error("estimate writer: dead-lettered record %s: %s: %s",
+                         records[0].get("key"), type(e).__name__, e)
+            return 1
+
+    def _persist(self, records):
+        rows = [from_record(r) for r in records]
+        latest = max(when for _, _, when in rows)
+        bulk_insert([est for est, _, _ in rows], [addons for _, addons, _ in rows], when=latest)
+
+    def recover(self) -> int:
+        """Replay segments left behind by dead workers; returns records replayed."""
+        replayed = 0
+        for path, f in self.journal.orphans():
+            with f:
+                records = []
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        logger.warning("estimate writer: skipping torn journal line in %s", path)
+                for start in range(0, len(records), self.batch_size):
+                    close_old_connections()
+                    self._store(records[start:start + self.batch_size])
+                replayed += len(records)
+                path.unlink(missing_ok=True)
+            logger.info("estimate writer: replayed %d records from %s", len(records), path)
+        self.stats["replayed"] += replayed
+        return replayed
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        self._thread.join(timeout)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def journal_problem():
+    """Why the journal can't be kept durably here, or None when ESTIMATE_JOURNAL_DIR will do."""
+    if os.environ.get("DYNO"):
+        return "Heroku dynos have an ephemeral filesystem, so a journal there is lost on every restart"
+    if not getattr(settings, "ESTIMATE_JOURNAL_DIR", ""):
+        return "ESTIMATE_JOURNAL_DIR is not set; point it at durable local storage"
+    return None
+
+
+def get_writer() -> EstimateWriter:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                problem = journal_problem()
+                if problem:
+                    raise ImproperlyConfigured(f"Deferred estimate writes are unavailable: {problem}.")
+                _writer = EstimateWriter(
+                    Journal(
+                        settings.ESTIMATE_JOURNAL_DIR,
+                        fsync=getattr(settings, "ESTIMATE_JOURNAL_FSYNC", True),
+                    ),
+                    batch_ms=getattr(settings, "ESTIMATE_WRITER_BATCH_MS", 200),
+                    batch_size=getattr(settings, "ESTIMATE_WRITER_BATCH_SIZE", 100),
+                )
+                atexit.register(_writer.stop)
+    return _writer
+
+
+def current_writer():
+    """The writer if this process started one, else None (for metrics)."""
+    return _writer